@@ -0,0 +1,254 @@
+"""
+Collation of two recensions of the same work, e.g. zukasaptati_o (textus
+ornatior) and zukasaptati_s (textus simplicior), into a variant apparatus.
+
+Both texts are tokenized as for the tokenized corpus export, and their whole
+token streams are aligned by patience diff. After the common leading and
+trailing tokens are matched, tokens that occur exactly once in each text are
+candidate anchors (or, where there are none, short token sequences that do),
+and the longest run of them in the same order in both is aligned. The
+stretches between anchors are then aligned recursively the same way down to
+single tokens. Only small leftover stretches go to difflib, and larger ones
+without anchors are reported as one variant, so long works take time close
+to linear rather than quadratic. Sections are paired afterwards from the
+aligned tokens: two sections are parallel if enough of the first's tokens
+align into the second. The stretches between aligned tokens make up the
+apparatus. Alignments are stored as JSON per pair and data version, and all
+recension pairs are aligned across a process pool at prebuild time.
+
+Usage: python alignment.py [--workers N]
+"""
+import bisect
+import difflib
+import json
+import logging
+import re
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from artifacts import FileLock, atomic_write
+from tokenized_corpus import read_sections
+
+ANCHOR_NGRAMS = (1, 2, 4, 8)  # anchor lengths tried in turn where no single token is unique
+MAX_DIFFLIB_CELLS = 250_000  # larger unanchored stretches are reported as one variant
+MIN_SECTION_SHARE = 0.05  # of a section's tokens that must align for its sections to be paired
+# zukasaptati_o and zukasaptati_s: a shared name and a short recension siglum
+RECENSION_NAME = re.compile(r"^(.+)_([A-Za-z]{1,2})$")
+
+
+def _anchors(a: Sequence[int], b: Sequence[int], a_lo, a_hi, b_lo, b_hi) -> List[Tuple[int, int]]:
+    """
+    Tokens unique to both windows, or failing that the first tokens of n-grams
+    unique to both, reduced to their longest common ordering (patience
+    sorting, O(k log k)).
+    """
+    for n in ANCHOR_NGRAMS:
+        a_grams = [tuple(a[i:i + n]) for i in range(a_lo, a_hi - n + 1)]
+        b_grams = [tuple(b[j:j + n]) for j in range(b_lo, b_hi - n + 1)]
+        a_counts, b_counts = Counter(a_grams), Counter(b_grams)
+        b_positions = {gram: b_lo + k for k, gram in enumerate(b_grams) if b_counts[gram] == 1}
+        pairs = [
+            (a_lo + k, b_positions[gram]) for k, gram in enumerate(a_grams)
+            if a_counts[gram] == 1 and gram in b_positions
+        ]
+        if pairs:
+            break
+    else:
+        return []
+
+    tails, tail_index, previous = [], [], [None] * len(pairs)
+    for k, (_, j) in enumerate(pairs):
+        pile = bisect.bisect_left(tails, j)
+        previous[k] = tail_index[pile - 1] if pile else None
+        if pile == len(tails):
+            tails.append(j)
+            tail_index.append(k)
+        else:
+            tails[pile] = j
+            tail_index[pile] = k
+    chain, k = [], tail_index[-1] if tail_index else None
+    while k is not None:
+        chain.append(pairs[k])
+        k = previous[k]
+    return chain[::-1]
+
+
+def align_tokens(a: Sequence[int], b: Sequence[int]) -> List[Tuple[int, int]]:
+    """
+    :return: the aligned (i, j) token pairs, increasing in both i and j
+    """
+    matches = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        a_lo, a_hi, b_lo, b_hi = stack.pop()
+        while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+            matches.append((a_lo, b_lo))
+            a_lo, b_lo = a_lo + 1, b_lo + 1
+        while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+            a_hi, b_hi = a_hi - 1, b_hi - 1
+            matches.append((a_hi, b_hi))
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+        anchors = _anchors(a, b, a_lo, a_hi, b_lo, b_hi)
+        if anchors:
+            matches.extend(anchors)
+            bounds = [(a_lo - 1, b_lo - 1), *anchors, (a_hi, b_hi)]
+            for (i0, j0), (i1, j1) in zip(bounds, bounds[1:]):
+                if i1 - i0 > 1 and j1 - j0 > 1:
+                    stack.append((i0 + 1, i1, j0 + 1, j1))
+        elif (a_hi - a_lo) * (b_hi - b_lo) <= MAX_DIFFLIB_CELLS:
+            matcher = difflib.SequenceMatcher(None, a[a_lo:a_hi], b[b_lo:b_hi], autojunk=False)
+            for i, j, size in matcher.get_matching_blocks():
+                matches.extend((a_lo + i + k, b_lo + j + k) for k in range(size))
+    return sorted(matches)
+
+
+def _variants(matches: List[Tuple[int, int]], a_len, b_len) -> Iterator[Tuple[int, int, int, int]]:
+    """
+    Yields the (a_start, a_end, b_start, b_end) token ranges between aligned runs.
+    """
+    i0 = j0 = 0
+    for i, j in [*matches, (a_len, b_len)]:
+        if i > i0 or j > j0:
+            yield i0, i, j0, j
+        i0, j0 = i + 1, j + 1
+
+
+def collate(a_sections: List[Tuple[str, List[str]]], b_sections: List[Tuple[str, List[str]]]) -> Dict:
+    """
+    :param a_sections: [(section name, tokens)] of each text, as from tokenized_corpus.read_sections
+    :return: {'stats', 'sections': section concordance, 'apparatus': [variant]}
+    """
+    a = [token for _, tokens in a_sections for token in tokens]
+    b = [token for _, tokens in b_sections for token in tokens]
+    ids = defaultdict(lambda: len(ids))
+    matches = align_tokens([ids[token] for token in a], [ids[token] for token in b])
+
+    def starts(sections):
+        offsets = [0]
+        for _, tokens in sections:
+            offsets.append(offsets[-1] + len(tokens))
+        return offsets[:-1]
+
+    a_starts, b_starts = starts(a_sections), starts(b_sections)
+    section_of = lambda section_starts, i: bisect.bisect_right(section_starts, i) - 1
+
+    shared = Counter((section_of(a_starts, i), section_of(b_starts, j)) for i, j in matches)
+    sections = []
+    for k, (name, tokens) in enumerate(a_sections):
+        paired = [
+            {'section': b_sections[m][0], 'aligned_tokens': count}
+            for (n, m), count in sorted(shared.items()) if n == k and count >= MIN_SECTION_SHARE * len(tokens)
+        ]
+        sections.append({'section': name, 'tokens': len(tokens), 'parallels': paired})
+
+    def reading(tokens, section_starts, section_list, start, end):
+        return {
+            'section': section_list[section_of(section_starts, min(start, len(tokens) - 1))][0] if tokens else '',
+            'start': start,
+            'end': end,
+            'text': ' '.join(tokens[start:end]),
+        }
+
+    apparatus = []
+    for a_start, a_end, b_start, b_end in _variants(matches, len(a), len(b)):
+        kind = 'variant' if a_end > a_start and b_end > b_start else 'omitted' if a_end > a_start else 'added'
+        apparatus.append({
+            'type': kind,
+            'a': reading(a, a_starts, a_sections, a_start, a_end),
+            'b': reading(b, b_starts, b_sections, b_start, b_end),
+        })
+
+    return {
+        'stats': {
+            'tokens_a': len(a),
+            'tokens_b': len(b),
+            'aligned_tokens': len(matches),
+            'agreement': round(2 * len(matches) / (len(a) + len(b)), 4) if a or b else 1.0,
+            'variants': len(apparatus),
+        },
+        'sections': sections,
+        'apparatus': apparatus,
+    }
+
+
+def alignment_path(output_dir: Path, text_a, text_b) -> Path:
+    return output_dir / f"{text_a}--{text_b}.json"
+
+
+def align_pair(txt_path: Path, text_a, text_b, output_path: Path) -> Dict:
+    """
+    Collates two texts and stores the result. Picklable, for process pools.
+    """
+    txt_path = Path(txt_path)
+    collation = collate(read_sections(txt_path / f"{text_a}.txt"), read_sections(txt_path / f"{text_b}.txt"))
+    collation = {'a': text_a, 'b': text_b, **collation}
+    with atomic_write(output_path, 'w', encoding='utf-8') as f:
+        json.dump(collation, f, ensure_ascii=False)
+    stats = collation['stats']
+    logging.info(f"Collated {text_a} with {text_b}: agreement {stats['agreement']}, {stats['variants']} variants")
+    return collation
+
+
+def ensure_alignment(output_dir: Path, txt_path: Path, text_a, text_b) -> Path:
+    """
+    Collates two texts unless their collation is stored; only one process makes each.
+    :return: path of the stored collation
+    """
+    path = alignment_path(output_dir, text_a, text_b)
+    if not path.is_file():
+        output_dir.mkdir(parents=True, exist_ok=True)
+        with FileLock(path.with_suffix('.lock')):
+            if not path.is_file():
+                align_pair(txt_path, text_a, text_b, path)
+    return path
+
+
+def find_recension_pairs(txt_path: Path) -> List[Tuple[str, str]]:
+    """
+    :return: every pair of texts whose names differ only in a recension siglum, e.g. ('zukasaptati_o', 'zukasaptati_s')
+    """
+    groups = defaultdict(list)
+    for file_path in sorted(txt_path.glob('*.txt')):
+        if match := RECENSION_NAME.match(file_path.stem):
+            groups[match.group(1)].append(file_path.stem)
+    return [pair for names in groups.values() for pair in combinations(names, 2)]
+
+
+def align_all_recensions(output_dir: Path, txt_path: Path, workers=None) -> int:
+    """
+    Collates every recension pair that isn't stored yet, in parallel.
+    :return: number of pairs collated
+    """
+    pairs = [pair for pair in find_recension_pairs(txt_path) if not alignment_path(output_dir, *pair).is_file()]
+    if not pairs:
+        return 0
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(
+            align_pair,
+            [txt_path] * len(pairs),
+            [a for a, _ in pairs],
+            [b for _, b in pairs],
+            [alignment_path(output_dir, *pair) for pair in pairs],
+        ))
+    return len(pairs)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from config import ALIGNMENT_PATH, FILE_TYPE_PATHS
+    from utils import find_data_version
+
+    parser = argparse.ArgumentParser(description="Collate all recension pairs for the current data version.")
+    parser.add_argument('--workers', type=int, default=None, help="collation processes (default: CPU count)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    data_version = find_data_version()
+    count = align_all_recensions(ALIGNMENT_PATH / data_version, FILE_TYPE_PATHS['txt'], args.workers)
+    logging.info(f"Collated {count} recension pairs for {data_version}")
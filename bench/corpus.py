@@ -0,0 +1,317 @@
+"""
+Generates a synthetic corpus in the layout of the data directory (what
+DATA_PATH points to), for benchmarks and load tests at production scale. Every
+text gets a metadata.json record, markdown and HTML metadata, a project
+edition .txt and TEI .xml, rich HTML with its JSON context and TOC, plain HTML
+and an original submission, all cut from the same generated words, so search,
+concordance, passage and bundle routes have real work to do.
+
+Text sizes are spread log-uniformly between --min-kb and --max-kb of .txt.
+Output is deterministic for a given --seed.
+
+Usage: python -m bench.corpus OUTPUT_DIR [--texts N] [--min-kb KB] [--max-kb KB] [--seed S]
+"""
+import argparse
+import html
+import json
+import logging
+import math
+import random
+import shutil
+from itertools import accumulate
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+DATA_VERSION = '2000-01-01'
+BUNDLE_VERSION = '0.0.0-bench'
+
+ONSETS = ['', 'k', 'kh', 'g', 'c', 'j', 'ṭ', 'ḍ', 't', 'th', 'd', 'dh', 'n', 'p', 'bh', 'm', 'y', 'r', 'l', 'v',
+          'ś', 'ṣ', 's', 'h', 'kṣ', 'tr', 'pr', 'br', 'sv', 'dv']
+VOWELS = ['a', 'a', 'a', 'ā', 'ā', 'i', 'ī', 'u', 'ū', 'ṛ', 'e', 'ai', 'o', 'au']
+CODAS = ['', '', '', '', 'ṃ', 'ḥ', 'n', 'd', 't', 's', 'm']
+GENRES = ['Kāvya', 'Kathā', 'Nāṭaka', 'Śāstra', 'Purāṇa', 'Stotra', 'Darśana', 'Vyākaraṇa']
+ORIGINAL_SUFFIXES = ['.txt', '.doc', '.xml']
+
+VOCABULARY_SIZE = 20_000
+LINES_PER_PAGE = 20
+LINES_PER_PARAGRAPH = 5
+VERSE_EVERY = 4  # one paragraph in this many is a verse
+
+
+def make_vocabulary(rng: random.Random, size=VOCABULARY_SIZE) -> Tuple[List[str], List[float]]:
+    """
+    :return: (distinct words, cumulative Zipf weights for drawing them)
+    """
+    words = set()
+    while len(words) < size:
+        syllables = rng.choice((1, 2, 2, 3, 3, 3, 4, 5))
+        onsets = [rng.choice(ONSETS)] + [rng.choice(ONSETS[1:]) for _ in range(syllables - 1)]  # no vowel hiatus
+        word = ''.join(onset + rng.choice(VOWELS) for onset in onsets) + rng.choice(CODAS)
+        words.add(word)
+    words = sorted(words)
+    rng.shuffle(words)
+    return words, list(accumulate(1 / rank for rank in range(1, size + 1)))
+
+
+def make_line(rng, words, cum_weights, verse=False) -> str:
+    line = ' '.join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(6, 11)))
+    if verse:
+        return line
+    return line + (' |' if rng.random() < 0.4 else '')
+
+
+def make_text(rng, words, cum_weights, target_bytes) -> List[Dict]:
+    """
+    :return: sections [{'name', 'paragraphs': [{'page', 'line', 'verse', 'lines'}]}] of about target_bytes of text
+    """
+    target_bytes = max(target_bytes, 1)
+    section_count = max(1, round(math.sqrt(target_bytes / 2048)))
+    sections = [{'name': str(k + 1), 'paragraphs': []} for k in range(section_count)]
+    size, line_number, paragraph_number, verse_number = 0, 0, 0, 0
+    while size < target_bytes:
+        section = sections[size * section_count // target_bytes]
+        verse = paragraph_number % VERSE_EVERY == VERSE_EVERY - 1
+        if verse:
+            verse_number += 1
+            lines = [make_line(rng, words, cum_weights, verse=True) + ' |',
+                     make_line(rng, words, cum_weights, verse=True) + f' || {verse_number} ||']
+        else:
+            lines = [make_line(rng, words, cum_weights) for _ in range(rng.randint(2, LINES_PER_PARAGRAPH))]
+        page, line = divmod(line_number, LINES_PER_PAGE)
+        section['paragraphs'].append({'page': page + 1, 'line': line + 1, 'verse': verse, 'lines': lines})
+        line_number += len(lines)
+        paragraph_number += 1
+        size += sum(len(text.encode('utf-8')) + 1 for text in lines) + 16
+    return [section for section in sections if section['paragraphs']]
+
+
+def render_txt(sections) -> str:
+    out, page = [], 0
+    for section in sections:
+        out.append(f"{{{section['name']}}}\n")
+        for paragraph in section['paragraphs']:
+            if paragraph['page'] != page:
+                page = paragraph['page']
+                out.append(f"<{page}>\n")
+            out.append(f"[{paragraph['page']},{paragraph['line']}]\n")
+            indent = '\t' if paragraph['verse'] else ''
+            out.append(''.join(f"{indent}{line}\n" for line in paragraph['lines']))
+    return '\n'.join(out)
+
+
+def render_xml(sections, title) -> str:
+    out = [
+        "<?xml version='1.0' encoding='UTF-8'?>",
+        '<TEI xmlns="http://www.tei-c.org/ns/1.0">',
+        '  <teiHeader>',
+        '    <fileDesc>',
+        f'      <titleStmt><title type="main">{html.escape(title)}</title></titleStmt>',
+        '      <publicationStmt><p>Synthetic benchmark text.</p></publicationStmt>',
+        '      <sourceDesc><p>Generated by bench/corpus.py.</p></sourceDesc>',
+        '    </fileDesc>',
+        '  </teiHeader>',
+        '  <text>',
+        '    <body>',
+    ]
+    page = 0
+    for section in sections:
+        out.append(f'      <div n="{section["name"]}">')
+        for paragraph in section['paragraphs']:
+            p, l = paragraph['page'], paragraph['line']
+            pb = f'<pb n="{p}"/>' if p != page else ''
+            page = p
+            if paragraph['verse']:
+                out.append(f'        {pb}<lg xml:id="p{p}_l{l}" n="{p},{l}">')
+                out.extend(f'          <l>{line}<lb n="{l + k + 1}"/></l>' for k, line in enumerate(paragraph['lines']))
+                out.append('        </lg>')
+            else:
+                body = ''.join(f'{line} <lb n="{l + k + 1}"/>' for k, line in enumerate(paragraph['lines']))
+                out.append(f'        {pb}<p xml:id="p{p}_l{l}" n="{p},{l}">{body}</p>')
+        out.append('      </div>')
+    out.extend(['    </body>', '  </text>', '</TEI>', ''])
+    return '\n'.join(out)
+
+
+def render_rich_html(sections) -> str:
+    out = ['<div id="content" class="hide-location-markers">']
+    for section in sections:
+        out.append(f'<h1 id="{section["name"]}">§ {section["name"]}</h1>')
+        for paragraph in section['paragraphs']:
+            p, l = paragraph['page'], paragraph['line']
+            out.append(f'<h2 class="location-marker" id="{p},{l}">p.{p}, l.{l}</h2>')
+            labelled = [
+                f'<span class="lb-label rich-text" data-line="{l + k}">(p.{p}, l.{l + k})</span>{line} '
+                for k, line in enumerate(paragraph['lines'])
+            ]
+            if paragraph['verse']:
+                style = 'padding-left: 2em; margin-bottom: 1.3em;'
+                out.append(f'<div class="lg rich-text" style="{style}">'
+                           + ''.join(f'<span>{span}</span>' for span in labelled) + '</div>')
+                out.append(f'<div class="lg plain-text" style="{style}">'
+                           + ''.join(f'<span>{line}</span>' for line in paragraph['lines']) + '</div>')
+            else:
+                out.append('<p class="rich-text">' + '<br class="lb-br rich-text"/>'.join(labelled) + '</p>')
+                out.append('<p class="plain-text">' + ' '.join(paragraph['lines']) + '</p>')
+    out.append('</div>')
+    return ''.join(out)
+
+
+def render_plain_html(sections, filename_base) -> str:
+    out = [
+        '<html>', '  <head>', '    <meta charset="utf-8"/>', f'    <title>{filename_base}</title>',
+        '  </head>', '  <body>', '    <div id="content">',
+    ]
+    for section in sections:
+        out.append(f'      <h1 id="{section["name"]}">§ {section["name"]}</h1>')
+        for paragraph in section['paragraphs']:
+            out.append(f'      <p class="plain-text">{" ".join(paragraph["lines"])}</p>')
+    out.extend(['    </div>', '  </body>', '</html>', ''])
+    return '\n'.join(out)
+
+
+def make_record(rng, index, filename_base, title, author, genres, size_kb, original_suffix) -> Dict:
+    edition_short = f"Editor{index % 97} {1850 + index % 150}"
+    return {
+        'Title': title,
+        'Pandit Work ID': str(200000 + index),
+        'Attributed Author': author,
+        'Pandit Attributed Author ID': str(300000 + index % 211),
+        'Edition Short': edition_short,
+        'Edition': [f"Editor: {edition_short.split()[0]}", f"Title: {title}", f"Year: {edition_short.split()[1]}"],
+        'Edition PDFs': [f"[{edition_short} on Archive](https://archive.org/details/bench-{index})"],
+        'Extent': ["The edition contains a complete text of the work."],
+        'File Size (KB)': float(size_kb),
+        'Structure': f"The work has {rng.randint(1, 40)} chapters.",
+        'Work Description': "A synthetic work generated for benchmarking.",
+        'Genres': genres,
+        'Translations': [],
+        'Source Collection': "Synthetic.",
+        'HANSEL License': 'CC BY-NC-SA 4.0',
+        'Contributors': ["Benchmark Generator"],
+        'Digitization Notes': ["Generated by bench/corpus.py."],
+        'File Creation Method': "Generated.",
+        'Text Type': 'Prose with verse',
+        'Word Division Style': 'Roman-like (ity evam, not ityevam)',
+        'Original Submission Last Updated': DATA_VERSION,
+        'Text Last Updated': DATA_VERSION,
+        'Metadata Last Updated': DATA_VERSION,
+        'Filename': filename_base,
+        'Original Submission Filetype': original_suffix,
+    }
+
+
+def render_markdown(record) -> str:
+    out = []
+    for label, value in record.items():
+        body = '\n'.join(f"- {item}" for item in value) if isinstance(value, list) else str(value)
+        out.append(f"# {label}\n\n{body}\n")
+    return '\n'.join(out)
+
+
+def render_metadata_html(record) -> str:
+    out = ['<!DOCTYPE html>', '<html lang="en">', '<head>', '<meta charset="UTF-8">',
+           f"<title>metadata for {html.escape(record['Filename'])}</title>", '</head>', '<body>']
+    for label, value in record.items():
+        out.append(f"<h1>{html.escape(label)}</h1>")
+        if isinstance(value, list):
+            out.append('<ul>' + ''.join(f"<li>{html.escape(str(item))}</li>" for item in value) + '</ul>')
+        else:
+            out.append(f"<p>{html.escape(str(value))}</p>")
+    out.extend(['</body>', '</html>', ''])
+    return '\n'.join(out)
+
+
+def metadata_entries(record) -> List[Dict]:
+    entries = []
+    for label, value in record.items():
+        if isinstance(value, list):
+            items = ''.join(f"<li>{html.escape(str(item))}</li>\n" for item in value)
+            entries.append({'type': 'field', 'label': label, 'inline_text': None, 'content_html': f"<ul>\n{items}</ul>\n"})
+        else:
+            entries.append({'type': 'field', 'label': label, 'inline_text': str(value), 'content_html': ''})
+    return entries
+
+
+def generate_corpus(output_dir: Path, texts=100, min_kb=20, max_kb=400, seed=0) -> Dict[str, int]:
+    """
+    Writes a corpus of ``texts`` generated texts into ``output_dir``, replacing it.
+    :return: {'texts', 'files', 'bytes'} written
+    """
+    rng = random.Random(seed)
+    words, cum_weights = make_vocabulary(rng)
+    authors = [' '.join(rng.choice(words).capitalize() for _ in range(2)) for _ in range(max(1, texts // 5))]
+
+    shutil.rmtree(output_dir, ignore_errors=True)
+    paths = {
+        'txt': output_dir / 'texts' / 'project_editions' / 'txt',
+        'xml': output_dir / 'texts' / 'project_editions' / 'xml',
+        'html_rich': output_dir / 'texts' / 'transforms' / 'html' / 'rich',
+        'html_plain': output_dir / 'texts' / 'transforms' / 'html' / 'plain',
+        'original': output_dir / 'texts' / 'original_submissions',
+        'md': output_dir / 'metadata' / 'markdown',
+        'html': output_dir / 'metadata' / 'transforms' / 'html',
+    }
+    for path in paths.values():
+        path.mkdir(parents=True, exist_ok=True)
+
+    written = {'texts': 0, 'files': 0, 'bytes': 0}
+
+    def write(path: Path, content: str):
+        data = content.encode('utf-8')
+        path.write_bytes(data)
+        written['files'] += 1
+        written['bytes'] += len(data)
+
+    metadata = {}
+    for index in range(1, texts + 1):
+        filename_base = f"bench_{index:05d}"
+        target_bytes = int(1024 * math.exp(rng.uniform(math.log(min_kb), math.log(max_kb))))
+        title = ' '.join(rng.choice(words).capitalize() for _ in range(rng.randint(1, 3)))
+        author = rng.choice(authors)
+        genres = rng.sample(GENRES, rng.randint(1, 2))
+        original_suffix = rng.choice(ORIGINAL_SUFFIXES)
+        sections = make_text(rng, words, cum_weights, target_bytes)
+
+        txt = render_txt(sections)
+        size_kb = round(len(txt.encode('utf-8')) / 1024)
+        record = make_record(rng, index, filename_base, title, author, genres, size_kb, original_suffix)
+        metadata[filename_base] = record
+        context = {
+            'title': filename_base,
+            'toc': [{'name': section['name'], 'page': str(section['paragraphs'][0]['page']), 'id': section['name']}
+                    for section in sections],
+            'metadata_entries': metadata_entries(record),
+            'verse_only': False,
+            'includes_plain_variant': True,
+            'no_line_numbers': False,
+        }
+
+        write(paths['txt'] / f"{filename_base}.txt", txt)
+        write(paths['xml'] / f"{filename_base}.xml", render_xml(sections, title))
+        write(paths['html_rich'] / f"{filename_base}.html", render_rich_html(sections))
+        write(paths['html_rich'] / f"{filename_base}.json", json.dumps(context, ensure_ascii=False))
+        write(paths['html_plain'] / f"{filename_base}.html", render_plain_html(sections, filename_base))
+        write(paths['original'] / f"{filename_base}{original_suffix}", txt)
+        write(paths['md'] / f"{filename_base}.md", render_markdown(record))
+        write(paths['html'] / f"{filename_base}.html", render_metadata_html(record))
+        written['texts'] += 1
+
+    metadata['version'] = DATA_VERSION
+    write(output_dir / 'metadata' / 'transforms' / 'metadata.json', json.dumps(metadata, ensure_ascii=False, indent=2))
+    write(output_dir / 'VERSION', f'__data_version__ = "{DATA_VERSION}"\n__bundle_version__ = "{BUNDLE_VERSION}"\n')
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic corpus in the data directory layout.")
+    parser.add_argument('output_dir', type=Path, help="directory to write (replaced if it exists)")
+    parser.add_argument('--texts', type=int, default=100, help="number of texts (default: 100)")
+    parser.add_argument('--min-kb', type=float, default=20, help="smallest .txt size in KB (default: 20)")
+    parser.add_argument('--max-kb', type=float, default=400, help="largest .txt size in KB (default: 400)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed (default: 0)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    written = generate_corpus(args.output_dir, args.texts, args.min_kb, args.max_kb, args.seed)
+    logging.info(f"Wrote {written['texts']} texts ({written['files']} files, "
+                 f"{written['bytes'] / 1024 / 1024:.1f} MB) to {args.output_dir}")
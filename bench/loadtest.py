@@ -0,0 +1,307 @@
+"""
+HTTP load test of a local gunicorn serving a corpus made by bench/corpus.py.
+The server is started with the repository's gunicorn.conf.py on a loopback
+port, nothing leaves the machine (HTTP geolocation is turned off), and all
+caches live in a temporary directory.
+
+Each route is warmed up and then sent --requests requests from --concurrency
+client threads. Reported per route: latency percentiles (p50/p95/p99, to the
+last byte of the body), throughput, errors, and the peak memory of gunicorn's
+master and workers together while the route was under load, as RSS and as PSS
+(which counts pages shared copy-on-write by the preloaded app only once).
+Memory is read from /proc, so it is only reported on Linux. Results are
+written with bench/results.py for comparison with other commits. Run from the
+repository root:
+
+    python -m bench.loadtest --data /tmp/bench-data [--workers 4] [--worker-mode sync|async]
+        [--concurrency 8] [--requests 200] [--routes view_text,search] [--output PATH]
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+from bench.results import save_results
+
+ROUTE_NAMES = ['index', 'catalog', 'view_text', 'static_file', 'search', 'concordance', 'passage', 'download_bundle',
+               'metrics']
+SAMPLE_INTERVAL = 0.1  # seconds between memory samples
+
+
+def make_routes(data_path: Path, rng: random.Random) -> Dict[str, Callable[[], Tuple[str, str, Optional[bytes]]]]:
+    """
+    :return: route name -> function giving a (method, path, JSON body) to request next
+    """
+    from tokenized_corpus import tokenize
+
+    texts = sorted(path.stem for path in (data_path / 'texts' / 'project_editions' / 'txt').glob('*.txt'))
+    if not texts:
+        raise SystemExit(f"No texts found in {data_path}; generate a corpus with python -m bench.corpus first")
+    with open(data_path / 'texts' / 'project_editions' / 'txt' / f"{texts[0]}.txt", encoding='utf-8') as f:
+        words = sorted({token for line in f for token in tokenize(line) if len(token) > 3})[:200]
+    download_body = json.dumps({'text': 'txt', 'metadata': 'json'}).encode('utf-8')
+
+    return {
+        'index': lambda: ('GET', '/', None),
+        'catalog': lambda: ('GET', '/api/catalog?' + urlencode({'limit': 20, 'offset': rng.randrange(len(texts))}),
+                            None),
+        'view_text': lambda: ('GET', f"/texts/transforms/html/rich/{rng.choice(texts)}.html", None),
+        'static_file': lambda: ('GET', f"/static/data/texts/project_editions/txt/{rng.choice(texts)}.txt", None),
+        'search': lambda: ('GET', '/search?' + urlencode({'q': rng.choice(words)}), None),
+        'concordance': lambda: ('GET', '/api/concordance?' + urlencode({'q': rng.choice(words)}), None),
+        'passage': lambda: ('GET', f"/api/passage/{rng.choice(texts)}/{quote('1,1')}", None),
+        'download_bundle': lambda: ('POST', '/download', download_body),
+        'metrics': lambda: ('GET', '/metrics', None),
+    }
+
+
+def process_tree(root_pid) -> List[int]:
+    """
+    :return: ``root_pid`` and the pids of its children (gunicorn's workers)
+    """
+    pids = [root_pid]
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == root_pid:
+            pids.append(int(entry))
+    return pids
+
+
+def memory_kb(pid) -> Tuple[int, int]:
+    """
+    :return: (RSS, PSS) of a process in KB, or zeros if it's gone
+    """
+    rss = pss = 0
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith('Rss:'):
+                    rss = int(line.split()[1])
+                elif line.startswith('Pss:'):
+                    pss = int(line.split()[1])
+    except OSError:
+        pass
+    return rss, pss
+
+
+class MemorySampler:
+    """
+    Samples the summed RSS and PSS of a process tree in the background, keeping the peaks.
+    """
+
+    def __init__(self, root_pid):
+        self.root_pid = root_pid
+        self.peak_rss_kb = self.peak_pss_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='memory-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            samples = [memory_kb(pid) for pid in process_tree(self.root_pid)]
+            self.peak_rss_kb = max(self.peak_rss_kb, sum(rss for rss, _ in samples))
+            self.peak_pss_kb = max(self.peak_pss_kb, sum(pss for _, pss in samples))
+            self._stop.wait(SAMPLE_INTERVAL)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def send(connection: http.client.HTTPConnection, method, path, body) -> Tuple[int, float]:
+    """
+    :return: (status, seconds until the whole body was read)
+    """
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+    start = time.perf_counter()
+    try:
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        status = response.status
+    except (OSError, http.client.HTTPException):
+        connection.close()  # reconnects on the next request
+        status = 0
+    return status, time.perf_counter() - start
+
+
+def load_route(port, next_request: Callable, requests, concurrency) -> Tuple[List[float], int, float]:
+    """
+    Sends ``requests`` requests from ``concurrency`` threads, each on its own connection.
+    :return: (latencies in seconds, number of failed requests, wall time)
+    """
+    latencies, errors = [], 0
+    remaining = requests
+    lock = threading.Lock()
+
+    def client():
+        nonlocal remaining, errors
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        try:
+            while True:
+                with lock:
+                    if remaining == 0:
+                        return
+                    remaining -= 1
+                    method, path, body = next_request()
+                status, elapsed = send(connection, method, path, body)
+                with lock:
+                    latencies.append(elapsed)
+                    errors += not 200 <= status < 400
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def summarize(latencies: List[float], errors, wall_time, sampler: MemorySampler) -> Dict:
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': len(latencies) / wall_time,
+        'p50_ms': cuts[49] * 1000,
+        'p95_ms': cuts[94] * 1000,
+        'p99_ms': cuts[98] * 1000,
+        'max_ms': max(latencies) * 1000,
+        'rss_peak_mb': sampler.peak_rss_kb / 1024,
+        'pss_peak_mb': sampler.peak_pss_kb / 1024,
+    }
+
+
+def start_server(data_path: Path, cache_path: Path, port, workers, worker_mode, log_path: Path) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        'DATA_PATH': str(data_path),
+        'CACHE_PATH': str(cache_path),
+        'DOWNLOAD_LOG_DB_PATH': str(cache_path / 'downloads.sqlite3'),
+        'WORKER_MODE': worker_mode,
+        'PREBUILD_BUNDLES': '0',  # the warm-up builds what the routes need, without competing for CPU later
+        'GEOIP_HTTP_FALLBACK': '0',
+    }
+    env.pop('GEOIP_DB_PATH', None)
+    with open(log_path, 'wb') as log:
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--workers', str(workers),
+             '--bind', f"127.0.0.1:{port}", 'flask_app:app'],
+            env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"gunicorn exited with status {server.returncode}; see {log_path}")
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        if send(connection, 'GET', '/robots.txt', None)[0] == 200:
+            connection.close()
+            return server
+        connection.close()
+        time.sleep(0.2)
+    stop_server(server)
+    raise SystemExit(f"gunicorn did not answer on port {port} within 120 seconds; see {log_path}")
+
+
+def stop_server(server: subprocess.Popen):
+    if server.poll() is None:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test a local gunicorn serving a generated corpus.")
+    parser.add_argument('--data', type=Path, required=True, help="corpus directory, from python -m bench.corpus")
+    parser.add_argument('--workers', type=int, default=4, help="gunicorn workers (default: 4, as in production)")
+    parser.add_argument('--worker-mode', choices=['sync', 'async'], default='sync', help="WORKER_MODE (default: sync)")
+    parser.add_argument('--concurrency', type=int, default=8, help="client threads (default: 8)")
+    parser.add_argument('--requests', type=int, default=200, help="requests per route (default: 200)")
+    parser.add_argument('--warmup', type=int, default=10, help="unmeasured requests per route first (default: 10)")
+    parser.add_argument('--routes', help=f"comma-separated subset of: {', '.join(ROUTE_NAMES)}")
+    parser.add_argument('--port', type=int, default=5099, help="loopback port for gunicorn (default: 5099)")
+    parser.add_argument('--seed', type=int, default=0, help="seed for picking texts and query words (default: 0)")
+    parser.add_argument('--output', type=Path, help="results file (default: bench/results/loadtest-<commit>.json)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    route_names = args.routes.split(',') if args.routes else ROUTE_NAMES
+    unknown = set(route_names) - set(ROUTE_NAMES)
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(sorted(unknown))}")
+    data_path = args.data.resolve()
+    routes = make_routes(data_path, random.Random(args.seed))
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='hansel-loadtest-') as tmp_dir:
+        cache_path = Path(tmp_dir) / 'cache'
+        log_path = Path(tmp_dir) / 'gunicorn.log'
+        server = start_server(data_path, cache_path, args.port, args.workers, args.worker_mode, log_path)
+        try:
+            for name in route_names:
+                warmup = http.client.HTTPConnection('127.0.0.1', args.port, timeout=300)
+                for _ in range(args.warmup):
+                    send(warmup, *routes[name]())
+                warmup.close()
+                with MemorySampler(server.pid) as sampler:
+                    latencies, errors, wall_time = load_route(args.port, routes[name], args.requests, args.concurrency)
+                results[name] = summarize(latencies, errors, wall_time, sampler)
+                result = results[name]
+                logging.info(
+                    f"{name}: p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, "
+                    f"p99 {result['p99_ms']:.1f} ms, {result['throughput_rps']:.1f} req/s, {errors} errors, "
+                    f"peak RSS {result['rss_peak_mb']:.0f} MB"
+                )
+        finally:
+            stop_server(server)
+
+        from manifest import load_manifest
+        manifest = load_manifest(data_path, data_path / '.manifest.json', cache_path / 'manifest.json')
+
+    print(f"{'route':<16} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'errors':>7} {'RSS MB':>8} {'PSS MB':>8}")
+    for name, result in results.items():
+        print(f"{name:<16} {result['p50_ms']:9.1f} {result['p95_ms']:9.1f} {result['p99_ms']:9.1f} "
+              f"{result['throughput_rps']:9.1f} {result['errors']:7d} {result['rss_peak_mb']:8.0f} "
+              f"{result['pss_peak_mb']:8.0f}")
+    parameters = {
+        'workers': args.workers,
+        'worker_mode': args.worker_mode,
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'warmup': args.warmup,
+        'seed': args.seed,
+        'corpus_files': len(manifest.entries),
+        'corpus_fingerprint': manifest.fingerprint(),
+    }
+    print(f"Results written to {save_results('loadtest', results, parameters, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Microbenchmarks of the corpus loading and request handling hot spots, run
+in-process against a corpus made by bench/corpus.py:
+
+    process_metadata      metadata.json records to the catalog rows
+    calculate_all_sizes   file group and corpus sizes from the manifest
+    collation_key         sorting all titles in Sanskrit collation order
+    view_text             rendering the largest text's viewer page, uncached and cached
+    download_bundle       building a custom (txt + json) and the full bundle, and serving a cached one
+
+Each is repeated and timed; results are written with bench/results.py for
+comparison with other commits. Run from the repository root:
+
+    python -m bench.microbench --data /tmp/bench-data [--repeat 5] [--output PATH]
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from bench.results import save_results
+
+
+def measure(function: Callable, repeat, setup: Optional[Callable] = None) -> Dict:
+    """
+    Calls ``function`` ``repeat`` times, calling ``setup`` untimed before each.
+    :return: {'runs', 'min_s', 'median_s', 'max_s'}
+    """
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {'runs': repeat, 'min_s': min(times), 'median_s': statistics.median(times), 'max_s': max(times)}
+
+
+def run_benchmarks(repeat) -> Tuple[Dict[str, Dict], Dict]:
+    """
+    :return: (results, parameters) for save_results
+    """
+    # Imported here, after main() has pointed DATA_PATH and CACHE_PATH at the benchmark corpus
+    from bundles import get_bundle_names
+    from collation import collation_key
+    from config import DATA_PATH, FILE_TYPE_PATHS, MANIFEST_FALLBACK_PATH, MANIFEST_PATH, METADATA_PATH
+    from manifest import load_manifest
+    from utils import calculate_all_sizes, load_metadata, process_metadata
+    import flask_app
+
+    results = {}
+    raw_metadata = load_metadata(METADATA_PATH)
+    manifest = load_manifest(DATA_PATH, MANIFEST_PATH, MANIFEST_FALLBACK_PATH)
+    titles = [record['Title'] for key, record in raw_metadata.items() if key != 'version']
+
+    results['process_metadata'] = measure(lambda: process_metadata(raw_metadata), repeat)
+    results['calculate_all_sizes'] = measure(lambda: calculate_all_sizes(FILE_TYPE_PATHS, DATA_PATH, manifest), repeat)
+    results['collation_key'] = measure(lambda: sorted(titles, key=collation_key), repeat)
+
+    client = flask_app.app.test_client()
+
+    def get(url):
+        response = client.get(url)
+        assert response.status_code == 200, f"GET {url}: {response.status_code}"
+        response.get_data()
+
+    largest = max(FILE_TYPE_PATHS['html_rich'].glob('*.html'), key=lambda path: path.stat().st_size)
+    view_url = f"/texts/transforms/html/rich/{largest.name}"
+    clear_pages = lambda: flask_app.page_cache.discard(lambda key: True)
+    results['view_text'] = measure(lambda: get(view_url), repeat, setup=clear_pages)
+    results['view_text (cached)'] = measure(lambda: get(view_url), repeat)
+
+    def download(text_format, meta_format):
+        response = client.post('/download', json={'text': text_format, 'metadata': meta_format})
+        assert response.status_code == 200, f"download {text_format}/{meta_format}: {response.status_code}"
+        response.get_data()
+        response.close()  # publishes the cache entry and releases its build lock
+
+    def clear_bundle(text_format, meta_format):
+        data_version = flask_app.corpus.snapshot.data_version
+        key = flask_app.app.cache.key(get_bundle_names(text_format, meta_format, data_version)[0], data_version)
+        return lambda: flask_app.app.cache.path_for(key).unlink(missing_ok=True)
+
+    for text_format, meta_format in [('txt', 'json'), ('all', 'all')]:
+        results[f"download_bundle ({text_format}, {meta_format})"] = measure(
+            lambda: download(text_format, meta_format), repeat, setup=clear_bundle(text_format, meta_format)
+        )
+    results['download_bundle (cached)'] = measure(lambda: download('txt', 'json'), repeat)
+
+    parameters = {
+        'repeat': repeat,
+        'corpus_files': len(manifest.entries),
+        'corpus_fingerprint': manifest.fingerprint(),
+    }
+    return results, parameters
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the corpus and request hot spots against a generated corpus.")
+    parser.add_argument('--data', type=Path, required=True, help="corpus directory, from python -m bench.corpus")
+    parser.add_argument('--cache', type=Path, help="cache directory (default: a temporary one)")
+    parser.add_argument('--repeat', type=int, default=5, help="runs of each benchmark (default: 5)")
+    parser.add_argument('--output', type=Path, help="results file (default: bench/results/microbench-<commit>.json)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    with tempfile.TemporaryDirectory(prefix='hansel-bench-') as tmp_dir:
+        cache_path = args.cache or Path(tmp_dir)
+        os.environ.update({
+            'DATA_PATH': str(args.data.resolve()),
+            'CACHE_PATH': str(cache_path.resolve()),
+            'DOWNLOAD_LOG_DB_PATH': str(cache_path.resolve() / 'downloads.sqlite3'),
+            'GEOIP_HTTP_FALLBACK': '0',
+        })
+        results, parameters = run_benchmarks(args.repeat)
+
+    for name, timing in results.items():
+        print(f"{name:<36} median {timing['median_s'] * 1000:10.2f} ms   min {timing['min_s'] * 1000:10.2f} ms")
+    print(f"Results written to {save_results('microbench', results, parameters, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
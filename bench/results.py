@@ -0,0 +1,127 @@
+"""
+Benchmark results, stored as one JSON file per run and keyed by the git commit
+they were measured at, so runs on different commits can be compared:
+
+    python -m bench.results OLD.json NEW.json [--threshold 0.1]
+
+prints every measurement of both runs side by side and exits with status 1 if
+any got worse by more than the threshold (10% by default).
+"""
+import json
+import math
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+RESULTS_PATH = Path(__file__).parent / 'results'
+
+# Measurements where a larger value is an improvement; everything else is a time, size or error count
+HIGHER_IS_BETTER = {'throughput_rps'}
+# Reported but not counted as regressions (extremes are too noisy to judge a single run by)
+INFORMATIONAL = {'runs', 'requests', 'min_s', 'max_s', 'max_ms'}
+
+
+def git_commit() -> Dict:
+    """
+    :return: {'commit', 'subject', 'dirty'} of the working tree, or Nones outside a git checkout
+    """
+    def git(*args) -> Optional[str]:
+        try:
+            return subprocess.run(['git', *args], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    status = git('status', '--porcelain', '--untracked-files=no')
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'subject': git('log', '-1', '--format=%s'),
+        'dirty': bool(status) if status is not None else None,
+    }
+
+
+def save_results(kind, results: Dict[str, Dict], parameters: Dict, output_path: Optional[Path] = None) -> Path:
+    """
+    :param results: measurement name -> {metric: value}
+    :param parameters: what was measured and how (corpus, concurrency, ...), for judging comparability
+    :return: where the results were written (bench/results/<kind>-<commit>.json by default)
+    """
+    revision = git_commit()
+    if output_path is None:
+        suffix = '-dirty' if revision['dirty'] else ''
+        output_path = RESULTS_PATH / f"{kind}-{(revision['commit'] or 'unknown')[:12]}{suffix}.json"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'kind': kind,
+            **revision,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'machine': f"{platform.machine()}, {platform.system()}",
+            'parameters': parameters,
+            'results': results,
+        }, f, ensure_ascii=False, indent=2)
+    return output_path
+
+
+def load_results(path: Path) -> Dict:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(old: Dict, new: Dict, threshold=0.1) -> int:
+    """
+    Prints the measurements of two runs side by side.
+    :return: number of measurements that got worse by more than ``threshold``
+    """
+    if old['kind'] != new['kind']:
+        raise ValueError(f"Can't compare {old['kind']} results with {new['kind']} results")
+    if old['parameters'] != new['parameters']:
+        print("Warning: the runs were made with different parameters:")
+        for key in sorted(set(old['parameters']) | set(new['parameters'])):
+            if old['parameters'].get(key) != new['parameters'].get(key):
+                print(f"  {key}: {old['parameters'].get(key)!r} -> {new['parameters'].get(key)!r}")
+
+    print(f"old: {(old['commit'] or 'unknown')[:12]}{' (dirty)' if old['dirty'] else ''} {old['subject'] or ''}")
+    print(f"new: {(new['commit'] or 'unknown')[:12]}{' (dirty)' if new['dirty'] else ''} {new['subject'] or ''}")
+    regressions = 0
+    for name in [*old['results'], *(n for n in new['results'] if n not in old['results'])]:
+        print(f"\n{name}")
+        old_metrics, new_metrics = old['results'].get(name, {}), new['results'].get(name, {})
+        for metric in [*old_metrics, *(m for m in new_metrics if m not in old_metrics)]:
+            before, after = old_metrics.get(metric), new_metrics.get(metric)
+            if before is None or after is None:
+                print(f"  {metric:<16} {_format(before):>12} {_format(after):>12}")
+                continue
+            if before:
+                change = (after - before) / abs(before)
+            else:
+                change = math.copysign(math.inf, after - before) if after != before else 0.0
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            flag = ''
+            if metric not in INFORMATIONAL and worse > threshold:
+                flag = '  REGRESSION'
+                regressions += 1
+            print(f"  {metric:<16} {_format(before):>12} {_format(after):>12} {change:+8.1%}{flag}")
+    print(f"\n{regressions} regression(s) beyond {threshold:.0%}")
+    return regressions
+
+
+def _format(value) -> str:
+    if value is None:
+        return '-'
+    return f"{value:.4g}" if isinstance(value, float) else str(value)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument('old', type=Path)
+    parser.add_argument('new', type=Path)
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    sys.exit(1 if compare(load_results(args.old), load_results(args.new), args.threshold) else 0)
@@ -0,0 +1,142 @@
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple
+
+from artifacts import FileLock, atomic_write
+from metrics import REGISTRY
+
+
+class BundleCache:
+    """
+    Content-addressed on-disk cache of built zip bundles, shared by all workers.
+    Also holds other generated files (e.g. transliterated texts) under a
+    different root and ``suffix``.
+
+    Entries are keyed by bundle name and data version and published with an
+    atomic rename. A per-entry lock file makes sure only one worker stores a
+    given bundle; the lock is held while that bundle streams to its first
+    client, so others asking meanwhile stream an uncached copy of their own
+    rather than wait on that client's pace. The cache is capped at
+    ``max_bytes``; hits refresh an entry's mtime and the least recently used
+    entries are evicted first. Hits, misses, evictions and bytes are counted
+    in the metrics under the name of the cache's root directory.
+    """
+
+    def __init__(self, root: Path, max_bytes: int, suffix='.zip'):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.name = self.root.name  # metrics label
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def key(self, name, data_version) -> str:
+        return hashlib.sha256(f"{data_version}\0{name}".encode('utf-8')).hexdigest()
+
+    def path_for(self, key) -> Path:
+        return self.root / f"{key}{self.suffix}"
+
+    def get(self, key) -> Optional[Path]:
+        path = self.path_for(key)
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            return None
+        return path
+
+    def lock(self, key) -> FileLock:
+        return FileLock(self.root / 'locks' / f"{key}.lock")
+
+    def get_or_lock(self, key) -> Tuple[Optional[Path], Optional[FileLock]]:
+        """
+        :return: (cached path, None) on a hit, (None, held build lock) on a miss,
+            or (None, None) while another worker is storing the same entry; the
+            caller then serves its own copy without storing it. Never blocks.
+        """
+        path = self.get(key)
+        if not path:
+            lock = self.lock(key)
+            if not lock.acquire(blocking=False):
+                REGISTRY.inc('hansel_cache_requests_total', labels={'cache': self.name, 'result': 'miss'})
+                return None, None
+            path = self.get(key)
+            if not path:
+                REGISTRY.inc('hansel_cache_requests_total', labels={'cache': self.name, 'result': 'miss'})
+                return None, lock
+            lock.release()
+        REGISTRY.inc('hansel_cache_requests_total', labels={'cache': self.name, 'result': 'hit'})
+        try:
+            REGISTRY.inc('hansel_cache_hit_bytes_total', path.stat().st_size, {'cache': self.name})
+        except FileNotFoundError:
+            pass  # evicted just now; the caller's open will tell
+        return path, None
+
+    def store(self, key, chunks: Iterable[bytes], lock: Optional[FileLock]) -> Iterable[bytes]:
+        """
+        Pass ``chunks`` through to the caller while writing them to the cache.
+        The entry is published only if the stream completes. Without a build
+        lock (see get_or_lock) the chunks are passed through as they are.
+        """
+        if lock is None:
+            return chunks
+        return StoringStream(self, key, chunks, lock)
+
+    def write(self, key, chunks: Iterable[bytes], lock: Optional[FileLock] = None) -> Path:
+        """
+        Build and publish an entry without serving it, replacing any existing one.
+        """
+        for _ in StoringStream(self, key, chunks, lock):
+            pass
+        return self.path_for(key)
+
+    def evict(self, keep: Optional[Path] = None):
+        with FileLock(self.root / 'locks' / 'evict.lock'):
+            entries = []
+            for entry in os.scandir(self.root):
+                if entry.is_file() and entry.name.endswith(self.suffix):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, Path(entry.path)))
+            total_bytes = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total_bytes <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                path.unlink(missing_ok=True)  # open readers keep their handle
+                total_bytes -= size
+                REGISTRY.inc('hansel_cache_evictions_total', labels={'cache': self.name})
+                REGISTRY.inc('hansel_cache_evicted_bytes_total', size, {'cache': self.name})
+                logging.info(f"Evicted cache entry {path.name} ({size} bytes) from {self.root}")
+
+
+class StoringStream:
+    """
+    Response iterable that tees a generated stream into the cache. Releases the
+    build lock on close even if iteration never started.
+    """
+
+    def __init__(self, cache: BundleCache, key, chunks: Iterable[bytes], lock: Optional[FileLock]):
+        self.cache = cache
+        self.key = key
+        self.chunks = chunks
+        self.lock = lock
+
+    def __iter__(self) -> Iterator[bytes]:
+        path = self.cache.path_for(self.key)
+        try:
+            with atomic_write(path) as f:
+                for chunk in self.chunks:
+                    f.write(chunk)
+                    yield chunk
+            size = path.stat().st_size
+            REGISTRY.inc('hansel_cache_stored_bytes_total', size, {'cache': self.cache.name})
+            logging.info(f"Stored cache entry {path.name} ({size} bytes) in {self.cache.root}")
+            self.cache.evict(keep=path)
+        finally:
+            self.close()
+
+    def close(self):
+        if self.lock:
+            self.lock.release()
+            self.lock = None
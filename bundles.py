@@ -0,0 +1,142 @@
+import os
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from tokenized_corpus import EXPORT_FILES
+from transliteration import CONVERTIBLE_TYPES
+
+# Text format of the pre-tokenized corpus export (tokenized_corpus.py) rather than of data files
+TOKENIZED_FORMAT = 'tokens'
+
+
+def is_full_bundle(text_format, meta_format):
+    return text_format == 'all' and meta_format == 'all'
+
+
+def validate_bundle_formats(text_format, meta_format, file_type_paths: Dict[str, Path], scheme=None):
+    """
+    :param scheme: canonical transliteration scheme for texts, or None to keep IAST
+    :return: error message for an invalid combination, or None if valid
+    """
+    if not meta_format or (meta_format != 'all' and meta_format not in file_type_paths):
+        return "A valid metadata format is required."
+    if not text_format or (text_format not in ('all', 'none', TOKENIZED_FORMAT) and text_format not in file_type_paths):
+        return "Invalid text format specified."
+    if (text_format == 'all') != (meta_format == 'all'):
+        return "Text format 'all' and metadata format 'all' are only available together."
+    if scheme and text_format != 'all' and text_format not in CONVERTIBLE_TYPES:
+        return f"Transliteration is only available for these text formats: {', '.join(CONVERTIBLE_TYPES)}."
+    return None
+
+
+# Formats offered by the custom bundle form on the index page
+UI_TEXT_FORMATS = ['none', 'txt', 'xml', 'html_plain', 'original']
+UI_META_FORMATS = ['md', 'html', 'json']
+
+
+def iter_bundle_variants(file_type_paths: Dict[str, Path], all_variants=False) -> Iterator[Tuple[str, str]]:
+    """
+    Yields every (text_format, meta_format) pair that download_bundle accepts,
+    or only those offered in the UI unless ``all_variants`` is set.
+    """
+    yield 'all', 'all'
+    text_formats = ['none', *file_type_paths, TOKENIZED_FORMAT] if all_variants else UI_TEXT_FORMATS
+    meta_formats = list(file_type_paths) if all_variants else UI_META_FORMATS
+    for text_format in text_formats:
+        for meta_format in meta_formats:
+            if validate_bundle_formats(text_format, meta_format, file_type_paths) is None:
+                yield text_format, meta_format
+
+
+def get_bundle_names(text_format, meta_format, data_version, scheme=None) -> Tuple[str, str]:
+    """
+    :param scheme: canonical transliteration scheme for texts, or None to keep IAST
+    :return: (internal_zip_name, user_facing_filename) for the requested bundle
+    """
+    if is_full_bundle(text_format, meta_format):
+        scheme_part = f"_{scheme}" if scheme else ''
+        internal_zip_name = f'hansel_all{scheme_part}_{data_version}.zip'
+        user_facing_filename = f"hansel_download_all{scheme_part}_{data_version}.zip"
+        return internal_zip_name, user_facing_filename
+
+    cache_key_parts = []
+    if text_format and text_format != 'none':
+        cache_key_parts.append(f"text-{text_format}")
+        if scheme:
+            cache_key_parts.append(f"scheme-{scheme}")
+    cache_key_parts.append(f"meta-{meta_format}")
+    cache_key_base = "_".join(cache_key_parts)
+    internal_zip_name = f'hansel_bundle_{cache_key_base}_{data_version}.zip'
+
+    name_parts = ['hansel_download']
+    if text_format and text_format != 'none':
+        name_parts.append(f"text_{text_format}")
+        if scheme:
+            name_parts.append(scheme)
+    name_parts.append(f"metadata_{meta_format}")
+    name_parts.append(data_version)
+    user_facing_filename = "_".join(name_parts) + ".zip"
+    return internal_zip_name, user_facing_filename
+
+
+def get_bundle_members(text_format, meta_format, manifest, file_type_paths: Dict[str, Path], data_version,
+                       scheme=None, token_export_dir: Path = None) -> List[Tuple[str, Path]]:
+    """
+    Lists the (arcname, file path) pairs that make up a bundle, in archive order,
+    from the corpus manifest rather than by walking the data directories.
+    :param token_export_dir: the built token export of ``data_version``, for the ``tokens`` text format
+    """
+    members = []
+    data_path = manifest.data_path
+    _, user_facing_filename = get_bundle_names(text_format, meta_format, data_version, scheme)
+    full_bundle = is_full_bundle(text_format, meta_format)
+    root_folder_name = user_facing_filename.removesuffix('.zip')
+
+    # Add VERSION file
+    version_file_path = data_path / 'VERSION'
+    if 'VERSION' in manifest.entries:
+        arcname = os.path.join(root_folder_name, 'VERSION') if full_bundle else 'VERSION'
+        members.append((arcname, version_file_path))
+
+    if full_bundle:
+        # Define the specific text directories to include
+        text_dirs_to_include = {
+            data_path / 'texts' / 'original_submissions': None,  # Include all files
+            data_path / 'texts' / 'project_editions' / 'txt': {'.txt'},
+            data_path / 'texts' / 'project_editions' / 'xml': {'.xml'},
+            data_path / 'texts' / 'transforms' / 'html' / 'plain': {'.html'},
+        }
+
+        # Add specified text files
+        for dir_path, extensions in text_dirs_to_include.items():
+            for file_path in manifest.files_under(dir_path, extensions):
+                relative_path = file_path.relative_to(data_path)
+                members.append((os.path.join(root_folder_name, relative_path), file_path))
+
+        # Add all metadata
+        for file_path in manifest.files_under(data_path / 'metadata'):
+            if file_path.suffix != '.zip':
+                relative_path = file_path.relative_to(data_path)
+                members.append((os.path.join(root_folder_name, relative_path), file_path))
+        return members
+
+    # Add selected text format
+    if text_format == TOKENIZED_FORMAT:
+        for filename in EXPORT_FILES:
+            members.append((f"tokens/{filename}", token_export_dir / filename))
+    elif text_format and text_format != 'none':
+        for file_path in manifest.files_under(file_type_paths[text_format]):
+            members.append((f"text/{file_path.name}", file_path))
+
+    # Add selected metadata format
+    meta_path = file_type_paths[meta_format]
+    if manifest.relative(meta_path) in manifest.entries:
+        members.append((f"metadata/{meta_path.name}", meta_path))
+    elif meta_format == 'md':
+        for file_path in manifest.files_under(meta_path, {'.md'}, recursive=False):
+            members.append((f"metadata/{file_path.name}", file_path))
+    else:
+        for file_path in manifest.files_under(meta_path):
+            if file_path.suffix != '.zip':
+                members.append((f"metadata/{file_path.name}", file_path))
+    return members
@@ -0,0 +1,129 @@
+"""
+Server-side catalog queries. For each data version the processed metadata
+rows get one precomputed ordering per sortable column and one bitset (a
+Python int, bit i = row i) per facet value, so paging, sorting and filtering
+never re-sort or re-scan the rows. Each row also carries its collation keys
+('Sort Keys', hex) so the browser can order rows exactly as the server does.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from collation import collation_key, collation_keys
+
+SORTABLE_FIELDS = ['Title', 'Author', 'Edition', 'Genre', 'Size (kb)']
+FACET_FIELDS = ['Genre', 'Author', 'Edition']
+SEARCHABLE_FIELDS = ['Title', 'Author', 'Edition', 'Genre']
+
+# Columns whose cells can hold several comma-separated facet values
+MULTI_VALUED_FIELDS = {'Genre', 'Author'}
+
+
+NUMERIC_FIELDS = {'Size (kb)'}
+
+
+def _size_key(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return -1.0
+
+
+def facet_values(field, value) -> List[str]:
+    if not value:
+        return []
+    if field in MULTI_VALUED_FIELDS:
+        return [part.strip() for part in str(value).split(',') if part.strip()]
+    return [str(value)]
+
+
+class Catalog:
+    """
+    Sorted index arrays and facet bitsets over a list of catalog rows.
+    """
+
+    def __init__(self, rows: List[Dict]):
+        self.rows = rows
+        self.all_rows = (1 << len(rows)) - 1
+        keys = {
+            field: [_size_key(row.get(field)) for row in rows] if field in NUMERIC_FIELDS
+            else collation_keys(row.get(field) for row in rows)
+            for field in SORTABLE_FIELDS
+        }
+        self.orders = {
+            field: sorted(range(len(rows)), key=lambda i, field_keys=field_keys: (field_keys[i], i))
+            for field, field_keys in keys.items()
+        }
+        for i, row in enumerate(rows):
+            row['Sort Keys'] = {field: keys[field][i].hex() for field in SORTABLE_FIELDS if field not in NUMERIC_FIELDS}
+        self.facets: Dict[str, Dict[str, int]] = {field: {} for field in FACET_FIELDS}
+        for i, row in enumerate(rows):
+            for field in FACET_FIELDS:
+                for value in facet_values(field, row.get(field)):
+                    self.facets[field][value] = self.facets[field].get(value, 0) | (1 << i)
+        # Facet values listed in collation order
+        self.facet_order = {
+            field: sorted(values, key=collation_key)
+            for field, values in self.facets.items()
+        }
+        self._haystacks = [
+            ' '.join(str(row.get(field) or '') for field in SEARCHABLE_FIELDS).lower()
+            for row in rows
+        ]
+
+    def mask(self, filters: Dict[str, Iterable[str]], search: Optional[str] = None) -> int:
+        """
+        :param filters: facet field -> accepted values (any of them matches)
+        :param search: case-insensitive substring of the searchable fields
+        :return: bitset of matching rows
+        """
+        return self._filter_mask(filters) & self._search_mask(search)
+
+    def _filter_mask(self, filters: Dict[str, Iterable[str]]) -> int:
+        mask = self.all_rows
+        for field, values in filters.items():
+            field_mask = 0
+            for value in values:
+                field_mask |= self.facets.get(field, {}).get(value, 0)
+            mask &= field_mask
+        return mask
+
+    def _search_mask(self, search: Optional[str]) -> int:
+        if not search:
+            return self.all_rows
+        needle = search.lower()
+        mask = 0
+        for i, haystack in enumerate(self._haystacks):
+            if needle in haystack:
+                mask |= 1 << i
+        return mask
+
+    def page(self, mask: int, sort_field='Title', descending=False, offset=0, limit=10) -> List[Dict]:
+        order = self.orders[sort_field]
+        if descending:
+            order = reversed(order)
+        rows, skipped = [], 0
+        for i in order:
+            if not (mask >> i) & 1:
+                continue
+            if skipped < offset:
+                skipped += 1
+                continue
+            rows.append(self.rows[i])
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def facet_counts(self, filters: Dict[str, Iterable[str]], search: Optional[str] = None) -> Dict[str, List[Tuple[str, int]]]:
+        """
+        Counts for each facet value under all the other fields' filters, so
+        choosing a value doesn't hide its alternatives.
+        :return: facet field -> (value, number of matching rows) for values with any
+        """
+        search_mask = self._search_mask(search)
+        counts = {}
+        for field, values in self.facet_order.items():
+            mask = self._filter_mask({other: v for other, v in filters.items() if other != field}) & search_mask
+            counts[field] = [
+                (value, count) for value in values
+                if (count := (self.facets[field][value] & mask).bit_count())
+            ]
+        return counts
@@ -0,0 +1,125 @@
+"""
+Sanskrit (IAST) collation keys. Text is split greedily into the longest
+letters of the alphabet table (so 'kh' is one letter, not 'k' then 'h'), and
+each letter becomes one byte: its 1-based position in the table. A key is
+therefore as long as its text in letters, not padded to a fixed width (that
+would cut off long titles or waste space on short ones); a key that is a
+prefix of another sorts first, as it should. Comparing two keys is then a
+plain bytes comparison. static/web/js/sort.js implements the same rules, so
+server and browser order rows identically.
+
+Usage: python collation.py (checks both implementations against CHECKS; needs node for sort.js)
+"""
+import json
+import shutil
+import subprocess
+import sys
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+SANSKRIT_ALPHABET = [
+    'a', 'ā', 'i', 'ī', 'u', 'ū', 'ṛ', 'ṝ', 'ḷ', 'ḹ', 'e', 'ai', 'o', 'au',
+    'k', 'kh', 'g', 'gh', 'ṅ',
+    'c', 'ch', 'j', 'jh', 'ñ',
+    'ṭ', 'ṭh', 'ḍ', 'ḍh', 'ṇ',
+    't', 'th', 'd', 'dh', 'n',
+    'p', 'ph', 'b', 'bh', 'm',
+    'y', 'r', 'l', 'v',
+    'ś', 'ṣ', 's',
+    'h',
+    'ṃ', 'ḥ'
+]
+
+# Variant spellings collated as another letter
+ALIASES = {
+    'ṁ': 'ṃ',
+    'ï': 'i',  # diaeresis marks hiatus: a-ï is two vowels, not 'ai'
+    'ü': 'u',
+}
+
+WEIGHTS: Dict[str, int] = {letter: i for i, letter in enumerate(SANSKRIT_ALPHABET, start=1)}
+UNKNOWN_WEIGHT = 0xFE  # anything else (spaces, punctuation, other letters) sorts after every letter
+MAX_LETTER_LENGTH = max(len(letter) for letter in SANSKRIT_ALPHABET)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits lowercased NFC text into letters, preferring the longest match at each position,
+    and maps alias letters onto the ones they collate as.
+    """
+    text = unicodedata.normalize('NFC', text).lower()
+    tokens = []
+    i = 0
+    while i < len(text):
+        for length in range(MAX_LETTER_LENGTH, 0, -1):
+            token = text[i:i + length]
+            if len(token) == length and (token in WEIGHTS or length == 1):
+                # Aliases apply to whole letters only, so 'aï' stays two vowels
+                tokens.append(ALIASES.get(token, token))
+                i += length
+                break
+    return tokens
+
+
+def collation_key(text) -> bytes:
+    """
+    :return: one byte per letter, so keys vary in length; blank text gives b'', which sorts first
+    """
+    return bytes(WEIGHTS.get(token, UNKNOWN_WEIGHT) for token in tokenize(str(text or '')))
+
+
+def collation_keys(values: Iterable) -> List[bytes]:
+    """
+    Keys for a whole column at once, computing each distinct value only once.
+    """
+    memo = {}
+    keys = []
+    for value in values:
+        if value not in memo:
+            memo[value] = collation_key(value)
+        keys.append(memo[value])
+    return keys
+
+
+# Expected letters of tricky spellings, checked by running this module
+CHECKS = {
+    'kaïkeyī': ['k', 'a', 'i', 'k', 'e', 'y', 'ī'],  # hiatus, not the diphthong 'ai'
+    'gaürī': ['g', 'a', 'u', 'r', 'ī'],  # likewise not 'au'
+    'kaikeyī': ['k', 'ai', 'k', 'e', 'y', 'ī'],
+    'khaḍga': ['kh', 'a', 'ḍ', 'g', 'a'],
+    'saṁskṛta': ['s', 'a', 'ṃ', 's', 'k', 'ṛ', 't', 'a'],
+}
+
+SORT_JS_PATH = Path(__file__).parent / 'static' / 'web' / 'js' / 'sort.js'
+
+
+def check() -> List[str]:
+    """
+    Checks tokenize against CHECKS, and saKey in sort.js against collation_key if node is installed.
+    :return: descriptions of the failures
+    """
+    failures = []
+    for text, letters in CHECKS.items():
+        if tokenize(text) != letters:
+            failures.append(f"tokenize({text!r}) = {tokenize(text)}, expected {letters}")
+    node = shutil.which('node')
+    if node is None:
+        print("node not found; skipping sort.js")
+        return failures
+    script = f"globalThis.window = globalThis;\n{SORT_JS_PATH.read_text(encoding='utf-8')}\n" \
+             "console.log(JSON.stringify(JSON.parse(require('fs').readFileSync(0, 'utf8')).map(saKey)));"
+    texts = list(CHECKS)
+    result = subprocess.run([node, '-e', script], input=json.dumps(texts), capture_output=True, text=True, check=True)
+    for text, js_key in zip(texts, json.loads(result.stdout)):
+        if js_key != collation_key(text).hex():
+            failures.append(f"saKey({text!r}) = {js_key}, collation_key gives {collation_key(text).hex()}")
+    return failures
+
+
+if __name__ == "__main__":
+    failures = check()
+    for failure in failures:
+        print(failure)
+    print(f"{len(CHECKS)} checks, {len(failures)} failures")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,364 @@
+"""
+Keyword-in-context concordance over the project edition texts, backed by a
+suffix array of the whole corpus. The texts' UTF-8 bytes (NFC) are joined
+with NUL separators, and their suffixes are sorted by prefix doubling in
+NumPy, a chunk of tied suffixes at a time so the int64 sort keys stay small.
+Every occurrence of a string is then one contiguous run of the suffix array,
+found by two binary searches. Hits come out ordered by their following
+context, like a printed concordance, and the LCP array (built from the
+ranks of each doubling round) marks a hit whose following context repeats
+the previous hit's, e.g. parallel passages in two recensions. All arrays
+are stored as .npy/.bin files and memory-mapped. The index is built by
+prebuild.py or by running this module.
+
+Usage: python concordance.py
+"""
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unicodedata
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from artifacts import FileLock
+
+SEPARATOR = b'\x00'
+MAX_CHAR_BYTES = 4  # longest UTF-8 sequence, for turning a context width in characters into bytes
+HEAD_BYTES = 7  # tied suffixes are first sorted by this many bytes and their length (up to 7) in an int64
+SORT_CHUNK = 1 << 20  # suffixes sorted at a time, in whole groups of tied ones, to bound the int64 sort keys
+
+
+def _words(data: np.ndarray) -> np.ndarray:
+    """
+    :return: the 8 bytes at every position of ``data`` as a big-endian uint64
+        view, so they compare like the bytes (NUL past the end) and one gather reads them all
+    """
+    padded = np.zeros(len(data) + 8, dtype=np.uint8)
+    padded[:len(data)] = data
+    return np.ndarray(shape=(len(data),), dtype='>u8', buffer=padded, strides=(1,))
+
+
+def _sort_groups(suffix_array: np.ndarray, positions: np.ndarray, new_group: np.ndarray,
+                 sort_key: Callable[[np.ndarray], np.ndarray]) -> np.ndarray:
+    """
+    Sorts each group of tied suffixes in place by ``sort_key`` (int64 keys of
+    an array of suffixes), SORT_CHUNK suffixes at a time.
+    :param positions: suffix array positions of the tied suffixes, ascending
+    :param new_group: True where ``positions`` starts a group
+    :return: the same for the groups of equal keys they are split into
+    """
+    bounds = [0]
+    while bounds[-1] + SORT_CHUNK < len(positions):
+        rest = new_group[bounds[-1] + SORT_CHUNK:]
+        first = int(np.argmax(rest))  # the next group start
+        if not rest[first]:
+            break
+        bounds.append(bounds[-1] + SORT_CHUNK + first)
+    bounds.append(len(positions))
+    split = np.empty(len(positions), dtype=bool)
+    for lo, hi in zip(bounds, bounds[1:]):
+        chunk = positions[lo:hi]
+        suffixes = suffix_array[chunk]
+        key = sort_key(suffixes)
+        order = np.argsort(key)
+        suffix_array[chunk] = suffixes[order]
+        key = key[order]
+        split[lo] = True
+        np.not_equal(key[1:], key[:-1], out=split[lo + 1:hi])
+    return split
+
+
+def build_suffix_array(data: np.ndarray, on_round: Optional[Callable[[int, np.ndarray], None]] = None) -> np.ndarray:
+    """
+    Sorts all suffixes of ``data`` (uint8) by prefix doubling. Suffixes are
+    bucketed by their first 2 bytes (a radix sort), the tied ones sorted by
+    their first HEAD_BYTES bytes, and then each round sorts the ones still
+    tied by twice as many, using the ranks of the previous round as sort keys,
+    until none are tied. A suffix's rank is the number of suffixes known to
+    sort before it, so the ranks of settled suffixes never change and only
+    the tied ones are re-sorted, a chunk of whole groups at a time. Ranks and
+    the result are int32 when ``data`` is shorter than 2**31 bytes.
+    :param on_round: called with (length, ranks) after each round in which
+        some suffixes were still tied; ranks are equal for suffixes sharing their first length bytes
+    """
+    n = len(data)
+    index_type = np.int32 if n < 2 ** 31 else np.int64
+    if n == 0:
+        return np.empty(0, dtype=index_type)
+    pairs = data.astype(np.uint16) << 8
+    pairs[:-1] |= data[1:]  # the last suffix ties with a NUL + NUL, and the head sort below tells them apart
+    suffix_array = np.argsort(pairs, kind='stable').astype(index_type)
+    pairs = pairs[suffix_array]
+    new_group = np.empty(n, dtype=bool)
+    new_group[0] = True
+    np.not_equal(pairs[1:], pairs[:-1], out=new_group[1:])
+    del pairs
+    positions = np.arange(n, dtype=index_type)  # in the suffix array, of the suffixes still tied
+    rank = np.empty(n, dtype=index_type)
+    length = 2
+
+    words = _words(data)
+
+    def head_key(suffixes):
+        key = words[suffixes].astype(np.uint64)
+        key >>= 8 * (8 - HEAD_BYTES)
+        key <<= 3
+        key |= np.minimum(n - suffixes, HEAD_BYTES).astype(np.uint64)  # ends within its head: before NUL padding
+        return key.view(np.int64)
+
+    def doubled_key(suffixes):
+        key = rank[suffixes].astype(np.int64)  # a group's suffixes keep its positions
+        key *= n + 1
+        following = np.minimum(suffixes, n - 1 - length)  # length < n while any are tied
+        following += length
+        second = rank[following]
+        second += 1
+        second[suffixes >= n - length] = 0  # these end first, so sort first
+        key += second
+        return key
+
+    while True:
+        # Rank each group by its first position, and keep the suffixes that are not alone in theirs, in place
+        group_start, kept = 0, 0
+        for lo in range(0, len(positions), SORT_CHUNK):
+            hi = min(lo + SORT_CHUNK, len(positions))
+            chunk_positions, chunk_new_group = positions[lo:hi], new_group[lo:hi]
+            ranks = np.where(chunk_new_group, chunk_positions, group_start)
+            np.maximum.accumulate(ranks, out=ranks)
+            group_start = ranks[-1]
+            rank[suffix_array[chunk_positions]] = ranks
+            tied = ~chunk_new_group
+            tied[:-1] |= ~new_group[lo + 1:hi]
+            if hi < len(positions):
+                tied[-1] |= ~new_group[hi]
+            count = int(np.count_nonzero(tied))
+            positions[kept:kept + count] = chunk_positions[tied]
+            new_group[kept:kept + count] = chunk_new_group[tied]
+            kept += count
+        positions, new_group = positions[:kept], new_group[:kept]
+        if kept == 0:
+            return suffix_array
+        if length == 2:
+            new_group = _sort_groups(suffix_array, positions, new_group, head_key)
+            length = HEAD_BYTES
+        else:
+            if on_round:
+                on_round(length, rank)
+            new_group = _sort_groups(suffix_array, positions, new_group, doubled_key)
+            length *= 2
+
+
+def _leading_equal_bytes(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    :return: how many leading bytes of the big-endian uint64s ``x`` and ``y`` are equal (0-8)
+    """
+    diff = x.astype(np.uint64) ^ y.astype(np.uint64)
+    zero_bits = np.zeros(len(diff), dtype=np.int64)
+    for width in (32, 16, 8):
+        top_zero = (diff >> (64 - width)) == 0
+        zero_bits[top_zero] += width
+        diff[top_zero] <<= width
+    zero_bits[diff == 0] = 64
+    return zero_bits // 8
+
+
+def build_lcp_array(data: np.ndarray, suffix_array: np.ndarray, ranks: List[Tuple[int, np.ndarray]]) -> np.ndarray:
+    """
+    lcp[i] is the length of the common prefix of the suffixes at
+    suffix_array[i - 1] and suffix_array[i] (lcp[0] = 0). Computed for all
+    neighbours at once by binary lifting over the ranks of the doubling rounds
+    (Manber and Myers): from the longest round down, a pair whose suffixes,
+    past the common prefix found so far, still have equal ranks shares that
+    round's length more. The rest, under HEAD_BYTES, is read off the next 8
+    bytes of both.
+    :param ranks: (length, ranks) of each round, as passed to build_suffix_array's on_round
+    """
+    n = len(suffix_array)
+    words = _words(data)
+    lcp = np.zeros(n, dtype=suffix_array.dtype)
+    for lo in range(1, n, SORT_CHUNK):
+        hi = min(lo + SORT_CHUNK, n)
+        left, right = suffix_array[lo - 1:hi - 1].astype(np.int64), suffix_array[lo:hi].astype(np.int64)
+        common = np.zeros(hi - lo, dtype=np.int64)
+        for length, rank in reversed(ranks):
+            # equal ranks mean both have at least ``length`` bytes left, so neither index runs past the end
+            i, j = np.minimum(left + common, n - 1), np.minimum(right + common, n - 1)
+            common[rank[i] == rank[j]] += length
+        i, j = left + common, right + common
+        left_over = np.minimum(n - i, n - j)
+        i, j = np.minimum(i, n - 1), np.minimum(j, n - 1)
+        common += np.minimum(_leading_equal_bytes(words[i], words[j]), left_over)
+        lcp[lo:hi] = common
+    return lcp
+
+
+def build_concordance_index(index_dir: Path, txt_path: Path) -> int:
+    """
+    Builds the suffix and LCP arrays of every .txt file under ``txt_path``
+    into a temporary directory and renames it to ``index_dir`` once complete.
+    :return: corpus size in bytes
+    """
+    texts, parts, text_starts = [], [], []
+    position = 0
+    for file_path in sorted(txt_path.glob('*.txt')):
+        encoded = unicodedata.normalize('NFC', file_path.read_text(encoding='utf-8')).encode('utf-8')
+        texts.append(file_path.stem)
+        text_starts.append(position)
+        parts.append(encoded + SEPARATOR)
+        position += len(encoded) + 1
+    corpus = b''.join(parts)
+    del parts
+    data = np.frombuffer(corpus, dtype=np.uint8)
+
+    index_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=index_dir.parent, prefix=f".{index_dir.name}."))
+    try:
+        # The ranks of each round go to disk until the LCP array is built from them
+        rank_paths = []
+        (tmp_dir / 'ranks').mkdir()
+
+        def save_ranks(length, rank):
+            rank_paths.append((length, tmp_dir / 'ranks' / f"{length}.npy"))
+            np.save(rank_paths[-1][1], rank)
+
+        suffix_array = build_suffix_array(data, save_ranks)
+        ranks = [(length, np.load(path, mmap_mode='r')) for length, path in rank_paths]
+        lcp = build_lcp_array(data, suffix_array, ranks)
+        del ranks
+        shutil.rmtree(tmp_dir / 'ranks')
+
+        (tmp_dir / 'corpus.bin').write_bytes(corpus)
+        np.save(tmp_dir / 'suffix_array.npy', suffix_array)
+        np.save(tmp_dir / 'lcp.npy', lcp)
+        np.save(tmp_dir / 'text_starts.npy', np.array(text_starts, dtype=np.int64))
+        np.save(tmp_dir / 'newlines.npy', np.flatnonzero(data == ord('\n')).astype(np.int64))
+        with open(tmp_dir / 'meta.json', 'w', encoding='utf-8') as f:
+            json.dump({'texts': texts}, f, ensure_ascii=False)
+        os.rename(tmp_dir, index_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    logging.info(f"Built concordance index of {len(corpus)} bytes from {len(texts)} texts in {index_dir}")
+    return len(corpus)
+
+
+def is_concordance_index(index_dir: Path) -> bool:
+    """
+    :return: whether ``index_dir`` holds a complete index (older builds lack the LCP array)
+    """
+    return (index_dir / 'lcp.npy').is_file()
+
+
+def ensure_concordance_index(index_dir: Path, txt_path: Path):
+    """
+    Builds the index unless it exists; only one process builds at a time.
+    """
+    if is_concordance_index(index_dir):
+        return
+    with FileLock(index_dir.parent / f".{index_dir.name}.lock"):
+        if not is_concordance_index(index_dir):
+            shutil.rmtree(index_dir, ignore_errors=True)
+            build_concordance_index(index_dir, txt_path)
+
+
+class ConcordanceIndex:
+    """
+    Read-only view of a built index; the arrays are memory-mapped.
+    """
+
+    def __init__(self, index_dir: Path):
+        load = lambda name: np.load(index_dir / name, mmap_mode='r')
+        size = os.path.getsize(index_dir / 'corpus.bin')
+        self.corpus = np.memmap(index_dir / 'corpus.bin', dtype=np.uint8, mode='r') if size else np.empty(0, np.uint8)
+        self.suffix_array = load('suffix_array.npy')
+        self.lcp = load('lcp.npy')
+        self.text_starts = load('text_starts.npy')
+        self.newlines = load('newlines.npy')
+        with open(index_dir / 'meta.json', encoding='utf-8') as f:
+            self.texts = json.load(f)['texts']
+
+    def _prefix(self, i: int, length: int) -> bytes:
+        start = int(self.suffix_array[i])
+        return self.corpus[start:start + length].tobytes()
+
+    def find(self, needle: bytes) -> Tuple[int, int]:
+        """
+        :return: the run [lo, hi) of the suffix array whose suffixes start with ``needle``
+        """
+        length = len(needle)
+        lo, hi = 0, len(self.suffix_array)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._prefix(mid, length) < needle:
+                lo = mid + 1
+            else:
+                hi = mid
+        first, hi = lo, len(self.suffix_array)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._prefix(mid, length) <= needle:
+                lo = mid + 1
+            else:
+                hi = mid
+        return first, lo
+
+    def _context(self, start: int, end: int, width: int, before: bool) -> str:
+        data = self.corpus[start:end].tobytes()
+        cut = data.split(SEPARATOR)[-1 if before else 0]  # stay within the text
+        text = cut.decode('utf-8', errors='ignore')  # drops a character cut in half at the window's edge
+        return text[-width:] if before else text[:width]
+
+    def search(self, query: str, width=40, limit=20, offset=0, by_position=False) -> Dict:
+        """
+        :param query: exact string to look for (NFC-normalized here)
+        :param width: characters of context on each side
+        :param by_position: order hits by text and position instead of by following context
+        :return: {'total', 'counts': {text: hits}, 'hits': [...]}
+        """
+        needle = unicodedata.normalize('NFC', query).encode('utf-8')
+        if not needle or SEPARATOR in needle:
+            return {'total': 0, 'counts': {}, 'hits': []}
+        lo, hi = self.find(needle)
+        positions = np.asarray(self.suffix_array[lo:hi], dtype=np.int64)
+        text_ids = np.searchsorted(self.text_starts, positions, side='right') - 1
+        counts = np.bincount(text_ids, minlength=len(self.texts))
+
+        ranks = np.arange(lo, hi)
+        if by_position:
+            ranks = ranks[np.argsort(positions, kind='stable')]
+        hits = []
+        window = width * MAX_CHAR_BYTES
+        for rank in ranks[offset:offset + limit]:
+            position = int(self.suffix_array[rank])
+            text_id = int(np.searchsorted(self.text_starts, position, side='right') - 1)
+            text_start = int(self.text_starts[text_id])
+            line = int(np.searchsorted(self.newlines, position) - np.searchsorted(self.newlines, text_start)) + 1
+            right = self._context(position + len(needle), position + len(needle) + window, width, before=False)
+            shown = len(needle) + len(right.encode('utf-8'))
+            hits.append({
+                'text': self.texts[text_id],
+                'line': line,
+                'offset': position - text_start,
+                'left': self._context(max(position - window, 0), position, width, before=True),
+                'match': needle.decode('utf-8'),
+                'right': right,
+                # the following context is the same as the previous hit's (in context order)
+                'parallel': bool(rank > lo and self.lcp[rank] >= shown),
+            })
+        return {
+            'total': int(hi - lo),
+            'counts': {self.texts[i]: int(count) for i, count in enumerate(counts) if count},
+            'hits': hits,
+        }
+
+
+if __name__ == "__main__":
+    from config import FILE_TYPE_PATHS, CONCORDANCE_INDEX_PATH
+    from utils import find_data_version
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    ensure_concordance_index(CONCORDANCE_INDEX_PATH / find_data_version(), FILE_TYPE_PATHS['txt'])
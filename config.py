@@ -0,0 +1,53 @@
+import os
+from pathlib import Path
+
+STATIC_FILES_PATH = Path('./static')
+DATA_PATH = Path(os.getenv('DATA_PATH', str(STATIC_FILES_PATH / 'data')))
+METADATA_PATH = DATA_PATH / 'metadata' / 'transforms'
+FILE_TYPE_PATHS = {
+    'txt': DATA_PATH / 'texts' / 'project_editions' / 'txt',
+    'xml': DATA_PATH / 'texts' / 'project_editions' / 'xml',
+    'html_plain': DATA_PATH / 'texts' / 'transforms' / 'html' / 'plain',
+    'html_rich': DATA_PATH / 'texts' / 'transforms' / 'html' / 'rich',
+    'original': DATA_PATH / 'texts' / 'original_submissions',
+    'md': DATA_PATH / 'metadata' / 'markdown',
+    'html': DATA_PATH / 'metadata' / 'transforms' / 'html',
+    'json': METADATA_PATH / 'metadata.json'
+}
+
+CACHE_PATH = Path(os.getenv('CACHE_PATH', './cache'))
+MANIFEST_PATH = DATA_PATH / '.manifest.json'
+MANIFEST_FALLBACK_PATH = CACHE_PATH / 'manifest.json'  # used when DATA_PATH is read-only
+SNAPSHOT_PATH = CACHE_PATH / 'snapshots'
+VERSION_MANIFESTS_PATH = CACHE_PATH / 'versions'  # file list of each data version, for delta bundles
+CORPUS_CHECK_INTERVAL = float(os.getenv('CORPUS_CHECK_INTERVAL', '5'))  # seconds between checks of DATA_PATH/VERSION
+BUNDLE_CACHE_PATH = CACHE_PATH / 'bundles'
+BUNDLE_CACHE_MAX_MB = int(os.getenv('BUNDLE_CACHE_MAX_MB', '2048'))
+PAGE_CACHE_MAX_MB = int(os.getenv('PAGE_CACHE_MAX_MB', '64'))
+SECTION_INDEX_PATH = CACHE_PATH / 'sections'
+LAZY_SECTIONS_MIN_KB = int(os.getenv('LAZY_SECTIONS_MIN_KB', '512'))  # smaller texts are sent whole
+SEARCH_INDEX_PATH = CACHE_PATH / 'search'
+PASSAGE_INDEX_PATH = CACHE_PATH / 'passages'
+CONCORDANCE_INDEX_PATH = CACHE_PATH / 'concordance'
+ALIGNMENT_PATH = CACHE_PATH / 'alignments'  # collations of recensions
+METRICS_PATH = CACHE_PATH / 'metrics'  # one file per gunicorn worker, cleared at startup
+TOKEN_EXPORT_PATH = CACHE_PATH / 'tokens'  # pre-tokenized corpus for the 'tokens' bundle format
+PRECOMPRESSED_PATH = CACHE_PATH / 'precompressed'  # gzip/brotli variants of data files, by content hash
+TRANSLITERATION_CACHE_PATH = CACHE_PATH / 'transliterated'
+TRANSLITERATION_CACHE_MAX_MB = int(os.getenv('TRANSLITERATION_CACHE_MAX_MB', '512'))
+TRANSLITERATION_WORKERS = int(os.getenv('TRANSLITERATION_WORKERS', '0')) or None  # default: CPU count
+SEARCH_MAX_LIMIT = 100
+CATALOG_MAX_LIMIT = 100
+CONCORDANCE_MAX_LIMIT = 100
+CONCORDANCE_MAX_WIDTH = 200  # characters of context on each side of a hit
+CONCORDANCE_RETRY_AFTER = 60  # seconds, sent with the 503 while the prebuild has not built the index yet
+IO_POOL_SIZE = int(os.getenv('IO_POOL_SIZE', '16'))  # threads for disk reads and compression in WORKER_MODE=async
+
+GEOIP_DB_PATH = os.getenv('GEOIP_DB_PATH')  # CSV of start_ip,end_ip,country,region,city
+GEOIP_HTTP_FALLBACK = os.getenv('GEOIP_HTTP_FALLBACK', '1') == '1'
+GEOIP_HTTP_TIMEOUT = float(os.getenv('GEOIP_HTTP_TIMEOUT', '2.0'))
+GEOIP_CACHE_SIZE = int(os.getenv('GEOIP_CACHE_SIZE', '10000'))
+GEOIP_CACHE_TTL = int(os.getenv('GEOIP_CACHE_TTL', str(24 * 60 * 60)))
+
+DOWNLOAD_LOG_DB_PATH = Path(os.getenv('DOWNLOAD_LOG_DB_PATH', 'downloads.sqlite3'))
+DOWNLOAD_LOG_JSON_PATH = Path('downloads.json')  # legacy log, imported once into the database
@@ -0,0 +1,231 @@
+"""
+Reloadable corpus state. Everything derived from the data directory (metadata,
+sizes, manifest, data version) lives in one immutable snapshot that is
+rebuilt in the background and swapped in atomically when static/data/VERSION
+changes, so a new data version can be published without restarting workers.
+
+Snapshots are also pickled into one file per data version, so workers and
+restarts load the processed catalog instead of rebuilding it.
+
+Usage: python corpus_state.py
+"""
+import logging
+import os
+import pickle
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from artifacts import FileLock, atomic_write
+from catalog import Catalog
+from manifest import Manifest, load_manifest
+from utils import load_metadata, process_metadata, calculate_all_sizes, find_data_version, find_bundle_version
+
+
+class CorpusSnapshot(NamedTuple):
+    """Everything derived from one version of the data directory."""
+    data_version: str
+    bundle_version: str
+    version_stamp: tuple  # (mtime_ns, size) of the VERSION file it was built from
+    metadata_stamp: tuple  # and of metadata.json
+    raw_metadata: Dict
+    custom_metadata: List[Dict]
+    titles_by_filename_base: Dict[str, str]
+    catalog: Catalog
+    manifest: Manifest
+    file_group_sizes_mb: Dict[str, float]
+    total_corpus_size_mb: float
+    plain_text_size_mb: float
+
+    @property
+    def num_items(self):
+        return len(self.custom_metadata)
+
+
+def _version_stamp(version_path: Path) -> Optional[tuple]:
+    try:
+        stat = version_path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def build_snapshot(data_path: Path, metadata_path: Path, file_type_paths: Dict[str, Path],
+                   manifest_path: Path, manifest_fallback_path: Path) -> CorpusSnapshot:
+    version_path = data_path / 'VERSION'
+    version_stamp = _version_stamp(version_path)
+    metadata_stamp = _version_stamp(metadata_path / 'metadata.json')
+    raw_metadata = load_metadata(metadata_path)
+    custom_metadata = process_metadata(raw_metadata)
+    manifest = load_manifest(data_path, manifest_path, manifest_fallback_path)
+    file_group_sizes_mb, total_corpus_size_mb, plain_text_size_mb = calculate_all_sizes(file_type_paths, data_path, manifest)
+    return CorpusSnapshot(
+        data_version=find_data_version(version_path),
+        bundle_version=find_bundle_version(version_path),
+        version_stamp=version_stamp,
+        metadata_stamp=metadata_stamp,
+        raw_metadata=raw_metadata,
+        custom_metadata=custom_metadata,
+        titles_by_filename_base={item['Filename Base']: item['Title'] for item in custom_metadata},
+        catalog=Catalog(custom_metadata),
+        manifest=manifest,
+        file_group_sizes_mb=file_group_sizes_mb,
+        total_corpus_size_mb=total_corpus_size_mb,
+        plain_text_size_mb=plain_text_size_mb,
+    )
+
+
+# Bump whenever CorpusSnapshot or anything in it changes shape
+SNAPSHOT_FORMAT = 4
+
+
+def snapshot_path(snapshot_dir: Path, data_version) -> Path:
+    return snapshot_dir / f"{data_version}.v{SNAPSHOT_FORMAT}.pickle"
+
+
+def save_snapshot(snapshot: CorpusSnapshot, snapshot_dir: Path) -> Path:
+    path = snapshot_path(snapshot_dir, snapshot.data_version)
+    with atomic_write(path) as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def load_snapshot(snapshot_dir: Path, data_path: Path, metadata_path: Path) -> Optional[CorpusSnapshot]:
+    """
+    :return: the stored snapshot for the current data version, or None if there
+    is none or VERSION or metadata.json changed since it was built
+    """
+    version_path = data_path / 'VERSION'
+    try:
+        with open(snapshot_path(snapshot_dir, find_data_version(version_path)), 'rb') as f:
+            snapshot = pickle.load(f)
+    except (FileNotFoundError, pickle.UnpicklingError, EOFError, AttributeError, TypeError):
+        return None
+    if not isinstance(snapshot, CorpusSnapshot) or snapshot.manifest.data_path != Path(data_path):
+        return None
+    if (snapshot.version_stamp, snapshot.metadata_stamp) != (
+        _version_stamp(version_path), _version_stamp(metadata_path / 'metadata.json')
+    ):
+        return None
+    return snapshot
+
+
+def with_manifest(snapshot: CorpusSnapshot, manifest: Manifest, file_type_paths: Dict[str, Path],
+                  data_path: Path) -> CorpusSnapshot:
+    """
+    :return: ``snapshot`` with a newer manifest of the same data version and the sizes derived from it
+    """
+    file_group_sizes_mb, total_corpus_size_mb, plain_text_size_mb = calculate_all_sizes(file_type_paths, data_path, manifest)
+    return snapshot._replace(
+        manifest=manifest,
+        file_group_sizes_mb=file_group_sizes_mb,
+        total_corpus_size_mb=total_corpus_size_mb,
+        plain_text_size_mb=plain_text_size_mb,
+    )
+
+
+def load_or_build_snapshot(snapshot_dir: Path, data_path: Path, metadata_path: Path, file_type_paths: Dict[str, Path],
+                           manifest_path: Path, manifest_fallback_path: Path) -> CorpusSnapshot:
+    """
+    Loads the stored snapshot, or builds and stores one. A stored snapshot's
+    manifest is refreshed against the data directory first (only changed files
+    are hashed), since data files can change without VERSION changing. Only
+    one process builds at a time; the others wait and load what it stored.
+    """
+    with FileLock(snapshot_dir / '.build.lock'):
+        return _load_or_build_snapshot(snapshot_dir, data_path, metadata_path, file_type_paths,
+                                       manifest_path, manifest_fallback_path)
+
+
+def _load_or_build_snapshot(snapshot_dir: Path, data_path: Path, metadata_path: Path,
+                            file_type_paths: Dict[str, Path], manifest_path: Path,
+                            manifest_fallback_path: Path) -> CorpusSnapshot:
+    snapshot = load_snapshot(snapshot_dir, data_path, metadata_path)
+    if snapshot is not None:
+        manifest = load_manifest(data_path, manifest_path, manifest_fallback_path)
+        if manifest.entries == snapshot.manifest.entries:
+            logging.info(f"Loaded corpus snapshot for {snapshot.data_version}")
+            return snapshot
+        logging.info(f"Data files changed since the corpus snapshot for {snapshot.data_version} was stored; updating it")
+        snapshot = with_manifest(snapshot, manifest, file_type_paths, data_path)
+    else:
+        snapshot = build_snapshot(data_path, metadata_path, file_type_paths, manifest_path, manifest_fallback_path)
+    try:
+        save_snapshot(snapshot, snapshot_dir)
+    except OSError as e:
+        logging.warning(f"Can't store corpus snapshot in {snapshot_dir}: {e}")
+    return snapshot
+
+
+class CorpusState:
+    """
+    Holds the current CorpusSnapshot. Reading ``snapshot`` checks the VERSION
+    file at most every ``check_interval`` seconds; if it changed, a new snapshot
+    is built on a background thread while requests keep using the old one.
+    Listeners are called with (old, new) after each swap, e.g. to drop caches
+    keyed to the old data version.
+    """
+
+    def __init__(self, build: Callable[[], CorpusSnapshot], version_path: Path, check_interval=5.0):
+        self.build = build
+        self.version_path = Path(version_path)
+        self.check_interval = check_interval
+        self._snapshot = build()
+        self._next_check = time.monotonic() + check_interval
+        self._reloading = False
+        self._failed_stamp = None  # don't retry a VERSION file that already failed to load
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def on_swap(self, listener: Callable[[CorpusSnapshot, CorpusSnapshot], None]):
+        self._listeners.append(listener)
+        return listener
+
+    @property
+    def snapshot(self) -> CorpusSnapshot:
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            stamp = _version_stamp(self.version_path)
+            if stamp is not None and stamp not in (self._snapshot.version_stamp, self._failed_stamp):
+                self._start_reload()
+        return self._snapshot
+
+    def _start_reload(self):
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self.reload, name="corpus-reload", daemon=True).start()
+
+    def reload(self) -> CorpusSnapshot:
+        """
+        Builds a new snapshot and swaps it in. Can also be called directly to force a reload.
+        """
+        try:
+            new = self.build()
+            old, self._snapshot = self._snapshot, new  # a single assignment, so readers see one or the other
+            logging.info(f"Reloaded corpus state in process {os.getpid()}: {old.data_version} -> {new.data_version}")
+            for listener in self._listeners:
+                try:
+                    listener(old, new)
+                except Exception as e:
+                    logging.error(f"Error in corpus reload listener {getattr(listener, '__name__', listener)}: {e}")
+            return new
+        except Exception as e:
+            self._failed_stamp = _version_stamp(self.version_path)
+            logging.error(f"Error reloading corpus state; keeping {self._snapshot.data_version}: {e}")
+            return self._snapshot
+        finally:
+            with self._lock:
+                self._reloading = False
+
+
+if __name__ == "__main__":
+    from config import DATA_PATH, METADATA_PATH, FILE_TYPE_PATHS, MANIFEST_PATH, MANIFEST_FALLBACK_PATH, SNAPSHOT_PATH
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    snapshot = build_snapshot(DATA_PATH, METADATA_PATH, FILE_TYPE_PATHS, MANIFEST_PATH, MANIFEST_FALLBACK_PATH)
+    path = save_snapshot(snapshot, SNAPSHOT_PATH)
+    logging.info(f"Stored corpus snapshot of {snapshot.num_items} texts in {path} ({path.stat().st_size} bytes)")
@@ -0,0 +1,118 @@
+"""
+Delta bundles. The corpus manifest of every data version served is kept in
+one file per version, so a bundle can be requested relative to an older
+version: it then holds only the files whose content hash changed or that are
+new, plus DELTA.json listing what was changed, added and deleted.
+"""
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from bundles import get_bundle_members, get_bundle_names, is_full_bundle
+from manifest import Manifest
+
+VERSION_PATTERN = re.compile(r'^[\w.\-]+$')
+DELTA_FILENAME = 'DELTA.json'
+
+
+def version_manifest_path(versions_dir: Path, data_version) -> Path:
+    return Path(versions_dir) / f"{data_version}.json"
+
+
+def record_version_manifest(versions_dir: Path, data_version, manifest: Manifest):
+    """
+    Stores ``manifest`` as the file list of ``data_version`` unless it is already stored.
+    """
+    path = version_manifest_path(versions_dir, data_version)
+    stored = Manifest.read(manifest.data_path, path)
+    if stored is not None and stored.entries == manifest.entries:
+        return
+    try:
+        manifest.write(path)
+        logging.info(f"Recorded manifest of data version {data_version} in {path}")
+    except OSError as e:
+        logging.warning(f"Can't record manifest of data version {data_version} in {path}: {e}")
+
+
+def load_version_manifest(versions_dir: Path, data_path: Path, data_version) -> Optional[Manifest]:
+    """
+    :return: the recorded manifest of an earlier data version, or None if there is none
+    """
+    if not VERSION_PATTERN.match(data_version or ''):
+        return None
+    return Manifest.read(data_path, version_manifest_path(versions_dir, data_version))
+
+
+def get_delta_names(text_format, meta_format, since, data_version, scheme=None) -> Tuple[str, str]:
+    """
+    :return: (internal_zip_name, user_facing_filename) of the delta from ``since`` to ``data_version``
+    """
+    internal_zip_name, user_facing_filename = get_bundle_names(text_format, meta_format, data_version, scheme)
+    return (
+        internal_zip_name.removesuffix('.zip') + f"_since_{since}.zip",
+        user_facing_filename.removesuffix(f"_{data_version}.zip") + f"_delta_{since}_to_{data_version}.zip",
+    )
+
+
+def _bundle_files(members: List[Tuple[str, Path]], root_folder) -> Dict[str, Tuple[str, Path]]:
+    """
+    :return: path within the bundle (without its versioned root folder) -> (arcname, file path)
+    """
+    files = {}
+    for arcname, path in members:
+        relative = Path(arcname).relative_to(root_folder).as_posix() if root_folder else arcname
+        files[relative] = (arcname, path)
+    return files
+
+
+def _content_hash(manifest: Manifest, path: Path) -> str:
+    return manifest.entries[manifest.relative(path)].sha256
+
+
+def get_delta_members(text_format, meta_format, old_manifest: Manifest, manifest: Manifest,
+                      file_type_paths: Dict[str, Path], since, data_version,
+                      scheme=None) -> Tuple[List[Tuple[str, Path]], Tuple[str, bytes]]:
+    """
+    Compares a bundle as it was in version ``since`` with the current one.
+    :return: the members whose content changed or that are new, and the
+    (arcname, body) of DELTA.json describing the change
+    """
+    full_bundle = is_full_bundle(text_format, meta_format)
+
+    def root_folder(version):
+        return get_bundle_names(text_format, meta_format, version, scheme)[1].removesuffix('.zip') if full_bundle else ''
+
+    old_files = _bundle_files(
+        get_bundle_members(text_format, meta_format, old_manifest, file_type_paths, since, scheme), root_folder(since)
+    )
+    new_files = _bundle_files(
+        get_bundle_members(text_format, meta_format, manifest, file_type_paths, data_version, scheme),
+        root_folder(data_version),
+    )
+
+    members, changed, added = [], [], []
+    for relative, (arcname, path) in new_files.items():
+        if relative not in old_files:
+            added.append(relative)
+        elif _content_hash(old_manifest, old_files[relative][1]) != _content_hash(manifest, path):
+            changed.append(relative)
+        else:
+            continue
+        members.append((arcname, path))
+    deleted = sorted(set(old_files) - set(new_files))
+
+    delta = {
+        'from': since,
+        'to': data_version,
+        'changed': changed,
+        'added': added,
+        'deleted': deleted,
+    }
+    delta_arcname = os.path.join(root_folder(data_version), DELTA_FILENAME) if full_bundle else DELTA_FILENAME
+    logging.info(
+        f"Delta {since} -> {data_version}: {len(changed)} changed, {len(added)} added, {len(deleted)} deleted"
+    )
+    return members, (delta_arcname, json.dumps(delta, ensure_ascii=False, indent=2).encode('utf-8'))
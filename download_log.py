@@ -0,0 +1,186 @@
+"""
+Download event store: SQLite in WAL mode, safe to append to from every
+gunicorn worker at once, with a buffered writer and a small query API.
+
+Usage: python download_log.py migrate [downloads.json]
+       python download_log.py stats --by {filename,country,day} [--since YYYY-MM-DD] [--until YYYY-MM-DD] [--limit N]
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+FIELDS = ["timestamp", "filename", "ip_address", "country", "region", "city", "file_size", "processing_time"]
+
+GROUPINGS = {
+    'filename': "filename",
+    'country': "country",
+    'day': "substr(timestamp, 1, 10)",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS downloads (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    ip_address TEXT,
+    country TEXT,
+    region TEXT,
+    city TEXT,
+    file_size INTEGER,
+    processing_time REAL
+);
+CREATE INDEX IF NOT EXISTS downloads_timestamp ON downloads (timestamp);
+CREATE INDEX IF NOT EXISTS downloads_filename ON downloads (filename, timestamp);
+CREATE INDEX IF NOT EXISTS downloads_country ON downloads (country, timestamp);
+CREATE TABLE IF NOT EXISTS migrations (
+    source TEXT PRIMARY KEY,
+    migrated_at TEXT NOT NULL,
+    entries INTEGER NOT NULL
+);
+"""
+
+
+class DownloadLog:
+    """
+    Buffers download entries in memory and appends them to the database in one
+    transaction once ``batch_size`` entries are pending or ``flush_interval``
+    seconds have passed since the last flush.
+    """
+
+    def __init__(self, db_path: Path, batch_size=100, flush_interval=5.0):
+        self.db_path = Path(db_path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        :return: this thread's connection (created on first use, and again after a fork)
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def append(self, entry: Dict):
+        with self._lock:
+            self._pending.append(tuple(entry.get(field) for field in FIELDS))
+            due = len(self._pending) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+        if not rows:
+            return
+        try:
+            conn = self.connect()
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO downloads ({', '.join(FIELDS)}) VALUES ({', '.join('?' * len(FIELDS))})",
+                    rows
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Error logging {len(rows)} downloads: {e}")
+
+    def migrate_json(self, json_path: Path) -> int:
+        """
+        Imports an old downloads.json array once; later calls for the same file are no-ops.
+        :return: number of entries imported
+        """
+        json_path = Path(json_path)
+        if not json_path.is_file():
+            return 0
+        source = str(json_path.resolve())
+        conn = self.connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")  # one worker migrates, the rest see the marker
+            if conn.execute("SELECT 1 FROM migrations WHERE source = ?", (source,)).fetchone():
+                return 0
+            with open(json_path, encoding='utf-8') as f:
+                entries = json.load(f)
+            conn.executemany(
+                f"INSERT INTO downloads ({', '.join(FIELDS)}) VALUES ({', '.join('?' * len(FIELDS))})",
+                (tuple(entry.get(field) for field in FIELDS) for entry in entries)
+            )
+            conn.execute(
+                "INSERT INTO migrations (source, migrated_at, entries) VALUES (?, ?, ?)",
+                (source, time.strftime("%Y-%m-%d %H:%M:%S"), len(entries))
+            )
+        if entries:
+            logging.info(f"Migrated {len(entries)} download entries from {json_path}")
+        return len(entries)
+
+    def count_by(self, grouping, since: Optional[str] = None, until: Optional[str] = None, limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        """
+        :param grouping: 'filename', 'country' or 'day'
+        :param since: inclusive lower bound on timestamp, e.g. '2025-01-01'
+        :param until: exclusive upper bound on timestamp
+        :return: (key, count) pairs, most downloads first
+        """
+        if grouping not in GROUPINGS:
+            raise ValueError(f"Unknown grouping {grouping!r}; expected one of {sorted(GROUPINGS)}")
+        column = GROUPINGS[grouping]
+        where, params = self._time_filter(since, until)
+        query = f"SELECT {column} AS key, COUNT(*) AS n FROM downloads {where} GROUP BY key ORDER BY n DESC, key"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        return self.connect().execute(query, params).fetchall()
+
+    def total(self, since: Optional[str] = None, until: Optional[str] = None) -> int:
+        where, params = self._time_filter(since, until)
+        return self.connect().execute(f"SELECT COUNT(*) FROM downloads {where}", params).fetchone()[0]
+
+    @staticmethod
+    def _time_filter(since, until):
+        clauses, params = [], []
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+if __name__ == "__main__":
+    from config import DOWNLOAD_LOG_DB_PATH, DOWNLOAD_LOG_JSON_PATH
+
+    parser = argparse.ArgumentParser(description="Query or migrate the download log.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subparsers.add_parser('migrate', help="import an old downloads.json array")
+    migrate_parser.add_argument('json_path', nargs='?', default=str(DOWNLOAD_LOG_JSON_PATH))
+    stats_parser = subparsers.add_parser('stats', help="download counts per file, country or day")
+    stats_parser.add_argument('--by', choices=sorted(GROUPINGS), default='filename')
+    stats_parser.add_argument('--since')
+    stats_parser.add_argument('--until')
+    stats_parser.add_argument('--limit', type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    download_log = DownloadLog(DOWNLOAD_LOG_DB_PATH)
+    if args.command == 'migrate':
+        print(f"Imported {download_log.migrate_json(Path(args.json_path))} entries")
+    else:
+        print(f"Total: {download_log.total(args.since, args.until)}")
+        for key, count in download_log.count_by(args.by, args.since, args.until, args.limit):
+            print(f"{count}\t{key}")
@@ -1,47 +1,105 @@
 import logging
 import os
 import time
+import unicodedata
 import json
+import html
+import itertools
 from pathlib import Path
-from typing import Dict
-import io
-import zipfile
-import xml.etree.ElementTree as ET
-
-from flask import Flask, request, send_file, render_template, abort, send_from_directory
-
-from utils import (
-    find_app_version, find_data_version, find_bundle_version,
-    get_geolocation, log_download,
-    load_metadata, process_metadata,
-    get_normalized_filename, calculate_all_sizes,
+from typing import Dict, Optional
+
+from flask import (
+    Flask, Response, request, send_file, render_template, abort, send_from_directory, url_for, jsonify, g,
+    before_render_template, template_rendered,
+)
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import safe_join
+
+from utils import find_app_version, get_normalized_filename
+from config import (
+    STATIC_FILES_PATH, DATA_PATH, METADATA_PATH, FILE_TYPE_PATHS, MANIFEST_PATH, MANIFEST_FALLBACK_PATH,
+    BUNDLE_CACHE_PATH, BUNDLE_CACHE_MAX_MB,
+    GEOIP_DB_PATH, GEOIP_HTTP_FALLBACK, GEOIP_HTTP_TIMEOUT, GEOIP_CACHE_SIZE, GEOIP_CACHE_TTL,
+    DOWNLOAD_LOG_DB_PATH, DOWNLOAD_LOG_JSON_PATH,
+    PAGE_CACHE_MAX_MB, SECTION_INDEX_PATH, LAZY_SECTIONS_MIN_KB, CORPUS_CHECK_INTERVAL, SNAPSHOT_PATH,
+    SEARCH_INDEX_PATH, SEARCH_MAX_LIMIT, CATALOG_MAX_LIMIT, PRECOMPRESSED_PATH, IO_POOL_SIZE, PASSAGE_INDEX_PATH,
+    TRANSLITERATION_CACHE_PATH, TRANSLITERATION_CACHE_MAX_MB, TRANSLITERATION_WORKERS, VERSION_MANIFESTS_PATH,
+    CONCORDANCE_INDEX_PATH, CONCORDANCE_MAX_LIMIT, CONCORDANCE_MAX_WIDTH, CONCORDANCE_RETRY_AFTER, TOKEN_EXPORT_PATH,
+    ALIGNMENT_PATH, METRICS_PATH,
+)
+from alignment import ensure_alignment
+from bundle_cache import BundleCache
+from download_log import DownloadLog
+from geolocation import DownloadEnricher, build_resolver
+from bundles import TOKENIZED_FORMAT, validate_bundle_formats, get_bundle_names, get_bundle_members
+from catalog import FACET_FIELDS, SORTABLE_FIELDS
+from concordance import ConcordanceIndex, is_concordance_index
+from corpus_state import CorpusState, load_or_build_snapshot
+from deltas import get_delta_members, get_delta_names, load_version_manifest, record_version_manifest
+from http_cache import PageCache, make_cached_page, cached_page_response
+from io_pool import IOPool, IOPoolMiddleware
+from metrics import REGISTRY, MetricsMiddleware, collect
+from search_index import SearchIndex, ensure_search_index, normalize_query
+from tokenized_corpus import ensure_token_export
+from passage_index import find_passage, get_passage_index, passage_text, read_passage
+from prebuild import start_prebuild
+from section_index import get_section_index, read_range
+from static_files import send_data_file
+from transliteration import (
+    SCHEMES, CONVERTIBLE_TYPES, canonical_scheme, conversion_key, converted_filename,
+    iter_converted_lines, iter_converted_members,
 )
+from zip_stream import stream_zip
 
-STATIC_FILES_PATH = Path('./static')
-DATA_PATH = Path(os.getenv('DATA_PATH', str(STATIC_FILES_PATH / 'data')))
-METADATA_PATH = DATA_PATH / 'metadata' / 'transforms'
-FILE_TYPE_PATHS = {
-    'txt': DATA_PATH / 'texts' / 'project_editions' / 'txt',
-    'xml': DATA_PATH / 'texts' / 'project_editions' / 'xml',
-    'html_plain': DATA_PATH / 'texts' / 'transforms' / 'html' / 'plain',
-    'html_rich': DATA_PATH / 'texts' / 'transforms' / 'html' / 'rich',
-    'original': DATA_PATH / 'texts' / 'original_submissions',
-    'md': DATA_PATH / 'metadata' / 'markdown',
-    'html': DATA_PATH / 'metadata' / 'transforms' / 'html',
-    'json': METADATA_PATH / 'metadata.json'
-}
-RAW_METADATA: Dict = load_metadata(METADATA_PATH)
-CUSTOM_METADATA = process_metadata(RAW_METADATA)
 DISPLAY_FIELDS = ['Title', 'Author', 'Edition', 'Genre', 'Size (kb)', '', '', '']
-NUM_ITEMS = len(CUSTOM_METADATA)
-
 APP_VERSION = find_app_version()
-DATA_VERSION = find_data_version()
-BUNDLE_VERSION = find_bundle_version()
-FILE_GROUP_SIZES_MB, TOTAL_CORPUS_SIZE_MB, PLAIN_TEXT_SIZE_MB = calculate_all_sizes(FILE_TYPE_PATHS, DATA_PATH)
+
+# Metadata, sizes, manifest and data version; reloaded when static/data/VERSION changes
+corpus = CorpusState(
+    lambda: load_or_build_snapshot(
+        SNAPSHOT_PATH, DATA_PATH, METADATA_PATH, FILE_TYPE_PATHS, MANIFEST_PATH, MANIFEST_FALLBACK_PATH
+    ),
+    DATA_PATH / 'VERSION',
+    CORPUS_CHECK_INTERVAL,
+)
 
 app = Flask(__name__)
-app.cache = {}  # In-memory cache for generated zip files
+io_pool = IOPool(IO_POOL_SIZE)  # only used with gevent workers (WORKER_MODE=async)
+app.wsgi_app = MetricsMiddleware(IOPoolMiddleware(app.wsgi_app, io_pool))  # timed until the body is sent
+REGISTRY.configure(METRICS_PATH)
+app.cache = BundleCache(BUNDLE_CACHE_PATH, BUNDLE_CACHE_MAX_MB * 1024 * 1024)  # Shared on-disk cache for generated zip files
+app.transliteration_cache = BundleCache(  # Converted texts, see transliterate_file
+    TRANSLITERATION_CACHE_PATH, TRANSLITERATION_CACHE_MAX_MB * 1024 * 1024, suffix='.out'
+)
+page_cache = PageCache(PAGE_CACHE_MAX_MB * 1024 * 1024)  # Rendered text viewer pages
+download_log = DownloadLog(DOWNLOAD_LOG_DB_PATH)
+download_log.migrate_json(DOWNLOAD_LOG_JSON_PATH)
+download_enricher = DownloadEnricher(lambda: build_resolver(
+    GEOIP_DB_PATH, GEOIP_HTTP_FALLBACK, GEOIP_HTTP_TIMEOUT, GEOIP_CACHE_SIZE, GEOIP_CACHE_TTL
+), download_log)
+
+search_indexes: Dict[str, SearchIndex] = {}  # by data version, memory-mapped on first search
+concordance_indexes: Dict[str, ConcordanceIndex] = {}  # likewise
+
+# File list of every data version served, for delta bundles
+record_version_manifest(VERSION_MANIFESTS_PATH, corpus.snapshot.data_version, corpus.snapshot.manifest)
+
+
+@corpus.on_swap
+def drop_old_version(old, new):
+    """
+    After a data reload, forget what was keyed to the old data version, record
+    the new one's file list and prebuild for it. Disk caches keyed by version
+    just age out. Every worker swaps, but only the first to get here starts the
+    prebuild; the snapshot itself was built once and shared through SNAPSHOT_PATH.
+    """
+    if old.data_version != new.data_version:
+        page_cache.discard(lambda key: key[-1] == old.data_version)
+        search_indexes.pop(old.data_version, None)
+        concordance_indexes.pop(old.data_version, None)
+    record_version_manifest(VERSION_MANIFESTS_PATH, new.data_version, new.manifest)
+    if os.getenv('PREBUILD_BUNDLES', '1') == '1':
+        start_prebuild()
 
 # Configure logging
 logging.basicConfig(
@@ -50,46 +108,112 @@ logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+@app.before_request
+def label_route():
+    request.environ['hansel.route'] = request.endpoint  # for MetricsMiddleware
+
+
+@before_render_template.connect_via(app)
+def start_render_span(sender, template, context, **extra):
+    g.setdefault('render_starts', []).append(time.perf_counter())
+
+
+@template_rendered.connect_via(app)
+def end_render_span(sender, template, context, **extra):
+    elapsed = time.perf_counter() - g.render_starts.pop()
+    REGISTRY.observe('hansel_span_duration_seconds', elapsed, {'span': 'template_render'})
+
+
+@app.route('/metrics')
+def metrics():
+    """
+    Prometheus metrics of all workers: request latency by route, time spent in
+    zip building, file reads, template rendering and geolocation, bundle cache
+    activity and requests in flight.
+    """
+    REGISTRY.flush()
+    return Response(collect(METRICS_PATH), mimetype='text/plain; version=0.0.4')
+
 @app.route('/robots.txt')
 def robots():
     return send_from_directory(app.static_folder, 'robots.txt')
 
-@app.route(f"/{STATIC_FILES_PATH}/<path:filename>")
+@app.route(f"/{STATIC_FILES_PATH}/data/<path:filename>")
 def serve_file(filename):
     """
     Serve ANY file under the /static/data/... URL, including subdirectories.
-    Logs the download details as needed.
+    (This rule is more specific than Flask's own /static route, so it wins.)
+    Files are looked up in the corpus manifest and sent precompressed where
+    possible; see static_files.send_data_file. URLs tagged with the current
+    data version (?v=...) may be cached forever.
+    Logs the download details as needed; geolocation and logging happen on a
+    background queue so the response only costs file-serving time.
     """
     start_time = time.time()
     client_ip  = request.remote_addr
+    state = corpus.snapshot
 
     normalized_filename = get_normalized_filename(filename)
-    file_path = os.path.join(STATIC_FILES_PATH, normalized_filename)
+    file_path = safe_join(str(DATA_PATH), normalized_filename)
+    entry = state.manifest.entry(file_path) if file_path else None
 
-    if not os.path.isfile(file_path):
-        logging.error(f"File not found: {file_path}")
+    if entry is None:
+        logging.error(f"File not found: {normalized_filename}")
         abort(404, description="File not found")
 
-    file_size = os.path.getsize(file_path)
-    country, region, city = get_geolocation(client_ip)
-    processing_time = time.time() - start_time
-    log_download(
-        normalized_filename,
-        client_ip,
-        country,
-        region,
-        city,
-        file_size,
-        processing_time
+    as_attachment_flag = normalized_filename.lower().endswith(".zip")
+    response = send_data_file(
+        file_path, entry, PRECOMPRESSED_PATH,
+        immutable=request.args.get('v') == state.data_version, as_attachment=as_attachment_flag,
     )
+    if response.status_code == 304:
+        return response
+
+    file_size = entry.size
+    processing_time = time.time() - start_time
+    download_enricher.submit(normalized_filename, client_ip, file_size, processing_time)
     logging.info(
-        f"Served {normalized_filename} (size {file_size}) "
+        f"Served {normalized_filename} (size {file_size}, {response.headers.get('Content-Encoding', 'identity')}) "
         f"to {client_ip} in {processing_time:.2f} seconds"
     )
+    return response
 
-    as_attachment_flag = normalized_filename.lower().endswith(".zip")
-
-    return send_file(file_path, as_attachment=as_attachment_flag)
+@app.route("/transliterate/<file_type>/<filename>")
+def transliterate_file(file_type, filename):
+    """
+    Serve a txt or html_plain text converted from IAST into the scheme given
+    by the ``scheme`` query parameter. The conversion is streamed line by line
+    and kept in a bounded disk cache keyed by file hash, scheme and data version.
+    """
+    scheme = canonical_scheme(request.args.get('scheme'))
+    if not scheme:
+        abort(400, f"A valid scheme is required. Choose from: {', '.join(SCHEMES)}.")
+    if file_type not in CONVERTIBLE_TYPES:
+        abort(404, description=f"Transliteration is only available for: {', '.join(CONVERTIBLE_TYPES)}")
+
+    file_path = safe_join(str(FILE_TYPE_PATHS[file_type]), filename)
+    if not file_path or not os.path.isfile(file_path) or not file_path.endswith(CONVERTIBLE_TYPES[file_type]):
+        abort(404, description="File not found")
+    file_path = Path(file_path)
+    download_name = converted_filename(file_path.name, scheme)
+    mimetype = 'text/html' if file_type == 'html_plain' else 'text/plain'
+
+    if scheme == 'iast':
+        return send_file(file_path, mimetype=mimetype, download_name=download_name)
+
+    state = corpus.snapshot
+    cache = app.transliteration_cache
+    cache_key = conversion_key(state.manifest.sha256(file_path), scheme, state.data_version)
+    cached_path, build_lock = cache.get_or_lock(cache_key)
+    if cached_path:
+        return send_file(cached_path, mimetype=mimetype, download_name=download_name)
+
+    logging.info(f"Converting {file_path.name} to {scheme}")
+    return Response(
+        cache.store(cache_key, iter_converted_lines(file_path, file_type, scheme), build_lock),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'inline; filename="{download_name}"'},
+    )
 
 @app.route("/texts/transforms/html/rich/<filename>")
 def view_text(filename):
@@ -98,6 +222,9 @@ def view_text(filename):
     UI chrome (toggles, metadata panel, etc.) lives only in the app.
     Falls back to serving the static file directly if the new context marker
     is missing to preserve compatibility with older exports.
+    Rendered pages are cached per text, file mtimes and data version, in every
+    content coding, and revalidated with ETag/Last-Modified. Large texts are
+    sent with their first section only; view_text_section serves the rest.
     """
     # The HTML file contains the content, the JSON file contains the context.
     # Both are named after the original XML file.
@@ -105,12 +232,36 @@ def view_text(filename):
     html_path = FILE_TYPE_PATHS['html_rich'] / f"{base_name}.html"
     json_path = FILE_TYPE_PATHS['html_rich'] / f"{base_name}.json"
 
-    if not html_path.is_file() or not json_path.is_file():
+    try:
+        html_stat = html_path.stat()
+        json_stat = json_path.stat()
+    except FileNotFoundError:
         abort(404, description="Text not found")
 
-    # Read the HTML content
-    with open(html_path, 'r', encoding='utf-8') as f:
-        content_html = f.read()
+    data_version = corpus.snapshot.data_version
+    cache_key = (base_name, html_stat.st_mtime_ns, json_stat.st_mtime_ns, data_version)
+    page = page_cache.get(cache_key)
+    if page is None:
+        body = render_text_viewer(filename, base_name, html_path, json_path, data_version).encode('utf-8')
+        page = make_cached_page(body, max(html_stat.st_mtime, json_stat.st_mtime))
+        page_cache.put(cache_key, page)
+
+    return cached_page_response(page)
+
+
+def render_text_viewer(filename, base_name, html_path, json_path, data_version):
+    # Read the HTML content, or just its first section if it's large
+    section_index = None
+    with REGISTRY.span('file_read'):
+        if html_path.stat().st_size >= LAZY_SECTIONS_MIN_KB * 1024:
+            section_index = get_section_index(SECTION_INDEX_PATH / data_version, html_path, json_path)
+        if section_index and len(section_index['sections']) > 1:
+            content_html = compose_lazy_content(html_path, section_index)
+            sections_url = f"{url_for('view_text', filename=filename)}/sections"
+        else:
+            with open(html_path, 'r', encoding='utf-8') as f:
+                content_html = f.read()
+            sections_url = None
 
     # Read the JSON context
     try:
@@ -121,7 +272,7 @@ def view_text(filename):
         raw_context = {} # Fallback to empty context
 
     context_defaults = {
-        "title": Path(filename).stem,
+        "title": base_name,
         "toc": [],
         "metadata_html": "",
         "metadata_entries": [],
@@ -142,8 +293,49 @@ def view_text(filename):
         context_json=context_json,
         static_files_path=STATIC_FILES_PATH,
         filename=filename,
+        sections_url=sections_url,
     )
 
+
+def compose_lazy_content(html_path, section_index):
+    """
+    The content wrapper and first section, with an empty placeholder for each later section.
+    """
+    sections = section_index['sections']
+    parts = [read_range(html_path, [0, sections[0]['end']])]
+    for i, section in enumerate(sections[1:], start=1):
+        section_id = html.escape(section['id'], quote=True)
+        parts.append(
+            f'<div class="lazy-section" data-section-index="{i}" data-section-id="{section_id}"></div>'.encode('utf-8')
+        )
+    parts.append(read_range(html_path, section_index['tail']))
+    return b''.join(parts).decode('utf-8')
+
+
+@app.route("/texts/transforms/html/rich/<filename>/sections/<int:index>")
+def view_text_section(filename, index):
+    """
+    Serve one section of a rich HTML text as an HTML fragment, read with a seek
+    into the file at the byte range recorded in its section index.
+    """
+    base_name = Path(filename).stem
+    html_path = FILE_TYPE_PATHS['html_rich'] / f"{base_name}.html"
+    json_path = FILE_TYPE_PATHS['html_rich'] / f"{base_name}.json"
+    if not html_path.is_file() or not json_path.is_file():
+        abort(404, description="Text not found")
+
+    section_index = get_section_index(SECTION_INDEX_PATH / corpus.snapshot.data_version, html_path, json_path)
+    if not section_index or not 0 <= index < len(section_index['sections']):
+        abort(404, description="Section not found")
+
+    section = section_index['sections'][index]
+    with REGISTRY.span('file_read'):
+        body = read_range(html_path, [section['start'], section['end']])
+    response = Response(body, mimetype='text/html')
+    response.set_etag(f"{section_index['mtime_ns']}-{section_index['size']}-{index}")
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
 @app.route('/view_metadata/<filename>')
 def view_metadata(filename):
     # Construct the path to the HTML file
@@ -164,6 +356,12 @@ def download_bundle():
     """
     Dynamically creates and serves a zip file of texts and metadata.
     Can be a full bundle of all data, or a custom bundle based on user selection.
+    The archive is streamed as it is compressed, so memory use and time to first
+    byte do not grow with the size of the bundle. Finished archives are kept in a
+    disk cache shared by all workers and served from there on later requests.
+    An optional ``scheme`` transliterates the txt and html_plain texts, converting
+    them in parallel across a process pool. With ``since`` (an earlier data
+    version), only the files changed since then are included, plus DELTA.json.
     """
     data = request.get_json()
     if not data:
@@ -171,140 +369,351 @@ def download_bundle():
 
     text_format = data.get('text')
     meta_format = data.get('metadata')
-    is_full_bundle = text_format == 'all' and meta_format == 'all'
+    scheme = data.get('scheme')
+    since = data.get('since')
 
     # --- Validation ---
-    if not meta_format or (meta_format != 'all' and meta_format not in FILE_TYPE_PATHS):
-        abort(400, "A valid metadata format is required.")
-    if not text_format or (text_format != 'all' and text_format != 'none' and text_format not in FILE_TYPE_PATHS):
-        abort(400, "Invalid text format specified.")
-
-    # --- Set up filenames and cache keys ---
-    if is_full_bundle:
-        internal_zip_name = f'hansel_all_{DATA_VERSION}.zip'
-        user_facing_filename = f"hansel_download_all_{DATA_VERSION}.zip"
-        root_folder_name = user_facing_filename.removesuffix('.zip')
+    if scheme:
+        scheme = canonical_scheme(scheme)
+        if not scheme:
+            abort(400, f"Invalid scheme specified. Choose from: {', '.join(SCHEMES)}.")
+        if scheme == 'iast':
+            scheme = None  # the corpus is already in IAST
+    error = validate_bundle_formats(text_format, meta_format, FILE_TYPE_PATHS, scheme)
+    if error:
+        abort(400, error)
+    if since and text_format == TOKENIZED_FORMAT:
+        abort(400, "Delta bundles are not available for the tokenized corpus.")
+
+    state = corpus.snapshot
+    old_manifest = None
+    if since:
+        old_manifest = load_version_manifest(VERSION_MANIFESTS_PATH, DATA_PATH, str(since))
+        if old_manifest is None:
+            abort(404, f"No file list is recorded for data version {since}; download the full bundle instead.")
+        internal_zip_name, user_facing_filename = get_delta_names(
+            text_format, meta_format, since, state.data_version, scheme
+        )
     else:
-        cache_key_parts = []
-        if text_format and text_format != 'none':
-            cache_key_parts.append(f"text-{text_format}")
-        cache_key_parts.append(f"meta-{meta_format}")
-        cache_key_base = "_".join(cache_key_parts)
-        internal_zip_name = f'hansel_bundle_{cache_key_base}_{DATA_VERSION}.zip'
-
-        name_parts = ['hansel_download']
-        if text_format and text_format != 'none':
-            name_parts.append(f"text_{text_format}")
-        name_parts.append(f"metadata_{meta_format}")
-        name_parts.append(DATA_VERSION)
-        user_facing_filename = "_".join(name_parts) + ".zip"
+        internal_zip_name, user_facing_filename = get_bundle_names(text_format, meta_format, state.data_version, scheme)
 
     # --- Caching ---
-    if internal_zip_name in app.cache:
+    cache_key = app.cache.key(internal_zip_name, state.data_version)
+    cached_path, build_lock = io_pool.run(app.cache.get_or_lock, cache_key)
+    if cached_path:
         logging.info(f"Serving cached file: {internal_zip_name} as {user_facing_filename}")
-        file_to_send = io.BytesIO(app.cache[internal_zip_name])
         return send_file(
-            file_to_send,
+            cached_path,
             as_attachment=True,
             download_name=user_facing_filename,
             mimetype='application/zip'
         )
 
-    logging.info(f"Cache miss for {internal_zip_name}. Generating new zip file.")
-
-    # --- Zip file creation ---
-    memory_file = io.BytesIO()
-    with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-        # Add VERSION file
-        version_file_path = DATA_PATH / 'VERSION'
-        if version_file_path.is_file():
-            arcname = os.path.join(root_folder_name, 'VERSION') if is_full_bundle else 'VERSION'
-            zf.write(version_file_path, arcname=arcname)
-
-        if is_full_bundle:
-            # Define the specific text directories to include
-            text_dirs_to_include = {
-                DATA_PATH / 'texts' / 'original_submissions': None,  # Include all files
-                DATA_PATH / 'texts' / 'project_editions' / 'txt': ['.txt'],
-                DATA_PATH / 'texts' / 'project_editions' / 'xml': ['.xml'],
-                DATA_PATH / 'texts' / 'transforms' / 'html' / 'plain': ['.html'],
-            }
-
-            # Add specified text files
-            for dir_path, extensions in text_dirs_to_include.items():
-                if dir_path.is_dir():
-                    for file_path in dir_path.rglob('*'):
-                        if file_path.is_file():
-                            if extensions is None or file_path.suffix in extensions:
-                                relative_path = file_path.relative_to(DATA_PATH)
-                                new_arcname = os.path.join(root_folder_name, relative_path)
-                                zf.write(file_path, arcname=new_arcname)
-
-            # Add all metadata
-            meta_dir = DATA_PATH / 'metadata'
-            if meta_dir.is_dir():
-                for file_path in meta_dir.rglob('*'):
-                    if file_path.is_file() and file_path.suffix != '.zip':
-                        relative_path = file_path.relative_to(DATA_PATH)
-                        new_arcname = os.path.join(root_folder_name, relative_path)
-                        zf.write(file_path, arcname=new_arcname)
+    logging.info(f"Cache miss for {internal_zip_name}. Generating new zip file"
+                 f"{'' if build_lock else ' (another worker is caching it)'}.")
+    try:
+        if old_manifest is not None:
+            members, delta_member = get_delta_members(
+                text_format, meta_format, old_manifest, state.manifest, FILE_TYPE_PATHS, since, state.data_version, scheme
+            )
         else:
-            # Add selected text format
-            if text_format and text_format != 'none':
-                text_path = FILE_TYPE_PATHS[text_format]
-                if text_path.is_dir():
-                    for file_path in sorted(text_path.rglob('*')):
-                        if file_path.is_file():
-                            zf.write(file_path, arcname=f"text/{file_path.name}")
-
-            # Add selected metadata format
-            meta_path = FILE_TYPE_PATHS[meta_format]
-            if meta_path.is_file():
-                zf.write(meta_path, arcname=f"metadata/{meta_path.name}")
-            elif meta_path.is_dir():
-                if meta_format == 'md':
-                    for file_path in sorted(meta_path.glob('*.md')):
-                        if file_path.is_file():
-                            zf.write(file_path, arcname=f"metadata/{file_path.name}")
-                else:
-                    for file_path in sorted(meta_path.rglob('*')):
-                        if file_path.is_file() and file_path.suffix != '.zip':
-                            zf.write(file_path, arcname=f"metadata/{file_path.name}")
-
-    app.cache[internal_zip_name] = memory_file.getvalue()
-    memory_file.seek(0)
-
-    return send_file(
-        memory_file,
-        as_attachment=True,
-        download_name=user_facing_filename,
-        mimetype='application/zip'
+            token_export_dir = TOKEN_EXPORT_PATH / state.data_version
+            if text_format == TOKENIZED_FORMAT:
+                io_pool.run(ensure_token_export, token_export_dir, FILE_TYPE_PATHS['txt'], FILE_TYPE_PATHS['html_rich'],
+                            state.data_version)
+            members, delta_member = get_bundle_members(
+                text_format, meta_format, state.manifest, FILE_TYPE_PATHS, state.data_version, scheme, token_export_dir
+            ), None
+    except Exception:
+        if build_lock:
+            build_lock.release()
+        raise
+    if scheme:
+        # gevent workers can't fork from the I/O pool, so they convert in-process there
+        workers = 1 if io_pool.enabled else TRANSLITERATION_WORKERS
+        members = iter_converted_members(members, scheme, FILE_TYPE_PATHS, workers)
+    if delta_member:
+        members = itertools.chain(members, [delta_member])
+
+    return Response(
+        app.cache.store(cache_key, REGISTRY.timed_chunks('zip_build', stream_zip(members)), build_lock),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{user_facing_filename}"'},
+    )
+
+
+def get_search_index(data_version) -> SearchIndex:
+    if data_version not in search_indexes:
+        index_dir = SEARCH_INDEX_PATH / data_version
+        ensure_search_index(index_dir, FILE_TYPE_PATHS['txt'])
+        search_indexes[data_version] = SearchIndex(index_dir)
+    return search_indexes[data_version]
+
+
+@app.route("/search")
+def search():
+    """
+    Full-text search over the project editions, insensitive to transliteration
+    scheme, spacing and sandhi boundaries.
+    Query parameters: q, scheme (optional, detected if absent), limit, offset.
+    """
+    query = request.args.get('q', '').strip()
+    scheme = request.args.get('scheme') or None
+    limit = min(request.args.get('limit', 20, type=int), SEARCH_MAX_LIMIT)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    if not query:
+        abort(400, "Missing query parameter 'q'.")
+    if scheme and not canonical_scheme(scheme):
+        abort(400, f"Unknown scheme '{scheme}'. Choose from: {', '.join(SCHEMES)}.")
+
+    start_time = time.time()
+    state = corpus.snapshot
+    letters = normalize_query(query, scheme)
+    results = get_search_index(state.data_version).search(letters, limit=max(limit, 0), offset=offset)
+    for hit in results['hits']:
+        hit['title'] = state.titles_by_filename_base.get(hit['text'], hit['text'])
+    results.update({
+        'query': query,
+        'normalized': letters,
+        'offset': offset,
+        'limit': limit,
+        'data_version': state.data_version,
+        'time_ms': round((time.time() - start_time) * 1000, 2),
+    })
+    return jsonify(results)
+
+
+def get_concordance_index(data_version) -> Optional[ConcordanceIndex]:
+    """
+    :return: the index built by prebuild.py, or None until it is there (building it takes too long for a request)
+    """
+    if data_version not in concordance_indexes:
+        index_dir = CONCORDANCE_INDEX_PATH / data_version
+        if not is_concordance_index(index_dir):
+            return None
+        concordance_indexes[data_version] = ConcordanceIndex(index_dir)
+    return concordance_indexes[data_version]
+
+
+@app.route("/api/concordance")
+def concordance_api():
+    """
+    Keyword in context: every exact occurrence of a string in the project
+    editions (IAST, case-sensitive), with per-text counts.
+    Query parameters: q, width (characters of context), sort (context|position), limit, offset.
+    """
+    query = request.args.get('q', '')
+    width = min(max(request.args.get('width', 40, type=int), 0), CONCORDANCE_MAX_WIDTH)
+    sort = request.args.get('sort', 'context')
+    limit = min(max(request.args.get('limit', 20, type=int), 0), CONCORDANCE_MAX_LIMIT)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    if not query.strip():
+        abort(400, "Missing query parameter 'q'.")
+    if sort not in ('context', 'position'):
+        abort(400, "Invalid sort. Choose from: context, position.")
+
+    start_time = time.time()
+    state = corpus.snapshot
+    index = get_concordance_index(state.data_version)
+    if index is None:
+        raise ServiceUnavailable("The concordance index is still being built; try again later.",
+                                 retry_after=CONCORDANCE_RETRY_AFTER)
+    results = index.search(
+        query, width=width, limit=limit, offset=offset, by_position=sort == 'position'
     )
+    for hit in results['hits']:
+        hit['title'] = state.titles_by_filename_base.get(hit['text'], hit['text'])
+    results.update({
+        'query': query,
+        'width': width,
+        'sort': sort,
+        'offset': offset,
+        'limit': limit,
+        'data_version': state.data_version,
+        'time_ms': round((time.time() - start_time) * 1000, 2),
+    })
+    return jsonify(results)
+
+
+COLLATION_FORMATS = ('json', 'html')
+
+
+@app.route("/api/collation/<text_a>/<text_b>")
+def collation_api(text_a, text_b):
+    """
+    Variant apparatus of two project edition texts, typically recensions of one
+    work (e.g. /api/collation/zukasaptati_o/zukasaptati_s): which sections are
+    parallel and every stretch where the texts differ. Collations are made once
+    per data version, at prebuild time for recensions or on first request.
+    Query parameters: format (json or html).
+    """
+    output_format = request.args.get('format', 'json')
+    if output_format not in COLLATION_FORMATS:
+        abort(400, f"Invalid format. Choose from: {', '.join(COLLATION_FORMATS)}.")
+    if text_a == text_b:
+        abort(400, "Choose two different texts.")
+    txt_path = FILE_TYPE_PATHS['txt']
+    for text in (text_a, text_b):
+        if safe_join(str(txt_path), f"{text}.txt") is None or not (txt_path / f"{text}.txt").is_file():
+            abort(404, description=f"Text {text} not found")
+
+    state = corpus.snapshot
+    path = io_pool.run(ensure_alignment, ALIGNMENT_PATH / state.data_version, txt_path, text_a, text_b)
+    if output_format == 'json':
+        return send_file(path, mimetype='application/json', conditional=True, etag=True)
+    with open(path, encoding='utf-8') as f:
+        collation = json.load(f)
+    return render_template(
+        'collation.html',
+        collation=collation,
+        title_a=state.titles_by_filename_base.get(text_a, text_a),
+        title_b=state.titles_by_filename_base.get(text_b, text_b),
+    )
+
+
+@app.route("/api/catalog")
+def catalog_api():
+    """
+    One page of the catalog, sorted and filtered on the server.
+    Query parameters: offset, limit, sort (a column name), order (asc/desc),
+    q (substring search), and any number of genre, author and edition values.
+    Requests from a DataTables table in server-side mode (with ``draw``) are
+    answered in DataTables' format.
+    """
+    state = corpus.snapshot
+    catalog = state.catalog
+    args = request.args
+    datatables = 'draw' in args
+
+    if datatables:
+        offset = args.get('start', 0, type=int)
+        limit = args.get('length', 10, type=int)
+        column = args.get('order[0][column]', 0, type=int)
+        sort_field = DISPLAY_FIELDS[column] if 0 <= column < len(DISPLAY_FIELDS) else 'Title'
+        descending = args.get('order[0][dir]') == 'desc'
+        search = args.get('search[value]', '').strip()
+    else:
+        offset = args.get('offset', 0, type=int)
+        limit = args.get('limit', 20, type=int)
+        sort_field = args.get('sort', 'Title')
+        descending = args.get('order', 'asc') == 'desc'
+        search = args.get('q', '').strip()
+    if sort_field not in SORTABLE_FIELDS:
+        abort(400, f"Can't sort by '{sort_field}'. Choose from: {', '.join(SORTABLE_FIELDS)}.")
+    offset = max(offset, 0)
+    limit = CATALOG_MAX_LIMIT if limit < 0 else min(limit, CATALOG_MAX_LIMIT)
+    filters = {field: args.getlist(field.lower()) for field in FACET_FIELDS if args.getlist(field.lower())}
+
+    mask = catalog.mask(filters, search)
+    rows = catalog.page(mask, sort_field, descending, offset, limit)
+    if datatables:
+        return jsonify({
+            'draw': args.get('draw', 0, type=int),
+            'recordsTotal': len(catalog.rows),
+            'recordsFiltered': mask.bit_count(),
+            'data': rows,
+        })
+    return jsonify({
+        'data_version': state.data_version,
+        'total': len(catalog.rows),
+        'matched': mask.bit_count(),
+        'offset': offset,
+        'limit': limit,
+        'sort': sort_field,
+        'order': 'desc' if descending else 'asc',
+        'rows': rows,
+        'facets': catalog.facet_counts(filters, search),
+    })
+
+
+PASSAGE_FORMATS = {'xml': 'application/xml', 'text': 'text/plain', 'json': 'application/json'}
+
+
+def load_passage_index(text):
+    """
+    :return: (path of the TEI edition, its passage index, its manifest entry); aborts with 404 if there is no such text
+    """
+    state = corpus.snapshot
+    xml_path = safe_join(str(FILE_TYPE_PATHS['xml']), get_normalized_filename(f"{text}.xml"))
+    entry = state.manifest.entry(xml_path) if xml_path else None
+    if entry is None:
+        abort(404, description=f"No TEI edition of {text}")
+    return Path(xml_path), get_passage_index(PASSAGE_INDEX_PATH / state.data_version, Path(xml_path)), entry
+
+
+@app.route("/api/passage/<text>")
+def passage_list_api(text):
+    """
+    Lists the citable passages of a TEI edition in document order.
+    """
+    _, index, _ = load_passage_index(text)
+    passages = sorted(index['ids'].items(), key=lambda item: item[1][0])
+    return jsonify({
+        'text': text,
+        'passages': [{'id': element_id, 'tag': tag, 'n': n} for element_id, (_, _, tag, n) in passages],
+    })
+
+
+@app.route("/api/passage/<text>/<ref>")
+def passage_api(text, ref):
+    """
+    Returns one passage of a TEI edition, cited by its xml:id (e.g. v1_2) or by the
+    n of a div, lg or p (e.g. 1.2), as ``format`` xml (default), text or json.
+    Only the passage's own bytes are read, via the edition's passage index.
+    """
+    output_format = request.args.get('format', 'xml')
+    if output_format not in PASSAGE_FORMATS:
+        abort(400, f"Invalid format. Choose from: {', '.join(PASSAGE_FORMATS)}.")
+    xml_path, index, file_entry = load_passage_index(text)
+    found = find_passage(index, unicodedata.normalize('NFC', ref))
+    if found is None:
+        abort(404, description=f"No passage {ref} in {text}")
+    element_id, entry = found
+    passage = read_passage(xml_path, entry)
+
+    if output_format == 'xml':
+        response = Response(passage, mimetype=PASSAGE_FORMATS['xml'])
+    elif output_format == 'text':
+        response = Response(passage_text(passage), mimetype=PASSAGE_FORMATS['text'])
+    else:
+        response = jsonify({
+            'text': text,
+            'ref': ref,
+            'id': element_id,
+            'tag': entry[2],
+            'n': entry[3],
+            'xml': passage.decode('utf-8'),
+            'plain': passage_text(passage),
+        })
+    response.set_etag(f"{file_entry.sha256[:32]}-{entry[0]}-{output_format}")
+    return response.make_conditional(request)
 
 
 @app.route("/")
 def index():
+    state = corpus.snapshot
     return render_template(
         "index.html",
         static_files_path=STATIC_FILES_PATH,
-        metadata=CUSTOM_METADATA,
-        rows=CUSTOM_METADATA,
+        data_version=state.data_version,
+        list_page_size=CATALOG_MAX_LIMIT,  # the list view fetches its rows from /api/catalog page by page
         display_fields=DISPLAY_FIELDS,
-        file_group_sizes_mb=FILE_GROUP_SIZES_MB,
-        total_corpus_size_mb=TOTAL_CORPUS_SIZE_MB
+        file_group_sizes_mb=state.file_group_sizes_mb,
+        total_corpus_size_mb=state.total_corpus_size_mb
     )
 
 
 @app.route("/about")
 def about():
+    state = corpus.snapshot
     return render_template(
         "about.html",
         static_files_path=STATIC_FILES_PATH,
         app_version = APP_VERSION,
-        data_version = DATA_VERSION,
-        bundle_version = BUNDLE_VERSION,
-        num_items = NUM_ITEMS,
-        plain_text_size_mb = PLAIN_TEXT_SIZE_MB,
+        data_version = state.data_version,
+        bundle_version = state.bundle_version,
+        num_items = state.num_items,
+        plain_text_size_mb = state.plain_text_size_mb,
     )
 
 @app.route("/progress")
@@ -0,0 +1,196 @@
+import atexit
+import bisect
+import collections
+import csv
+import ipaddress
+import logging
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import REGISTRY
+
+UNKNOWN_LOCATION = ("Unknown", "Unknown", "Unknown")
+
+Location = Tuple[str, str, str]
+
+
+class LocalRangeResolver:
+    """
+    Looks up IPs in a local CSV of address ranges with the header
+    ``start_ip,end_ip,country,region,city`` (IPv4 and IPv6 may be mixed).
+    """
+
+    def __init__(self, db_path: Path):
+        rows = []
+        with open(db_path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                start = int(ipaddress.ip_address(row['start_ip']))
+                end = int(ipaddress.ip_address(row['end_ip']))
+                rows.append((start, end, (row.get('country') or "Unknown", row.get('region') or "Unknown", row.get('city') or "Unknown")))
+        rows.sort()
+        self._starts = [start for start, _, _ in rows]
+        self._ends = [end for _, end, _ in rows]
+        self._locations = [location for _, _, location in rows]
+        logging.info(f"Loaded {len(rows)} IP ranges from {db_path}")
+
+    def resolve(self, ip_address) -> Optional[Location]:
+        try:
+            ip = int(ipaddress.ip_address(ip_address))
+        except ValueError:
+            return None
+        i = bisect.bisect_right(self._starts, ip) - 1
+        if i >= 0 and ip <= self._ends[i]:
+            return self._locations[i]
+        return None
+
+
+class HttpResolver:
+    """
+    Queries ipinfo.io over a pooled keep-alive session, with a timeout.
+    """
+
+    def __init__(self, timeout=2.0, token=None):
+        self.timeout = timeout
+        self.token = token
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+    def resolve(self, ip_address) -> Optional[Location]:
+        params = {'token': self.token} if self.token else None
+        try:
+            response = self.session.get(f"https://ipinfo.io/{ip_address}/json", params=params, timeout=self.timeout)
+        except requests.RequestException as e:
+            logging.error(f"Geolocation error for IP {ip_address}: {e}")
+            return None
+        if response.status_code != 200:
+            return None
+        data = response.json()
+        return data.get("country", "Unknown"), data.get("region", "Unknown"), data.get("city", "Unknown")
+
+
+class GeolocationResolver:
+    """
+    Tries each resolver in order and remembers the answer per IP in a TTL'd LRU cache.
+    """
+
+    def __init__(self, resolvers, max_entries=10000, ttl=24 * 60 * 60):
+        self.resolvers = list(resolvers)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolve(self, ip_address) -> Location:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(ip_address)
+            if cached and cached[0] > now:
+                self._cache.move_to_end(ip_address)
+                return cached[1]
+
+        location = UNKNOWN_LOCATION
+        for resolver in self.resolvers:
+            try:
+                result = resolver.resolve(ip_address)
+            except Exception as e:
+                logging.error(f"Geolocation error for IP {ip_address} in {type(resolver).__name__}: {e}")
+                continue
+            if result:
+                location = result
+                break
+
+        with self._lock:
+            self._cache[ip_address] = (now + self.ttl, location)
+            self._cache.move_to_end(ip_address)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return location
+
+
+def build_resolver(db_path=None, http_fallback=True, http_timeout=2.0, cache_size=10000, cache_ttl=24 * 60 * 60):
+    resolvers = []
+    if db_path and Path(db_path).is_file():
+        resolvers.append(LocalRangeResolver(Path(db_path)))
+    elif db_path:
+        logging.warning(f"IP range database {db_path} not found; skipping local geolocation")
+    if http_fallback:
+        resolvers.append(HttpResolver(timeout=http_timeout, token=os.getenv('IPINFO_TOKEN')))
+    return GeolocationResolver(resolvers, max_entries=cache_size, ttl=cache_ttl)
+
+
+class DownloadEnricher:
+    """
+    Background queue that geolocates served downloads and logs them, keeping
+    both off the request path. The worker thread is started lazily in each
+    process so it survives gunicorn's fork, and flushes the download log's
+    buffer whenever the queue goes idle.
+    """
+
+    def __init__(self, resolver_factory, download_log, max_pending=10000):
+        self.resolver_factory = resolver_factory
+        self.download_log = download_log
+        self.max_pending = max_pending
+        self._queue = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, filename, ip, file_size, processing_time):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((time.time(), filename, ip, file_size, processing_time))
+        except queue.Full:
+            logging.warning(f"Download log queue full; dropping entry for {filename}")
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_pending)
+            thread = threading.Thread(target=self._run, args=(self._queue,), name="download-enricher", daemon=True)
+            thread.start()
+            atexit.register(self._drain, self._queue, self.download_log)
+            self._pid = os.getpid()
+
+    def _run(self, events):
+        resolver = self.resolver_factory()
+        while True:
+            try:
+                event = events.get(timeout=self.download_log.flush_interval)
+            except queue.Empty:
+                self.download_log.flush()
+                continue
+            try:
+                timestamp, filename, ip, file_size, processing_time = event
+                with REGISTRY.span('geolocation'):
+                    country, region, city = resolver.resolve(ip)
+                self.download_log.append({
+                    "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)),
+                    "filename": filename,
+                    "ip_address": ip,
+                    "country": country,
+                    "region": region,
+                    "city": city,
+                    "file_size": file_size,
+                    "processing_time": processing_time
+                })
+            except Exception as e:
+                logging.error(f"Error enriching download event: {e}")
+            finally:
+                events.task_done()
+
+    @staticmethod
+    def _drain(events, download_log, timeout=5.0):
+        # Give pending events a chance to be written on shutdown.
+        deadline = time.monotonic() + timeout
+        while events.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        download_log.flush()
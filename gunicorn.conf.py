@@ -0,0 +1,41 @@
+import gc
+import os
+import shutil
+import subprocess
+import sys
+
+# WORKER_MODE=async runs gevent workers: every connection is a greenlet, so slow
+# clients and long downloads no longer hold a whole worker each, and blocking
+# disk work goes through a bounded thread pool (io_pool.py). The standard
+# library is patched here, before the app is preloaded into the master.
+worker_mode = os.getenv('WORKER_MODE', 'sync')
+if worker_mode == 'async':
+    from gevent import monkey
+    monkey.patch_all()
+    worker_class = 'gevent'
+    worker_connections = int(os.getenv('WORKER_CONNECTIONS', '1000'))
+elif worker_mode != 'sync':
+    raise ValueError(f"WORKER_MODE must be 'sync' or 'async', not {worker_mode!r}")
+
+# Load the app (and its corpus snapshot) once in the master and share it with
+# the workers copy-on-write, instead of loading it again in every worker.
+preload_app = os.getenv('PRELOAD_APP', '1') == '1'
+
+
+def on_starting(server):
+    # Metrics count from zero at every start; each worker writes its own file here (metrics.py)
+    from config import METRICS_PATH
+    shutil.rmtree(METRICS_PATH, ignore_errors=True)
+
+    # Build all download bundles in the background so no request has to compress
+    # anything; requests for a bundle that is still being built wait on its lock.
+    if os.getenv('PREBUILD_BUNDLES', '1') == '1':
+        server.log.info("Starting bundle prebuild")
+        subprocess.Popen([sys.executable, 'prebuild.py'])
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the collector's reach, so garbage
+    # collection in the workers doesn't write to (and un-share) those pages.
+    if preload_app:
+        gc.freeze()
@@ -0,0 +1,128 @@
+import collections
+import gzip
+import hashlib
+import threading
+from datetime import datetime, timezone
+from typing import Dict, NamedTuple, Optional
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip variants are produced
+    brotli = None
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 6  # higher qualities are too slow to run on a cache miss
+
+# Content codings we can produce, in order of preference
+ENCODINGS = ['br', 'gzip'] if brotli else ['gzip']
+
+
+class CachedPage(NamedTuple):
+    """A rendered response body stored in every supported content coding."""
+    etag: str
+    last_modified: float
+    mimetype: str
+    variants: Dict[str, bytes]
+
+    @property
+    def size(self):
+        return sum(len(body) for body in self.variants.values())
+
+
+def precompress(body: bytes) -> Dict[str, bytes]:
+    """
+    :return: mapping of content coding ('identity', 'gzip', 'br') to encoded body
+    """
+    variants = {'identity': body, 'gzip': gzip.compress(body, GZIP_LEVEL, mtime=0)}
+    if brotli:
+        variants['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+    return variants
+
+
+def make_cached_page(body: bytes, last_modified: float, mimetype='text/html') -> CachedPage:
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    return CachedPage(etag, last_modified, mimetype, precompress(body))
+
+
+def negotiate_encoding(available) -> str:
+    """
+    Picks the best content coding in ``available`` that the request's Accept-Encoding allows.
+    """
+    accept = request.accept_encodings
+    for encoding in ENCODINGS:
+        if encoding in available and accept[encoding] > 0:
+            return encoding
+    return 'identity'
+
+
+def variant_etag(etag, encoding):
+    return etag if encoding == 'identity' else f"{etag}-{encoding}"
+
+
+def cached_page_response(page: CachedPage) -> Response:
+    """
+    Serves the best-encoded variant of ``page`` with a strong ETag and
+    Last-Modified, or a 304 if the client's copy is still current.
+    """
+    encoding = negotiate_encoding(page.variants)
+    etag = variant_etag(page.etag, encoding)
+    last_modified = datetime.fromtimestamp(int(page.last_modified), tz=timezone.utc)
+
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        not_modified = request.if_modified_since is not None and request.if_modified_since >= last_modified
+
+    if not_modified:
+        response = Response(status=304)
+    else:
+        response = Response(page.variants[encoding], mimetype=page.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.vary.add('Accept-Encoding')
+    response.cache_control.no_cache = True  # always revalidate, so data updates show up at once
+    return response
+
+
+class PageCache:
+    """
+    Thread-safe LRU cache of CachedPages, bounded by the total size of all stored variants.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._pages = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[CachedPage]:
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+            return page
+
+    def discard(self, predicate):
+        """
+        Drops every page whose key satisfies ``predicate``.
+        """
+        with self._lock:
+            for key in [key for key in self._pages if predicate(key)]:
+                self.current_bytes -= self._pages.pop(key).size
+
+    def put(self, key, page: CachedPage):
+        if page.size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._pages.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old.size
+            self._pages[key] = page
+            self.current_bytes += page.size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._pages.popitem(last=False)
+                self.current_bytes -= evicted.size
@@ -0,0 +1,113 @@
+"""
+Blocking work for the async worker mode (WORKER_MODE=async, see
+gunicorn.conf.py). There every connection is a gevent greenlet, and a
+greenlet that reads a file, compresses a chunk or waits on a lock stalls all
+the others on its worker. So file bodies and streamed responses are advanced
+on a fixed number of OS threads instead, and only the waiting greenlet
+blocks. Without gevent everything runs inline, as before.
+"""
+import os
+import threading
+from typing import Callable, Iterable
+
+from gunicorn.http.wsgi import FileWrapper
+
+try:
+    from gevent import monkey
+    from gevent.threadpool import ThreadPool
+except ImportError:  # optional: only needed for WORKER_MODE=async
+    monkey = ThreadPool = None
+
+FILE_BLOCK_SIZE = 256 * 1024
+_DONE = object()
+
+
+def gevent_active() -> bool:
+    return monkey is not None and monkey.is_module_patched('socket')
+
+
+class IOPool:
+    """
+    Runs blocking calls on a bounded thread pool when gevent is active, or inline otherwise.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.enabled = gevent_active()
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        # Pool threads don't survive a fork, so each worker makes its own
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pool = ThreadPool(self.size)
+                self._pid = os.getpid()
+            return self._pool
+
+    def run(self, func: Callable, *args):
+        if not self.enabled:
+            return func(*args)
+        return self._get_pool().apply(func, args)
+
+
+class PooledIterator:
+    """
+    Advances a streamed response body (e.g. a zip being compressed) on the pool.
+    """
+
+    def __init__(self, pool: IOPool, iterable: Iterable[bytes]):
+        self.pool = pool
+        self.iterable = iterable
+        self._iterator = iter(iterable)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        chunk = self.pool.run(next, self._iterator, _DONE)
+        if chunk is _DONE:
+            raise StopIteration
+        return chunk
+
+    def close(self):
+        close = getattr(self.iterable, 'close', None)
+        if close is not None:
+            self.pool.run(close)
+
+
+class LargeBlockFileWrapper(FileWrapper):
+    """
+    Reads big blocks, so a download takes few trips through the pool.
+    """
+
+    def __init__(self, filelike, blksize=FILE_BLOCK_SIZE):
+        super().__init__(filelike, max(blksize, FILE_BLOCK_SIZE))
+
+
+class IOPoolMiddleware:
+    """
+    WSGI middleware advancing file and streamed response bodies on ``pool``.
+    Bodies that fit in one block are passed through untouched.
+    """
+
+    def __init__(self, wsgi_app, pool: IOPool):
+        self.wsgi_app = wsgi_app
+        self.pool = pool
+
+    def __call__(self, environ, start_response):
+        if not self.pool.enabled:
+            return self.wsgi_app(environ, start_response)
+        environ['wsgi.file_wrapper'] = LargeBlockFileWrapper
+        content_length = None
+
+        def capture_start_response(status, headers, exc_info=None):
+            nonlocal content_length
+            content_length = next((int(value) for name, value in headers if name.lower() == 'content-length'), None)
+            return start_response(status, headers, exc_info)
+
+        app_iter = self.wsgi_app(environ, capture_start_response)
+        if content_length is not None and content_length <= FILE_BLOCK_SIZE:
+            return app_iter
+        return PooledIterator(self.pool, app_iter)
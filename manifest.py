@@ -0,0 +1,207 @@
+"""
+Corpus manifest: every data file's path, size, mtime and content hash,
+gathered in one os.scandir pass and persisted next to the data. Later loads
+only re-hash files whose size or mtime changed. Group sizes, bundle file lists,
+ETags and the prebuild fingerprint are all derived from it instead of walking
+the data directories again.
+
+Usage: python manifest.py
+"""
+import bisect
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from stat import S_ISREG
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from artifacts import FileLock, atomic_write
+
+MANIFEST_FORMAT = 1
+
+
+class ManifestEntry(NamedTuple):
+    size: int
+    mtime_ns: int
+    sha256: str
+
+
+def hash_file(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scan_files(data_path: Path) -> Iterator[Tuple[str, os.stat_result]]:
+    """
+    Yields (relative posix path, stat) for every file under ``data_path``, in one
+    scandir pass. Dotfiles (like the manifest itself) are skipped.
+    """
+    stack = ['']
+    while stack:
+        relative_dir = stack.pop()
+        with os.scandir(data_path / relative_dir if relative_dir else data_path) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                relative_path = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+                if entry.is_dir(follow_symlinks=True):
+                    stack.append(relative_path)
+                elif entry.is_file(follow_symlinks=True):
+                    yield relative_path, entry.stat(follow_symlinks=True)
+
+
+class Manifest:
+    """
+    In-memory manifest of a data directory, with file paths relative to it.
+    """
+
+    def __init__(self, data_path: Path, entries: Dict[str, ManifestEntry]):
+        self.data_path = Path(data_path)
+        self.entries = entries
+        self._paths = sorted(entries)
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {'data_path': self.data_path, 'entries': self.entries}
+
+    def __setstate__(self, state):
+        self.__init__(state['data_path'], state['entries'])
+
+    @classmethod
+    def build(cls, data_path: Path, previous: Optional['Manifest'] = None) -> 'Manifest':
+        """
+        Scans ``data_path``, reusing the hashes in ``previous`` for files whose size and mtime are unchanged.
+        """
+        old_entries = previous.entries if previous else {}
+        entries, hashed = {}, 0
+        for relative_path, stat in scan_files(Path(data_path)):
+            old = old_entries.get(relative_path)
+            if old and old.size == stat.st_size and old.mtime_ns == stat.st_mtime_ns:
+                entries[relative_path] = old
+            else:
+                entries[relative_path] = ManifestEntry(stat.st_size, stat.st_mtime_ns, hash_file(Path(data_path) / relative_path))
+                hashed += 1
+        logging.info(f"Scanned {len(entries)} data files, hashed {hashed}")
+        return cls(data_path, entries)
+
+    @classmethod
+    def read(cls, data_path: Path, manifest_path: Path) -> Optional['Manifest']:
+        try:
+            with open(manifest_path, encoding='utf-8') as f:
+                stored = json.load(f)
+            if stored.get('format') != MANIFEST_FORMAT:
+                return None
+            return cls(data_path, {path: ManifestEntry(*entry) for path, entry in stored['files'].items()})
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError):
+            return None
+
+    def write(self, manifest_path: Path):
+        with atomic_write(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump({'format': MANIFEST_FORMAT, 'files': {path: list(self.entries[path]) for path in self._paths}}, f)
+
+    def relative(self, path: Path) -> str:
+        return Path(path).relative_to(self.data_path).as_posix()
+
+    def files_under(self, directory: Path, suffixes=None, recursive=True) -> List[Path]:
+        """
+        :param directory: a directory under the data path
+        :param suffixes: only include files with these suffixes (e.g. {'.txt'})
+        :return: absolute paths of the files in it, sorted
+        """
+        prefix = self.relative(directory).rstrip('/') + '/'
+        if prefix == './':
+            prefix = ''
+        start = bisect.bisect_left(self._paths, prefix)
+        files = []
+        for relative_path in self._paths[start:]:
+            if not relative_path.startswith(prefix):
+                break
+            if not recursive and '/' in relative_path[len(prefix):]:
+                continue
+            if suffixes is None or os.path.splitext(relative_path)[1] in suffixes:
+                files.append(self.data_path / relative_path)
+        return files
+
+    def total_size(self, path: Path, exclude_suffixes=(), exclude: Optional[Path] = None) -> int:
+        """
+        Size of a file, or of all files under a directory.
+        :param exclude: a subdirectory to leave out
+        """
+        relative_path = self.relative(path)
+        if relative_path in self.entries:
+            return self.entries[relative_path].size
+        excluded = (self.relative(exclude).rstrip('/') + '/') if exclude else None
+        return sum(
+            self.entries[self.relative(file_path)].size
+            for file_path in self.files_under(path)
+            if file_path.suffix not in exclude_suffixes
+            and not (excluded and self.relative(file_path).startswith(excluded))
+        )
+
+    def entry(self, path: Path) -> Optional[ManifestEntry]:
+        """
+        :return: the size, mtime and content hash of a data file, re-hashing it if it
+        changed since the manifest was built, or None if it isn't a file
+        """
+        relative_path = self.relative(path)
+        try:
+            stat = Path(path).stat()
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        if not S_ISREG(stat.st_mode):
+            return None
+        with self._lock:
+            entry = self.entries.get(relative_path)
+        if entry and entry.size == stat.st_size and entry.mtime_ns == stat.st_mtime_ns:
+            return entry
+        entry = ManifestEntry(stat.st_size, stat.st_mtime_ns, hash_file(path))
+        with self._lock:
+            if relative_path not in self.entries:
+                bisect.insort(self._paths, relative_path)
+            self.entries[relative_path] = entry
+        return entry
+
+    def sha256(self, path: Path) -> Optional[str]:
+        entry = self.entry(path)
+        return entry.sha256 if entry else None
+
+    def fingerprint(self) -> str:
+        """
+        Hash of every file's path and content hash.
+        """
+        digest = hashlib.sha256()
+        for relative_path in self._paths:
+            digest.update(f"{relative_path}\0{self.entries[relative_path].sha256}\n".encode('utf-8'))
+        return digest.hexdigest()
+
+
+def load_manifest(data_path: Path, manifest_path: Path, fallback_path: Path) -> Manifest:
+    """
+    Loads the stored manifest, refreshes it against the data directory and
+    stores it again if anything changed. It is kept next to the data, or at
+    ``fallback_path`` if the data directory is read-only. Only one process
+    refreshes at a time; the others then find it current.
+    """
+    with FileLock(fallback_path.parent / 'locks' / 'manifest.lock'):
+        previous = Manifest.read(data_path, manifest_path) or Manifest.read(data_path, fallback_path)
+        manifest = Manifest.build(data_path, previous)
+        if previous is None or previous.entries != manifest.entries:
+            try:
+                manifest.write(manifest_path)
+            except OSError as e:
+                logging.warning(f"Can't write manifest to {manifest_path} ({e}); using {fallback_path}")
+                manifest.write(fallback_path)
+    return manifest
+
+
+if __name__ == "__main__":
+    from config import DATA_PATH, MANIFEST_PATH, MANIFEST_FALLBACK_PATH
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    manifest = load_manifest(DATA_PATH, MANIFEST_PATH, MANIFEST_FALLBACK_PATH)
+    print(f"{len(manifest.entries)} files, fingerprint {manifest.fingerprint()}")
@@ -0,0 +1,296 @@
+"""
+Counters, gauges and histograms for the Prometheus ``/metrics`` endpoint,
+aggregated across gunicorn workers. Every process records into its own
+in-memory registry and writes it to a JSON file of its own in a shared
+directory (at most every ``flush_interval`` seconds, from a background
+thread). ``/metrics`` then adds up the files of all processes. Counters and
+histograms include workers that have exited; gauges only live ones.
+
+Modules record into the shared ``REGISTRY``; nothing is written to disk until
+``configure`` gives it a directory, so command-line tools can use the same
+code without leaving metrics behind.
+"""
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from artifacts import atomic_write
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# name -> (type, help); every metric recorded must be described here
+METRICS = {
+    'hansel_request_duration_seconds': ('histogram', "Time from receiving a request to sending the last byte, by route."),
+    'hansel_requests_total': ('counter', "Requests answered, by route and status code."),
+    'hansel_requests_in_flight': ('gauge', "Requests being handled, summed over workers."),
+    'hansel_span_duration_seconds': ('histogram', "Time spent in a step of request handling (zip_build, file_read, "
+                                                  "template_render, geolocation)."),
+    'hansel_cache_requests_total': ('counter', "Cache lookups, by cache and result (hit or miss)."),
+    'hansel_cache_hit_bytes_total': ('counter', "Size of the cache entries served from the cache."),
+    'hansel_cache_stored_bytes_total': ('counter', "Bytes written into the cache."),
+    'hansel_cache_evictions_total': ('counter', "Cache entries evicted to stay under the size cap."),
+    'hansel_cache_evicted_bytes_total': ('counter', "Bytes evicted from the cache."),
+    'hansel_workers': ('gauge', "Live processes reporting metrics."),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Optional[Dict]) -> Labels:
+    return tuple(sorted((str(k), str(v)) for k, v in (labels or {}).items()))
+
+
+class Registry:
+    """
+    The metrics of one process. Recording is thread-safe; a forked child starts empty.
+    """
+
+    def __init__(self, flush_interval=1.0):
+        self.directory: Optional[Path] = None
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pid = None
+        self._reset()
+
+    def _reset(self):
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], list] = {}  # bucket counts..., sum
+        self._dirty = False
+        self._file = None
+
+    def configure(self, directory: Path):
+        self.directory = Path(directory)
+
+    def _check_process(self):
+        # Called with the lock held. Counts inherited over a fork belong to the parent.
+        if self._pid == os.getpid():
+            return
+        self._reset()
+        self._pid = os.getpid()
+        if self.directory is not None:
+            self._file = self.directory / f"{self._pid}-{uuid.uuid4().hex[:8]}.json"
+            threading.Thread(target=self._flush_periodically, name="metrics-flush", daemon=True).start()
+            atexit.register(self.flush)
+
+    def inc(self, name, amount=1, labels: Optional[Dict] = None):
+        with self._lock:
+            self._check_process()
+            key = (name, _labels(labels))
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self._dirty = True
+
+    def add(self, name, amount, labels: Optional[Dict] = None):
+        """
+        Moves a gauge up or down.
+        """
+        with self._lock:
+            self._check_process()
+            key = (name, _labels(labels))
+            self._gauges[key] = self._gauges.get(key, 0) + amount
+            self._dirty = True
+
+    def observe(self, name, value, labels: Optional[Dict] = None):
+        with self._lock:
+            self._check_process()
+            key = (name, _labels(labels))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            histogram[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+            histogram[-1] += value
+            self._dirty = True
+
+    @contextmanager
+    def span(self, span_name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('hansel_span_duration_seconds', time.perf_counter() - start, {'span': span_name})
+
+    def timed_chunks(self, span_name, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Passes a streamed body through, timing only the work of producing it
+        (not the time its consumer spends sending each chunk).
+        """
+        elapsed = 0.0
+        iterator = iter(chunks)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    elapsed += time.perf_counter() - start
+                    break
+                elapsed += time.perf_counter() - start
+                yield chunk
+        finally:
+            self.observe('hansel_span_duration_seconds', elapsed, {'span': span_name})
+
+    def flush(self):
+        """
+        Writes this process's metrics to its file, if anything changed.
+        """
+        with self._lock:
+            if not self._dirty or self._file is None:
+                return
+            state = {
+                'pid': self._pid,
+                'counters': [[name, labels, value] for (name, labels), value in self._counters.items()],
+                'gauges': [[name, labels, value] for (name, labels), value in self._gauges.items()],
+                'histograms': [[name, labels, values] for (name, labels), values in self._histograms.items()],
+            }
+            self._dirty = False
+            path = self._file
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_write(path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass  # e.g. the directory was cleared at a restart; try again next time
+
+
+REGISTRY = Registry()
+
+
+def _pid_alive(pid) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _format_labels(labels: Iterable) -> str:
+    escape = lambda value: value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    parts = [f'{key}="{escape(value)}"' for key, value in labels]
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def collect(directory: Path) -> str:
+    """
+    Adds up the metrics files of all processes into the Prometheus text format.
+    """
+    counters, gauges, histograms = {}, {}, {}
+    live_workers = 0
+    for path in sorted(Path(directory).glob('*.json')):
+        try:
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            continue
+        alive = _pid_alive(state['pid'])
+        live_workers += alive
+        for name, labels, value in state['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, value in state['gauges'] if alive else []:
+            key = (name, tuple(map(tuple, labels)))
+            gauges[key] = gauges.get(key, 0) + value
+        for name, labels, values in state['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            total = histograms.setdefault(key, [0] * len(values))
+            histograms[key] = [a + b for a, b in zip(total, values)]
+    gauges[('hansel_workers', ())] = live_workers
+
+    lines = []
+    for name, (metric_type, help_text) in METRICS.items():
+        samples = {'counter': counters, 'gauge': gauges, 'histogram': histograms}[metric_type]
+        series = sorted((labels, value) for (metric, labels), value in samples.items() if metric == name)
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in series:
+            if metric_type != 'histogram':
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip([*LATENCY_BUCKETS, '+Inf'], value[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels([*labels, ('le', str(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-1])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """
+    WSGI middleware timing every request until its body has been sent, by the
+    Flask endpoint it was routed to (set in environ['hansel.route']).
+    """
+
+    def __init__(self, wsgi_app, registry: Registry = REGISTRY):
+        self.wsgi_app = wsgi_app
+        self.registry = registry
+
+    def __call__(self, environ, start_response):
+        start = time.perf_counter()
+        status = None
+
+        def capture_start_response(status_line, headers, exc_info=None):
+            nonlocal status
+            status = status_line.split(' ', 1)[0]
+            return start_response(status_line, headers, exc_info)
+
+        def finish():
+            route = environ.get('hansel.route') or 'unmatched'
+            self.registry.add('hansel_requests_in_flight', -1)
+            self.registry.observe('hansel_request_duration_seconds', time.perf_counter() - start, {'route': route})
+            self.registry.inc('hansel_requests_total', labels={'route': route, 'status': status or '500'})
+
+        self.registry.add('hansel_requests_in_flight', 1)
+        try:
+            app_iter = self.wsgi_app(environ, capture_start_response)
+        except BaseException:
+            finish()
+            raise
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if isinstance(file_wrapper, type) and isinstance(app_iter, file_wrapper):
+            # Keep the server's own file wrapper, so it can still use sendfile
+            app_iter.close = _closing(getattr(app_iter, 'close', None), finish)
+            return app_iter
+        return _ClosingBody(app_iter, finish)
+
+
+def _closing(close, on_close):
+    def close_and_record():
+        try:
+            if close is not None:
+                close()
+        finally:
+            on_close()
+    return close_and_record
+
+
+class _ClosingBody:
+    """
+    Response body that calls ``on_close`` once the server closes it.
+    """
+
+    def __init__(self, app_iter, on_close):
+        self.app_iter = app_iter
+        self.close = _closing(getattr(app_iter, 'close', None), on_close)
+
+    def __iter__(self):
+        return iter(self.app_iter)
@@ -0,0 +1,152 @@
+"""
+Indexes TEI project editions into the byte range of every element with an
+xml:id, so a single passage (div, verse, paragraph) can be cited and served
+with one seek and a small read. Files are streamed through expat, which
+reports byte offsets, so memory stays flat however large the edition.
+Divisions, verses and paragraphs can also be cited by their ``n``.
+
+Usage: python passage_index.py
+"""
+import json
+import logging
+import re
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from xml.parsers import expat
+
+from artifacts import atomic_write
+
+# Elements that can also be cited by their n attribute, e.g. <lg n="1.2">
+REF_TAGS = {'div', 'lg', 'p'}
+MAX_TAG_BYTES = 4096
+TEI_NAMESPACE = 'http://www.tei-c.org/ns/1.0'  # declared on the editions' root, so re-declared on each passage
+
+
+def build_passage_index(xml_path: Path) -> Dict:
+    """
+    :return: {'size', 'mtime_ns', 'ids': {id: [start, end_event, tag, n]}, 'refs': {n: id}}, where
+    end_event is the byte offset of the element's end tag (of the start tag if it is empty)
+    """
+    stat = xml_path.stat()
+    ids, refs, stack = {}, {}, []
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+
+    def start_element(name, attrs):
+        element_id = attrs.get('xml:id')
+        n = attrs.get('n') if name in REF_TAGS else None
+        stack.append((parser.CurrentByteIndex, name, element_id, n) if element_id or n else None)
+
+    def end_element(name):
+        entry = stack.pop()
+        if entry is None:
+            return
+        start, tag, element_id, n = entry
+        key = element_id or f"{tag}@{start}"  # n-only elements get a synthetic id
+        ids[key] = [start, parser.CurrentByteIndex, tag, n]
+        if n and n not in refs:
+            refs[n] = key
+
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    with open(xml_path, 'rb') as f:
+        parser.ParseFile(f)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'ids': ids, 'refs': refs}
+
+
+@lru_cache(maxsize=64)
+def _load_index(index_path: Path, stamp: Tuple[int, int]) -> Dict:
+    """
+    :raise LookupError: if there is no stored index for this version of the file (so it isn't cached)
+    """
+    try:
+        with open(index_path, encoding='utf-8') as f:
+            index = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        raise LookupError(index_path)
+    if (index.get('size'), index.get('mtime_ns')) != stamp:
+        raise LookupError(index_path)
+    return index
+
+
+def get_passage_index(index_dir: Path, xml_path: Path) -> Dict:
+    """
+    Loads the stored index for an edition, rebuilding it if the XML changed.
+    """
+    index_path = index_dir / f"{xml_path.stem}.json"
+    stat = xml_path.stat()
+    try:
+        return _load_index(index_path, (stat.st_size, stat.st_mtime_ns))
+    except LookupError:
+        index = build_passage_index(xml_path)
+        with atomic_write(index_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        return index
+
+
+def find_passage(index: Dict, ref: str) -> Optional[Tuple[str, list]]:
+    """
+    :param ref: an xml:id, or the n of a div, lg or p
+    :return: (id, [start, end_event, tag, n]) or None
+    """
+    element_id = ref if ref in index['ids'] else index['refs'].get(ref)
+    if element_id is None:
+        return None
+    return element_id, index['ids'][element_id]
+
+
+def read_passage(xml_path: Path, entry) -> bytes:
+    """
+    Reads one element, from its start tag through its end tag, and declares the
+    TEI namespace on it unless it declares a default namespace itself.
+    """
+    start, end_event, tag = entry[0], entry[1], entry[2]
+    with open(xml_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end_event - start + MAX_TAG_BYTES)
+    close = data.find(b'>', end_event - start)
+    passage = data[:close + 1] if close != -1 else data
+    name_end = len(tag.encode('utf-8')) + 1  # after '<' and the tag name
+    if not re.search(rb'\sxmlns\s*=', passage[:passage.find(b'>')]):
+        passage = passage[:name_end] + f' xmlns="{TEI_NAMESPACE}"'.encode('utf-8') + passage[name_end:]
+    return passage
+
+
+def passage_text(passage: bytes) -> str:
+    """
+    The passage's text content, one line per verse line (<l>) and line break
+    (<lb/>, unless it falls inside a word).
+    """
+    root = ET.fromstring(passage)
+    for element in root.iter():
+        tag = element.tag.rpartition('}')[2]  # without the namespace
+        if tag in ('l', 'head') or (tag == 'lb' and element.get('break') != 'no'):
+            element.tail = '\n' + (element.tail or '')
+    lines = (re.sub(r'\s+', ' ', line).strip() for line in ''.join(root.itertext()).split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+
+def build_all_passage_indexes(index_dir: Path, xml_dir: Path) -> int:
+    """
+    :return: number of editions indexed
+    """
+    count = 0
+    for xml_path in sorted(xml_dir.glob('*.xml')):
+        try:
+            get_passage_index(index_dir, xml_path)
+            count += 1
+        except expat.ExpatError as e:
+            logging.error(f"Can't index passages of {xml_path.name}: {e}")
+    return count
+
+
+if __name__ == "__main__":
+    from config import FILE_TYPE_PATHS, PASSAGE_INDEX_PATH
+    from utils import find_data_version
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    data_version = find_data_version()
+    count = build_all_passage_indexes(PASSAGE_INDEX_PATH / data_version, FILE_TYPE_PATHS['xml'])
+    logging.info(f"Indexed passages of {count} TEI editions for {data_version}")
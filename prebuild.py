@@ -0,0 +1,167 @@
+"""
+Builds every download bundle ahead of time so that /download never has to
+compress anything on the request path, indexes rich HTML texts into
+sections for the text viewer and TEI editions into citable passages,
+precompresses the data files served under /static/data, and builds the
+full-text search and concordance indexes, the tokenized corpus export,
+collations of recensions and the corpus snapshot workers start from.
+
+Usage: python prebuild.py [--all-variants] [--workers N] [--force]
+
+Members are deflated once each, in parallel across a process pool, and then
+assembled into the bundle variants and published into the shared bundle
+cache. Nothing is rebuilt unless the data version or the contents of the data
+files (per the corpus manifest) change.
+"""
+import argparse
+import json
+import logging
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from alignment import align_all_recensions
+from artifacts import FileLock, atomic_write
+from bundle_cache import BundleCache
+from bundles import iter_bundle_variants, get_bundle_names, get_bundle_members
+from config import (
+    DATA_PATH, FILE_TYPE_PATHS, BUNDLE_CACHE_PATH, BUNDLE_CACHE_MAX_MB, SECTION_INDEX_PATH, SEARCH_INDEX_PATH,
+    MANIFEST_PATH, MANIFEST_FALLBACK_PATH, METADATA_PATH, SNAPSHOT_PATH, PRECOMPRESSED_PATH, PASSAGE_INDEX_PATH,
+    CONCORDANCE_INDEX_PATH, TOKEN_EXPORT_PATH, ALIGNMENT_PATH,
+)
+from concordance import ensure_concordance_index
+from corpus_state import load_or_build_snapshot
+from manifest import load_manifest
+from passage_index import build_all_passage_indexes
+from search_index import ensure_search_index
+from section_index import build_all_section_indexes
+from static_files import precompress_corpus
+from tokenized_corpus import ensure_token_export
+from utils import find_data_version
+from zip_stream import deflate_member, stream_zip
+
+PREBUILD_STAMP_PATH = BUNDLE_CACHE_PATH / 'prebuild.json'
+PREBUILD_RUN_LOCK_PATH = BUNDLE_CACHE_PATH / 'locks' / 'prebuild-run.lock'  # held by prebuild.py while it runs
+PREBUILD_START_LOCK_PATH = BUNDLE_CACHE_PATH / 'locks' / 'prebuild-start.lock'  # held by whoever started it
+
+
+def _read_stamp():
+    try:
+        with open(PREBUILD_STAMP_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def start_prebuild() -> bool:
+    """
+    Runs prebuild.py on a background thread unless another process started one
+    this way that is still running. Every gunicorn worker calls this after
+    reloading a new data version, and only the first gets to start it.
+    :return: whether it was started
+    """
+    lock = FileLock(PREBUILD_START_LOCK_PATH)
+    if not lock.acquire(blocking=False):
+        return False
+
+    def run():
+        try:
+            subprocess.run([sys.executable, 'prebuild.py'])
+        finally:
+            lock.release()
+
+    threading.Thread(target=run, name="prebuild", daemon=True).start()
+    return True
+
+
+def prebuild_bundles(data_version=None, all_variants=False, workers=None, force=False):
+    """
+    Builds and publishes all bundle variants unless the existing ones are current.
+    :return: number of bundles built
+    """
+    data_version = data_version or find_data_version()
+    manifest = load_manifest(DATA_PATH, MANIFEST_PATH, MANIFEST_FALLBACK_PATH)
+    cache = BundleCache(BUNDLE_CACHE_PATH, BUNDLE_CACHE_MAX_MB * 1024 * 1024)
+
+    with FileLock(BUNDLE_CACHE_PATH / 'locks' / 'prebuild.lock'):
+        variants = list(iter_bundle_variants(FILE_TYPE_PATHS, all_variants))
+        keys = {
+            variant: cache.key(get_bundle_names(*variant, data_version)[0], data_version)
+            for variant in variants
+        }
+        stamp = {
+            'data_version': data_version,
+            'fingerprint': manifest.fingerprint(),
+            'all_variants': all_variants,
+        }
+        all_present = all(cache.path_for(key).is_file() for key in keys.values())
+        if not force and all_present and _read_stamp() == stamp:
+            logging.info(f"Prebuilt bundles for {data_version} are up to date")
+            return 0
+
+        token_export_dir = TOKEN_EXPORT_PATH / data_version
+        if all_variants:
+            ensure_token_export(token_export_dir, FILE_TYPE_PATHS['txt'], FILE_TYPE_PATHS['html_rich'], data_version)
+        members_by_variant = {
+            variant: get_bundle_members(*variant, manifest, FILE_TYPE_PATHS, data_version,
+                                        token_export_dir=token_export_dir)
+            for variant in variants
+        }
+        unique_paths = sorted({path for members in members_by_variant.values() for _, path in members})
+        logging.info(f"Prebuilding {len(variants)} bundles from {len(unique_paths)} files for {data_version}")
+
+        with tempfile.TemporaryDirectory(dir=BUNDLE_CACHE_PATH, prefix='.prebuild-') as tmp_dir:
+            deflated_paths = [Path(tmp_dir) / f"{i}.deflate" for i in range(len(unique_paths))]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                deflated = dict(zip(unique_paths, pool.map(deflate_member, unique_paths, deflated_paths, chunksize=8)))
+
+            for variant, members in members_by_variant.items():
+                key = keys[variant]
+                lock = cache.lock(key)
+                lock.acquire()
+                cache.write(key, stream_zip((arcname, deflated[path]) for arcname, path in members), lock)
+
+        total_bytes = sum(cache.path_for(key).stat().st_size for key in keys.values() if cache.path_for(key).is_file())
+        if total_bytes > cache.max_bytes:
+            logging.warning(
+                f"Prebuilt bundles ({total_bytes} bytes) exceed BUNDLE_CACHE_MAX_MB; some were evicted"
+            )
+
+        with atomic_write(PREBUILD_STAMP_PATH, 'w', encoding='utf-8') as f:
+            json.dump(stamp, f, indent=4)
+
+    logging.info(f"Prebuilt {len(variants)} bundles for {data_version}")
+    return len(variants)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prebuild all download bundles for the current data version.")
+    parser.add_argument('--all-variants', action='store_true',
+                        help="build every format combination download_bundle accepts, not just those in the UI")
+    parser.add_argument('--workers', type=int, default=None, help="compression processes (default: CPU count)")
+    parser.add_argument('--force', action='store_true', help="rebuild even if the bundles are current")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    # One run at a time: if data is published while the startup prebuild is still running, this one waits for it
+    run_lock = FileLock(PREBUILD_RUN_LOCK_PATH)
+    if not run_lock.acquire(blocking=False):
+        logging.info("Waiting for the prebuild already running")
+        run_lock.acquire()
+    prebuild_bundles(all_variants=args.all_variants, workers=args.workers, force=args.force)
+    data_version = find_data_version()
+    count = build_all_section_indexes(SECTION_INDEX_PATH / data_version, FILE_TYPE_PATHS['html_rich'])
+    logging.info(f"Indexed sections of {count} rich HTML texts for {data_version}")
+    count = build_all_passage_indexes(PASSAGE_INDEX_PATH / data_version, FILE_TYPE_PATHS['xml'])
+    logging.info(f"Indexed passages of {count} TEI editions for {data_version}")
+    precompress_corpus(load_manifest(DATA_PATH, MANIFEST_PATH, MANIFEST_FALLBACK_PATH), PRECOMPRESSED_PATH, args.workers)
+    ensure_search_index(SEARCH_INDEX_PATH / data_version, FILE_TYPE_PATHS['txt'])
+    ensure_concordance_index(CONCORDANCE_INDEX_PATH / data_version, FILE_TYPE_PATHS['txt'])
+    ensure_token_export(TOKEN_EXPORT_PATH / data_version, FILE_TYPE_PATHS['txt'], FILE_TYPE_PATHS['html_rich'],
+                        data_version)
+    count = align_all_recensions(ALIGNMENT_PATH / data_version, FILE_TYPE_PATHS['txt'], args.workers)
+    logging.info(f"Collated {count} recension pairs for {data_version}")
+    load_or_build_snapshot(SNAPSHOT_PATH, DATA_PATH, METADATA_PATH, FILE_TYPE_PATHS, MANIFEST_PATH, MANIFEST_FALLBACK_PATH)
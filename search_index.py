@@ -0,0 +1,317 @@
+"""
+Transliteration-insensitive full-text search over the project edition texts.
+
+Every line is transliterated to SLP1 (one ASCII letter per phoneme) and reduced
+to its letters, so spacing and sandhi boundaries don't matter. Lines are
+indexed by character trigrams; a query is normalized the same way, candidate
+lines are the intersection of its trigrams' posting lists, and each candidate
+is then checked for the exact substring. All arrays are stored as .npy/.bin
+files and memory-mapped, so every worker shares one copy through the page
+cache.
+
+Usage: python search_index.py [--check] (--check tests normalize_query against QUERY_CHECKS)
+"""
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import sys
+import tempfile
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from skrutable.scheme_detection import SchemeDetector
+
+from artifacts import FileLock
+from transliteration import CORPUS_SCHEME, SCHEMES, canonical_scheme, get_transliterator
+
+INDEX_SCHEME = 'SLP'
+
+NON_LETTERS = re.compile(r"[^A-Za-z~]")
+SECTION_MARKER = re.compile(r"^\{(.*)\}\s*$")
+LOCATION_MARKER = re.compile(r"^\s*\[([^\]]+)\]")
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+_detector = None
+INDIC_SCRIPTS = ('DEVANAGARI', 'BENGALI', 'GUJARATI')  # Unicode name prefixes of the non-Latin SCHEMES
+
+# Queries without a scheme and their expected normalization
+QUERY_CHECKS = {
+    'kṣaṇa': 'kzaRa',
+    'namaḥ': 'namaH',
+    'tamaḥspṛśe': 'tamaHspfSe',
+    'Kṣaṇa': 'kzaRa',
+    'rāmāyaṇa': 'rAmAyaRa',
+    'क्षण': 'kzaRa',
+}
+
+
+def _fold_iast(text: str) -> str:
+    # IAST is case-insensitive, but capitals don't all survive transliteration to SLP1
+    return unicodedata.normalize('NFC', text).lower()
+
+
+def normalize_letters(slp_text: str) -> str:
+    return NON_LETTERS.sub('', slp_text)
+
+
+def detect_scheme(query: str) -> str:
+    """
+    Queries with IAST diacritics (any non-ASCII Latin letter) are IAST, the
+    corpus scheme; the detector mistakes short ones like kṣaṇa for Velthuis.
+    It is only asked about pure ASCII and Indic script queries.
+    :return: a skrutable scheme name
+    """
+    names = [unicodedata.name(char, '') for char in unicodedata.normalize('NFC', query) if not char.isascii()]
+    if any(name.startswith('LATIN') for name in names):
+        return CORPUS_SCHEME
+    if names and not any(name.startswith(INDIC_SCRIPTS) for name in names):
+        return CORPUS_SCHEME
+    global _detector
+    _detector = _detector or SchemeDetector()
+    return _detector.detect_scheme(query)
+
+
+def normalize_query(query: str, scheme: Optional[str] = None) -> str:
+    """
+    :param scheme: one of transliteration.SCHEMES (or an alias), or None to detect it
+    :return: the query as bare SLP1 letters
+    """
+    from_scheme = SCHEMES[canonical_scheme(scheme)] if scheme else detect_scheme(query)
+    if from_scheme == 'IAST':
+        query = _fold_iast(query)
+    if from_scheme != INDEX_SCHEME:
+        query = get_transliterator(from_scheme, INDEX_SCHEME).transliterate(query)
+    return normalize_letters(query)
+
+
+def trigram_keys(text: str) -> np.ndarray:
+    """
+    Packs every 3-letter window of an ASCII string into a 24-bit integer.
+    """
+    codes = np.frombuffer(text.encode('ascii'), dtype=np.uint8).astype(np.uint32)
+    if len(codes) < 3:
+        return np.empty(0, dtype=np.uint32)
+    return (codes[:-2] << 16) | (codes[1:-1] << 8) | codes[2:]
+
+
+def build_search_index(index_dir: Path, txt_path: Path) -> int:
+    """
+    Builds the index for every .txt file under ``txt_path`` into a temporary
+    directory and renames it to ``index_dir`` once complete.
+    :return: number of indexed lines
+    """
+    to_slp = get_transliterator(CORPUS_SCHEME, INDEX_SCHEME)
+    texts = []
+    orig_parts, norm_parts = [], []
+    orig_offsets, norm_offsets = [0], [0]
+    line_text, line_no, line_location, line_section = [], [], [], []
+    locations = ['']
+    location_ids = {'': 0}
+    gram_lines = []
+
+    def location_id(label):
+        if label not in location_ids:
+            location_ids[label] = len(locations)
+            locations.append(label)
+        return location_ids[label]
+
+    for text_id, file_path in enumerate(sorted(txt_path.glob('*.txt'))):
+        texts.append(file_path.stem)
+        original = file_path.read_text(encoding='utf-8')
+        original_lines = original.split('\n')
+        slp_lines = to_slp.transliterate(_fold_iast(original)).split('\n')
+        if len(slp_lines) != len(original_lines):  # fall back if newlines weren't preserved
+            slp_lines = [to_slp.transliterate(_fold_iast(line)) for line in original_lines]
+
+        section, location = 0, 0
+        for number, (line, slp_line) in enumerate(zip(original_lines, slp_lines), start=1):
+            if match := SECTION_MARKER.match(line):
+                section = location_id(match.group(1))
+                continue
+            if match := LOCATION_MARKER.match(line):
+                location = location_id(match.group(1))
+            letters = normalize_letters(slp_line)
+            if not letters:
+                continue
+            line_id = len(line_text)
+            line_text.append(text_id)
+            line_no.append(number)
+            line_location.append(location)
+            line_section.append(section)
+            encoded = line.strip().encode('utf-8')
+            orig_parts.append(encoded)
+            orig_offsets.append(orig_offsets[-1] + len(encoded))
+            norm_parts.append(letters.encode('ascii'))
+            norm_offsets.append(norm_offsets[-1] + len(letters))
+            keys = np.unique(trigram_keys(letters))
+            gram_lines.append(np.stack([keys, np.full(len(keys), line_id, dtype=np.uint32)]))
+
+    if gram_lines:
+        pairs = np.concatenate(gram_lines, axis=1)
+        order = np.lexsort((pairs[1], pairs[0]))  # by gram, then line
+        grams, postings = pairs[0][order], pairs[1][order]
+    else:
+        grams = postings = np.empty(0, dtype=np.uint32)
+    gram_keys, gram_starts = np.unique(grams, return_index=True)
+    gram_offsets = np.append(gram_starts, len(postings)).astype(np.int64)
+
+    index_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=index_dir.parent, prefix=f".{index_dir.name}."))
+    try:
+        (tmp_dir / 'lines_orig.bin').write_bytes(b''.join(orig_parts))
+        (tmp_dir / 'lines_norm.bin').write_bytes(b''.join(norm_parts))
+        np.save(tmp_dir / 'orig_offsets.npy', np.array(orig_offsets, dtype=np.int64))
+        np.save(tmp_dir / 'norm_offsets.npy', np.array(norm_offsets, dtype=np.int64))
+        np.save(tmp_dir / 'line_text.npy', np.array(line_text, dtype=np.uint32))
+        np.save(tmp_dir / 'line_no.npy', np.array(line_no, dtype=np.uint32))
+        np.save(tmp_dir / 'line_location.npy', np.array(line_location, dtype=np.uint32))
+        np.save(tmp_dir / 'line_section.npy', np.array(line_section, dtype=np.uint32))
+        np.save(tmp_dir / 'gram_keys.npy', gram_keys.astype(np.uint32))
+        np.save(tmp_dir / 'gram_offsets.npy', gram_offsets)
+        np.save(tmp_dir / 'postings.npy', postings.astype(np.uint32))
+        with open(tmp_dir / 'meta.json', 'w', encoding='utf-8') as f:
+            json.dump({'texts': texts, 'labels': locations}, f, ensure_ascii=False)
+        os.rename(tmp_dir, index_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    logging.info(f"Built search index of {len(line_text)} lines from {len(texts)} texts in {index_dir}")
+    return len(line_text)
+
+
+def ensure_search_index(index_dir: Path, txt_path: Path):
+    """
+    Builds the index unless it exists; only one process builds at a time.
+    """
+    if index_dir.is_dir():
+        return
+    with FileLock(index_dir.parent / f".{index_dir.name}.lock"):
+        if not index_dir.is_dir():
+            build_search_index(index_dir, txt_path)
+
+
+def _map_bytes(path: Path) -> np.ndarray:
+    # np.memmap refuses empty files
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode='r')
+
+
+class SearchIndex:
+    """
+    Read-only view of a built index; the arrays are memory-mapped.
+    """
+
+    def __init__(self, index_dir: Path):
+        load = lambda name: np.load(index_dir / name, mmap_mode='r')
+        self.orig = _map_bytes(index_dir / 'lines_orig.bin')
+        self.norm = _map_bytes(index_dir / 'lines_norm.bin')
+        self.orig_offsets = load('orig_offsets.npy')
+        self.norm_offsets = load('norm_offsets.npy')
+        self.line_text = load('line_text.npy')
+        self.line_no = load('line_no.npy')
+        self.line_location = load('line_location.npy')
+        self.line_section = load('line_section.npy')
+        self.gram_keys = load('gram_keys.npy')
+        self.gram_offsets = load('gram_offsets.npy')
+        self.postings = load('postings.npy')
+        with open(index_dir / 'meta.json', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.texts = meta['texts']
+        self.labels = meta['labels']
+        self.num_lines = len(self.line_text)
+        self.avg_line_length = (int(self.norm_offsets[-1]) / self.num_lines) if self.num_lines else 1.0
+
+    def _posting_list(self, key) -> np.ndarray:
+        i = np.searchsorted(self.gram_keys, key)
+        if i == len(self.gram_keys) or self.gram_keys[i] != key:
+            return np.empty(0, dtype=np.uint32)
+        return self.postings[self.gram_offsets[i]:self.gram_offsets[i + 1]]
+
+    def _prefix_postings(self, letters: str) -> np.ndarray:
+        # Queries of two letters: union of the postings of all trigrams they start
+        low = (ord(letters[0]) << 16) | (ord(letters[1]) << 8)
+        lo, hi = np.searchsorted(self.gram_keys, [low, low + 256])
+        if lo == hi:
+            return np.empty(0, dtype=np.uint32)
+        return np.unique(self.postings[self.gram_offsets[lo]:self.gram_offsets[hi]])
+
+    def candidates(self, letters: str) -> np.ndarray:
+        if len(letters) < 3:
+            return self._prefix_postings(letters)
+        lists = sorted((self._posting_list(key) for key in np.unique(trigram_keys(letters))), key=len)
+        result = lists[0]
+        for posting_list in lists[1:]:
+            if not len(result):
+                break
+            result = np.intersect1d(result, posting_list, assume_unique=True)
+        return result
+
+    def search(self, letters: str, limit=20, offset=0) -> Dict:
+        """
+        :param letters: a query already normalized with normalize_query
+        :return: {'total': int, 'hits': [...]}, hits ranked by BM25 of the query's occurrences
+        """
+        if len(letters) < 2 or not self.num_lines:
+            return {'total': 0, 'hits': []}
+        candidates = self.candidates(letters)
+        needle = letters.encode('ascii')
+        matches = []
+        for line_id in candidates:
+            start, end = self.norm_offsets[line_id], self.norm_offsets[line_id + 1]
+            count = self.norm[start:end].tobytes().count(needle)
+            if count:
+                matches.append((int(line_id), count, int(end - start)))
+
+        idf = math.log(1 + (self.num_lines - len(matches) + 0.5) / (len(matches) + 0.5))
+        scored = sorted(
+            ((idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / self.avg_line_length)), line_id, tf)
+             for line_id, tf, length in matches),
+            key=lambda hit: (-hit[0], hit[1])
+        )
+        hits = []
+        for score, line_id, tf in scored[offset:offset + limit]:
+            start, end = self.orig_offsets[line_id], self.orig_offsets[line_id + 1]
+            hits.append({
+                'text': self.texts[self.line_text[line_id]],
+                'line': int(self.line_no[line_id]),
+                'location': self.labels[self.line_location[line_id]],
+                'section': self.labels[self.line_section[line_id]],
+                'snippet': self.orig[start:end].tobytes().decode('utf-8'),
+                'occurrences': tf,
+                'score': round(score, 4),
+            })
+        return {'total': len(matches), 'hits': hits}
+
+
+def check() -> List[str]:
+    """
+    :return: descriptions of the QUERY_CHECKS that normalize_query gets wrong
+    """
+    return [
+        f"normalize_query({query!r}) = {normalize_query(query)!r}, expected {expected!r}"
+        for query, expected in QUERY_CHECKS.items() if normalize_query(query) != expected
+    ]
+
+
+if __name__ == "__main__":
+    from config import FILE_TYPE_PATHS, SEARCH_INDEX_PATH
+    from utils import find_data_version
+
+    if '--check' in sys.argv[1:]:
+        failures = check()
+        for failure in failures:
+            print(failure)
+        print(f"{len(QUERY_CHECKS)} checks, {len(failures)} failures")
+        sys.exit(1 if failures else 0)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    ensure_search_index(SEARCH_INDEX_PATH / find_data_version(), FILE_TYPE_PATHS['txt'])
@@ -0,0 +1,109 @@
+"""
+Indexes rich HTML texts into per-section byte ranges, so the text viewer can
+send the first section inline and fetch the rest one at a time.
+
+Usage: python section_index.py
+"""
+import html
+import json
+import logging
+import re
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from artifacts import atomic_write
+
+
+def build_section_index(html_path: Path, toc: List[Dict]) -> Optional[Dict]:
+    """
+    Finds the element carrying each TOC id in document order. Section i spans from
+    its element to the next section's element; the bytes before the first section
+    (the content wrapper's opening tag) and after the last (its closing tag) are
+    kept as head and tail.
+    :return: the index, or None if the file can't be split along its TOC
+    """
+    data = html_path.read_bytes()
+    stat = html_path.stat()
+
+    starts = []
+    position = 0
+    for item in toc:
+        section_id = html.escape(str(item.get('id', '')), quote=True).encode('utf-8')
+        match = re.compile(rb'<[A-Za-z][^>]*\sid="' + re.escape(section_id) + rb'"').search(data, position)
+        if not match:
+            logging.warning(f"Section {item.get('id')!r} not found in {html_path.name}; not indexing it")
+            return None
+        starts.append(match.start())
+        position = match.end()
+
+    tail_start = data.rfind(b'</div>')
+    if not starts or tail_start < starts[-1]:
+        return None
+
+    ends = starts[1:] + [tail_start]
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'head': [0, starts[0]],
+        'sections': [
+            {'id': str(item.get('id', '')), 'start': start, 'end': end}
+            for item, start, end in zip(toc, starts, ends)
+        ],
+        'tail': [tail_start, len(data)],
+    }
+
+
+def get_section_index(index_dir: Path, html_path: Path, json_path: Path) -> Optional[Dict]:
+    """
+    Loads the stored index for a text, rebuilding it if the HTML changed.
+    """
+    index_path = index_dir / f"{html_path.stem}.json"
+    stat = html_path.stat()
+    try:
+        with open(index_path, encoding='utf-8') as f:
+            index = json.load(f)
+        if index and index['size'] == stat.st_size and index['mtime_ns'] == stat.st_mtime_ns:
+            return index
+    except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError):
+        pass
+
+    try:
+        with open(json_path, encoding='utf-8') as f:
+            toc = json.load(f).get('toc', [])
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        logging.error(f"Error loading TOC for {html_path.name}: {e}")
+        toc = []
+    index = build_section_index(html_path, toc) if toc else None
+    with atomic_write(index_path, 'w', encoding='utf-8') as f:
+        json.dump(index or {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sections': []}, f)
+    return index
+
+
+def read_range(path: Path, byte_range) -> bytes:
+    start, end = byte_range
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def build_all_section_indexes(index_dir: Path, rich_html_path: Path) -> int:
+    """
+    :return: number of texts that could be split into sections
+    """
+    count = 0
+    for html_path in sorted(rich_html_path.glob('*.html')):
+        json_path = html_path.with_suffix('.json')
+        if json_path.is_file():
+            index = get_section_index(index_dir, html_path, json_path)
+            count += bool(index and index['sections'])
+    return count
+
+
+if __name__ == "__main__":
+    from config import FILE_TYPE_PATHS, SECTION_INDEX_PATH
+    from utils import find_data_version
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    data_version = find_data_version()
+    count = build_all_section_indexes(SECTION_INDEX_PATH / data_version, FILE_TYPE_PATHS['html_rich'])
+    logging.info(f"Indexed sections of {count} rich HTML texts for {data_version}")
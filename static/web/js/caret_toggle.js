@@ -1,17 +1,18 @@
 document.addEventListener("DOMContentLoaded", function() {
-    document.querySelectorAll(".toggle-caret").forEach(caret => {
-        caret.addEventListener("click", function(event) {
-            let li = this.closest(".file-item"); // Find the parent <li>
+    // Delegated, so carets of list items added later (e.g. the index page's text list) work too
+    document.addEventListener("click", function(event) {
+        const caret = event.target.closest(".toggle-caret");
+        if (!caret) return;
+        let li = caret.closest(".file-item"); // Find the parent <li>
 
-            if (li) {
-                event.preventDefault(); // Prevent default summary behavior only when we are handling the event
-                if (li.classList.contains("open")) {
-                    li.classList.remove("open");
-                } else {
-                    li.classList.add("open");
-                }
+        if (li) {
+            event.preventDefault(); // Prevent default summary behavior only when we are handling the event
+            if (li.classList.contains("open")) {
+                li.classList.remove("open");
+            } else {
+                li.classList.add("open");
             }
-        });
+        }
     });
 
     document.querySelectorAll(".faq-question, .custom-bundle-link").forEach(question => {
@@ -52,8 +52,8 @@ function toggleViewMode(checkbox) {
 }
 window.toggleViewMode = toggleViewMode;
 
-function toggleCorrections(checkbox) {
-    const content = document.getElementById('content');
+function toggleCorrections(checkbox, root) {
+    const content = root || document.getElementById('content');
     if (!content) return;
 
     const anteCorrectionElements = content.querySelectorAll('.ante-correction');
@@ -147,10 +147,15 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // Navigation for correction entries
     if (correctionsListItem) {
-        correctionsListItem.addEventListener('click', (e) => {
+        correctionsListItem.addEventListener('click', async (e) => {
             const link = e.target.closest('.correction-link');
             if (link) {
                 let target = null;
+
+                // Corrections may point into sections that haven't been loaded yet
+                if (window.loadAllSections) {
+                    await window.loadAllSections();
+                }
                 
                 console.log('Correction click:', link.dataset);
 
@@ -200,8 +205,12 @@ document.addEventListener('DOMContentLoaded', () => {
         return;
     }
 
+    // The page as served (with placeholders for lazy sections) and each loaded
+    // section are kept in IAST and transliterated separately, per scheme.
     const originalContent = contentDiv.innerHTML;
     const transliteratedContent = {};
+    const sectionContent = {};
+    const transliteratedSections = {};
 
     const allSchemes = {
         "Roman": ["hk", "iast", "iso", "itrans", "slp1", "velthuis", "wx"],
@@ -243,26 +252,14 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
-    function transliterate(targetScheme) {
-        const reapplyCorrections = () => {
-            const correctionsToggle = document.querySelector('input[onchange="toggleCorrections(this)"]');
-            if (correctionsToggle) toggleCorrections(correctionsToggle);
-        };
-
-        if (targetScheme === 'iast') {
-            contentDiv.innerHTML = originalContent;
-            reapplyCorrections();
-            return;
-        }
-
-        if (transliteratedContent[targetScheme]) {
-            contentDiv.innerHTML = transliteratedContent[targetScheme];
-            reapplyCorrections();
-            return;
-        }
+    function reapplyCorrections(root) {
+        const correctionsToggle = document.querySelector('input[onchange="toggleCorrections(this)"]');
+        if (correctionsToggle) toggleCorrections(correctionsToggle, root);
+    }
 
+    function transliterateHtml(html, targetScheme) {
         const tempDiv = document.createElement('div');
-        tempDiv.innerHTML = originalContent;
+        tempDiv.innerHTML = html;
 
         const walker = document.createTreeWalker(tempDiv, NodeFilter.SHOW_TEXT, null, false);
         let node;
@@ -278,12 +275,128 @@ document.addEventListener('DOMContentLoaded', () => {
                 node.nodeValue = Sanscript.t(node.nodeValue, 'iast', targetScheme);
             }
         }
-        
-        transliteratedContent[targetScheme] = tempDiv.innerHTML;
-        contentDiv.innerHTML = tempDiv.innerHTML;
+        return tempDiv.innerHTML;
+    }
+
+    function sectionHtml(index, targetScheme) {
+        if (!targetScheme || targetScheme === 'iast') return sectionContent[index];
+        const sections = transliteratedSections[targetScheme] || (transliteratedSections[targetScheme] = {});
+        if (!sections[index]) {
+            sections[index] = transliterateHtml(sectionContent[index], targetScheme);
+        }
+        return sections[index];
+    }
+
+    function sectionFragment(index, targetScheme) {
+        const template = document.createElement('template');
+        template.innerHTML = sectionHtml(index, targetScheme);
+        return template.content;
+    }
+
+    function transliterate(targetScheme) {
+        if (targetScheme === 'iast') {
+            contentDiv.innerHTML = originalContent;
+        } else {
+            if (!transliteratedContent[targetScheme]) {
+                transliteratedContent[targetScheme] = transliterateHtml(originalContent, targetScheme);
+            }
+            contentDiv.innerHTML = transliteratedContent[targetScheme];
+        }
+        contentDiv.querySelectorAll('.lazy-section').forEach(placeholder => {
+            const index = placeholder.dataset.sectionIndex;
+            if (index in sectionContent) placeholder.replaceWith(sectionFragment(index, targetScheme));
+        });
         reapplyCorrections();
     }
 
+    // Lazy section loading: large texts arrive with their first section only,
+    // and the others are fetched as they scroll into view or are linked to.
+    const sectionsUrlMeta = document.querySelector('meta[name="lazy-sections-url"]');
+    if (sectionsUrlMeta) {
+        const sectionsUrl = sectionsUrlMeta.content;
+        const sectionRequests = {};
+
+        function insertSection(index, html) {
+            sectionContent[index] = html;
+            const placeholder = contentDiv.querySelector(`.lazy-section[data-section-index="${index}"]`);
+            if (placeholder) {
+                const section = sectionFragment(index, transliterationSchemeSelect.value);
+                reapplyCorrections(section);
+                placeholder.replaceWith(section);
+            }
+        }
+
+        function loadSection(index) {
+            if (!sectionRequests[index]) {
+                sectionRequests[index] = fetch(`${sectionsUrl}/${index}`)
+                    .then(response => {
+                        if (!response.ok) throw new Error(`Section ${index} failed to load`);
+                        return response.text();
+                    })
+                    .then(html => insertSection(index, html))
+                    .catch(error => {
+                        console.error(error);
+                        delete sectionRequests[index];
+                    });
+            }
+            return sectionRequests[index];
+        }
+
+        function loadAllSections() {
+            const placeholders = contentDiv.querySelectorAll('.lazy-section');
+            return Promise.all(Array.from(placeholders, p => loadSection(p.dataset.sectionIndex)));
+        }
+        window.loadAllSections = loadAllSections;
+
+        function loadSectionById(sectionId) {
+            const placeholder = Array.from(contentDiv.querySelectorAll('.lazy-section'))
+                .find(p => p.dataset.sectionId === sectionId);
+            return placeholder ? loadSection(placeholder.dataset.sectionIndex) : null;
+        }
+
+        function scrollToSection(sectionId) {
+            const pending = loadSectionById(sectionId);
+            if (!pending) return false;
+            pending.then(() => {
+                const target = document.getElementById(sectionId);
+                if (target) target.scrollIntoView();
+            });
+            return true;
+        }
+
+        // Placeholders are replaced wholesale when the content is re-rendered
+        // (e.g. on transliteration), so observe them afresh after each change.
+        const observer = new IntersectionObserver(entries => {
+            entries.forEach(entry => {
+                if (entry.isIntersecting) loadSection(entry.target.dataset.sectionIndex);
+            });
+        }, { rootMargin: '1000px 0px' });
+        const observePlaceholders = () => {
+            observer.disconnect();
+            contentDiv.querySelectorAll('.lazy-section').forEach(p => observer.observe(p));
+        };
+        new MutationObserver(observePlaceholders).observe(contentDiv, { childList: true });
+        observePlaceholders();
+
+        const tocList = document.getElementById('toc-list');
+        if (tocList) {
+            tocList.addEventListener('click', (e) => {
+                const link = e.target.closest('a');
+                if (!link || !link.hash) return;
+                const sectionId = decodeURIComponent(link.hash.slice(1));
+                if (!document.getElementById(sectionId) && scrollToSection(sectionId)) {
+                    e.preventDefault();
+                    history.replaceState(null, '', link.hash);
+                }
+            });
+        }
+
+        if (window.location.hash) {
+            const sectionId = decodeURIComponent(window.location.hash.slice(1));
+            if (!document.getElementById(sectionId)) scrollToSection(sectionId);
+        }
+    }
+
     transliterationSchemeSelect.addEventListener('change', (e) => {
         const selectedScheme = e.target.value;
         localStorage.setItem('selectedTransliterationScheme', selectedScheme);
@@ -1,29 +1,39 @@
-/* builds weight map for every character */
-const saWeight = (() => {
-  const order = [
-    "",
-    "a", "ā", "i", "ī", "u", "ū", "ṛ", "ṝ", "ḷ", "ḹ", "e", "ai", "o", "au",
-    "k", "kh", "g", "gh", "ṅ",
-    "c", "ch", "j", "jh", "ñ",
-    "ṭ", "ṭh", "ḍ", "ḍh", "ṇ",
-    "t", "th", "d", "dh", "n",
-    "p", "ph", "b", "bh", "m",
-    "y", "r", "l", "v",
-    "ś", "ṣ", "s", "h",
-    "ṃ", "ḥ",
-  ];
-  const w = {};
-  order.forEach((ch, i) => w[ch] = i + 1);   // 1-based weights
-  return w;
-})();
+/* Sanskrit collation keys, the same as collation.py on the server:
+   greedy longest-match letters, one byte (two hex digits) per letter. */
+const SA_ALPHABET = [
+  "a", "ā", "i", "ī", "u", "ū", "ṛ", "ṝ", "ḷ", "ḹ", "e", "ai", "o", "au",
+  "k", "kh", "g", "gh", "ṅ",
+  "c", "ch", "j", "jh", "ñ",
+  "ṭ", "ṭh", "ḍ", "ḍh", "ṇ",
+  "t", "th", "d", "dh", "n",
+  "p", "ph", "b", "bh", "m",
+  "y", "r", "l", "v",
+  "ś", "ṣ", "s",
+  "h",
+  "ṃ", "ḥ",
+];
+const SA_ALIASES = { "ṁ": "ṃ", "ï": "i", "ü": "u" };
+const SA_UNKNOWN = 0xfe;  // sorts after every letter
 
-/* turns full string into a big sortable key. */
+const saWeight = {};
+SA_ALPHABET.forEach((letter, i) => saWeight[letter] = i + 1);   // 1-based weights
+const SA_MAX_LETTER = Math.max(...SA_ALPHABET.map(letter => letter.length));
+
+/* turns a string into a hex key; comparing keys as strings gives Sanskrit order.
+   "kha" → "1001" (kh = 16, a = 1) */
 function saKey(str) {
-  return str
-    .toLowerCase()
-    .normalize('NFC')
-    .replace(/./g, ch => String(saWeight[ch] || 999).padStart(3, '0'));
-    // "āi"  →  "002011"  (for table above)
+  // code points, not UTF-16 units, as in Python
+  const chars = Array.from((str || '').normalize('NFC').toLowerCase());
+  let key = '';
+  for (let i = 0; i < chars.length;) {
+    let length = Math.min(SA_MAX_LETTER, chars.length - i);
+    while (length > 1 && !(chars.slice(i, i + length).join('') in saWeight)) length--;
+    // aliases apply to whole letters only, so "aï" stays two vowels
+    const letter = chars.slice(i, i + length).join('');
+    const weight = saWeight[SA_ALIASES[letter] || letter] || SA_UNKNOWN;
+    key += weight.toString(16).padStart(2, '0');
+    i += length;
+  }
+  return key;
 }
 window.saKey = saKey;
-
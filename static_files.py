@@ -0,0 +1,130 @@
+"""
+Delivery of corpus files under /static/data. Compressible files get gzip and
+brotli siblings ahead of time, stored by content hash so a changed file
+never picks up a stale variant. Requests are answered from the corpus
+manifest: strong ETags from its hashes (so revalidation is a 304), byte
+ranges on the unencoded file, and immutable caching for URLs tagged with the
+current data version (?v=...).
+
+Usage: python static_files.py [--workers N]
+"""
+import gzip
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from flask import Response, request, send_file
+
+from artifacts import FileLock, atomic_write
+from http_cache import ENCODINGS, brotli, negotiate_encoding, variant_etag
+from manifest import Manifest, ManifestEntry
+
+COMPRESSIBLE_SUFFIXES = {'.txt', '.xml', '.html', '.htm', '.md', '.json', '.csv', '.tsv'}
+MIN_COMPRESS_BYTES = 1024  # smaller files gain less than the headers cost
+PRECOMPRESS_GZIP_LEVEL = 9
+PRECOMPRESS_BROTLI_QUALITY = 11  # slow, but each file is only compressed once
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+
+
+def is_compressible(relative_path: str, size: int) -> bool:
+    return os.path.splitext(relative_path)[1].lower() in COMPRESSIBLE_SUFFIXES and size >= MIN_COMPRESS_BYTES
+
+
+def variant_path(root: Path, sha256: str, encoding: str) -> Path:
+    return Path(root) / sha256[:2] / f"{sha256}{SUFFIXES[encoding]}"
+
+
+def compress_file(source: Path, sha256: str, root: Path) -> int:
+    """
+    Writes whichever of the file's encoded variants are missing.
+    :return: number of variants written
+    """
+    data, written = None, 0
+    for encoding in ENCODINGS:
+        target = variant_path(root, sha256, encoding)
+        if target.is_file():
+            continue
+        if data is None:
+            data = Path(source).read_bytes()
+        if encoding == 'br':
+            body = brotli.compress(data, quality=PRECOMPRESS_BROTLI_QUALITY)
+        else:
+            body = gzip.compress(data, PRECOMPRESS_GZIP_LEVEL, mtime=0)
+        with atomic_write(target) as f:
+            f.write(body)
+        written += 1
+    return written
+
+
+def precompress_corpus(manifest: Manifest, root: Path, workers=None) -> int:
+    """
+    Compresses every compressible file in the manifest that has no variants
+    yet, and deletes variants of content no longer in it.
+    :return: number of variants written
+    """
+    root = Path(root)
+    with FileLock(root / 'locks' / 'precompress.lock'):
+        jobs = {
+            entry.sha256: manifest.data_path / relative_path
+            for relative_path, entry in manifest.entries.items()
+            if is_compressible(relative_path, entry.size)
+        }
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            written = sum(pool.map(compress_file, jobs.values(), jobs.keys(), [root] * len(jobs), chunksize=8))
+
+        removed = 0
+        for path in root.glob('??/*'):
+            if path.name.split('.')[0] not in jobs:
+                path.unlink(missing_ok=True)
+                removed += 1
+    logging.info(f"Precompressed {len(jobs)} data files: wrote {written} variants, removed {removed} stale ones")
+    return written
+
+
+def send_data_file(path: Path, entry: ManifestEntry, root: Path, immutable=False, as_attachment=False) -> Response:
+    """
+    Serves a data file in the best content coding the client accepts, falling
+    back to the file itself for byte ranges or if it has no smaller variant.
+    Conditional requests are checked against the ETag of the coding sent.
+    """
+    available = {}
+    if request.range is None:
+        for encoding in ENCODINGS:
+            try:
+                if variant_path(root, entry.sha256, encoding).stat().st_size < entry.size:
+                    available[encoding] = variant_path(root, entry.sha256, encoding)
+            except FileNotFoundError:
+                continue
+    encoding = negotiate_encoding(available)
+    max_age = IMMUTABLE_MAX_AGE if immutable else None
+
+    if encoding == 'identity':
+        response = send_file(path, as_attachment=as_attachment, etag=entry.sha256, max_age=max_age)
+    else:
+        response = send_file(
+            available[encoding], as_attachment=as_attachment, download_name=Path(path).name,
+            etag=variant_etag(entry.sha256, encoding), last_modified=entry.mtime_ns / 1e9, max_age=max_age,
+        )
+        response.headers['Content-Encoding'] = encoding
+        response.headers.pop('Accept-Ranges', None)  # ranges are only served unencoded
+    if available or is_compressible(Path(path).name, entry.size):
+        response.vary.add('Accept-Encoding')
+    if immutable:
+        response.cache_control.immutable = True
+    return response
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from config import DATA_PATH, MANIFEST_PATH, MANIFEST_FALLBACK_PATH, PRECOMPRESSED_PATH
+    from manifest import load_manifest
+
+    parser = argparse.ArgumentParser(description="Precompress the compressible data files.")
+    parser.add_argument('--workers', type=int, default=None, help="compression processes (default: CPU count)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    precompress_corpus(load_manifest(DATA_PATH, MANIFEST_PATH, MANIFEST_FALLBACK_PATH), PRECOMPRESSED_PATH, args.workers)
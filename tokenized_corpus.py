@@ -0,0 +1,154 @@
+"""
+Pre-tokenized export of the project edition texts, for the ``tokens`` bundle
+format. The whole corpus becomes one array of token ids, with offset arrays
+giving where each text and each section (from the rich HTML TOC) starts, so
+a loader can memory-map it and slice out any work without parsing text:
+
+    tokens = np.load('tokens.npy', mmap_mode='r')
+    text_offsets = np.load('text_offsets.npy')
+    vocab = open('vocab.txt', encoding='utf-8').read().split('\\n')
+    words = [vocab[i] for i in tokens[text_offsets[3]:text_offsets[4]]]
+
+Tokens are the words of the NFC-normalized IAST text plus the dandas | and ||;
+location and page markers are left out.
+
+Usage: python tokenized_corpus.py
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from artifacts import FileLock
+
+SECTION_MARKER = re.compile(r"^\{(.*)\}\s*$")
+TOKEN = re.compile(r"[^\W\d_]+|\|\|?")
+TOKEN_DTYPE = np.uint32
+
+EXPORT_FILES = ['README.txt', 'index.json', 'vocab.txt', 'token_counts.npy', 'tokens.npy', 'text_offsets.npy',
+                'section_offsets.npy']
+
+README = """HANSEL tokenized corpus, data version {data_version}
+
+vocab.txt            one token per line; a token's id is its line number (from 0), most frequent first
+token_counts.npy     uint64, occurrences of each token id in the corpus
+tokens.npy           {dtype}, the token ids of all texts, one after another
+text_offsets.npy     int64, texts[i] is tokens[text_offsets[i]:text_offsets[i + 1]]
+section_offsets.npy  int64, sections[j] is tokens[section_offsets[j]:section_offsets[j + 1]]
+index.json           the texts (filename base and range of sections) and sections (text, id and name), in order
+
+Tokens are the words of the NFC-normalized IAST text plus the dandas | and ||.
+Location and page markers are left out. Load the arrays with numpy.load(path, mmap_mode='r').
+"""
+
+
+def tokenize(line: str) -> List[str]:
+    return TOKEN.findall(unicodedata.normalize('NFC', line))
+
+
+def read_sections(file_path: Path) -> List[Tuple[str, List[str]]]:
+    """
+    Tokenizes a project edition text section by section, along its {section} marker lines.
+    :return: [(section name, tokens)], starting with an unnamed section for any text before the first marker
+    """
+    sections = []
+    with open(file_path, encoding='utf-8') as f:
+        for line in f:
+            if match := SECTION_MARKER.match(line):
+                sections.append((unicodedata.normalize('NFC', match.group(1)), []))
+                continue
+            tokens = tokenize(line)
+            if tokens:
+                if not sections:
+                    sections.append(('', []))
+                sections[-1][1].extend(tokens)
+    return sections
+
+
+def load_toc_names(json_path: Path) -> Dict[str, str]:
+    """
+    :return: section name -> TOC id for a text's rich HTML TOC (empty if it has none)
+    """
+    try:
+        with open(json_path, encoding='utf-8') as f:
+            toc = json.load(f).get('toc', [])
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return {unicodedata.normalize('NFC', str(item.get('name', ''))): str(item.get('id', '')) for item in toc}
+
+
+def build_token_export(export_dir: Path, txt_path: Path, rich_html_path: Path, data_version) -> int:
+    """
+    Tokenizes every .txt file under ``txt_path`` into a temporary directory and
+    renames it to ``export_dir`` once complete.
+    :return: number of tokens
+    """
+    counts = Counter()
+    texts, sections, text_tokens = [], [], []
+    for file_path in sorted(txt_path.glob('*.txt')):
+        toc_ids = load_toc_names(rich_html_path / f"{file_path.stem}.json")
+        text_sections = read_sections(file_path)
+        texts.append({'filename_base': file_path.stem, 'sections': [len(sections), len(sections) + len(text_sections)]})
+        for name, tokens in text_sections:
+            sections.append({'text': len(texts) - 1, 'id': toc_ids.get(name, name) if name else '', 'name': name})
+            counts.update(tokens)
+        text_tokens.append([tokens for _, tokens in text_sections])
+
+    vocab = sorted(counts, key=lambda token: (-counts[token], token))
+    token_ids = {token: i for i, token in enumerate(vocab)}
+    ids, text_offsets, section_offsets = [], [0], [0]
+    for section_tokens in text_tokens:
+        for tokens in section_tokens:
+            ids.extend(token_ids[token] for token in tokens)
+            section_offsets.append(len(ids))
+        text_offsets.append(len(ids))
+
+    export_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=export_dir.parent, prefix=f".{export_dir.name}."))
+    try:
+        (tmp_dir / 'README.txt').write_text(
+            README.format(data_version=data_version, dtype=np.dtype(TOKEN_DTYPE).name), encoding='utf-8'
+        )
+        with open(tmp_dir / 'index.json', 'w', encoding='utf-8') as f:
+            json.dump({'data_version': data_version, 'texts': texts, 'sections': sections}, f, ensure_ascii=False)
+        with open(tmp_dir / 'vocab.txt', 'w', encoding='utf-8', newline='\n') as f:
+            f.write('\n'.join(vocab))
+        np.save(tmp_dir / 'token_counts.npy', np.array([counts[token] for token in vocab], dtype=np.uint64))
+        np.save(tmp_dir / 'tokens.npy', np.array(ids, dtype=TOKEN_DTYPE))
+        np.save(tmp_dir / 'text_offsets.npy', np.array(text_offsets, dtype=np.int64))
+        np.save(tmp_dir / 'section_offsets.npy', np.array(section_offsets, dtype=np.int64))
+        os.rename(tmp_dir, export_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    logging.info(f"Tokenized {len(texts)} texts into {len(ids)} tokens ({len(vocab)} types) in {export_dir}")
+    return len(ids)
+
+
+def ensure_token_export(export_dir: Path, txt_path: Path, rich_html_path: Path, data_version):
+    """
+    Builds the export unless it exists; only one process builds at a time.
+    """
+    if export_dir.is_dir():
+        return
+    with FileLock(export_dir.parent / f".{export_dir.name}.lock"):
+        if not export_dir.is_dir():
+            build_token_export(export_dir, txt_path, rich_html_path, data_version)
+
+
+if __name__ == "__main__":
+    from config import FILE_TYPE_PATHS, TOKEN_EXPORT_PATH
+    from utils import find_data_version
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    data_version = find_data_version()
+    ensure_token_export(TOKEN_EXPORT_PATH / data_version, FILE_TYPE_PATHS['txt'], FILE_TYPE_PATHS['html_rich'],
+                        data_version)
@@ -0,0 +1,197 @@
+"""
+Converts corpus files from IAST into other transliteration schemes, one line at
+a time, for the transliterated download endpoint and bundles.
+"""
+import collections
+import hashlib
+import itertools
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from skrutable.transliteration import Transliterator
+
+from zip_stream import DeflatedMember, deflate_member
+
+CORPUS_SCHEME = 'IAST'
+
+# Scheme names accepted by the API, mapped to skrutable scheme names
+SCHEMES = {
+    'iast': 'IAST',
+    'hk': 'HK',
+    'slp1': 'SLP',
+    'devanagari': 'DEV',
+    'itrans': 'ITRANS',
+    'velthuis': 'VH',
+    'wx': 'WX',
+    'bengali': 'BENGALI',
+    'gujarati': 'GUJARATI',
+}
+SCHEME_ALIASES = {'slp': 'slp1', 'dev': 'devanagari', 'harvard-kyoto': 'hk'}
+
+# File types whose text can be converted; other bundle members are copied as is
+CONVERTIBLE_TYPES = {'txt': '.txt', 'html_plain': '.html'}
+
+# Left in the original: location references like [1.2cd] and (p.1, l.2), entities,
+# and in HTML the tags and the <title> (the file's ASCII name)
+_PROTECTED = r"\[[^\]\n]*\]|\(?p\.\s*\d+(?:,\s*l\.\s*\d+)?\)?|&#?\w+;"
+_TXT_PARTS = re.compile(f"({_PROTECTED})")
+_HTML_PARTS = re.compile(f"(<title>[^<]*</title>|<[^>]*>|<[^>]*$|{_PROTECTED})")
+
+_transliterators = {}
+
+_pool = None  # see get_conversion_pool
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_transliterator(from_scheme, to_scheme) -> Transliterator:
+    key = (from_scheme, to_scheme)
+    if key not in _transliterators:
+        _transliterators[key] = Transliterator(from_scheme=from_scheme, to_scheme=to_scheme)
+    return _transliterators[key]
+
+
+def canonical_scheme(name) -> Optional[str]:
+    """
+    :return: the API name for a scheme or one of its aliases (case-insensitive), or None if unknown
+    """
+    name = (name or '').strip().lower()
+    name = SCHEME_ALIASES.get(name, name)
+    return name if name in SCHEMES else None
+
+
+def conversion_key(content_hash, scheme, data_version) -> str:
+    """
+    :param content_hash: the source file's sha256 from the corpus manifest
+    """
+    return hashlib.sha256(f"{data_version}\0{scheme}\0{content_hash}".encode('utf-8')).hexdigest()
+
+
+def iter_converted_lines(path: Path, file_type, scheme) -> Iterator[bytes]:
+    """
+    Reads an IAST ``txt`` or ``html_plain`` file line by line and yields each line
+    converted to ``scheme``. In HTML only text between tags is converted; tags
+    may span lines.
+    """
+    to_scheme = SCHEMES[scheme]
+    transliterator = get_transliterator(CORPUS_SCHEME, to_scheme)
+    convert = lambda text: transliterator.transliterate(text) if text.strip() else text
+    pattern = _HTML_PARTS if file_type == 'html_plain' else _TXT_PARTS
+    in_tag = False
+
+    with open(path, encoding='utf-8', newline='') as f:
+        for line in f:
+            out = []
+            if in_tag:  # the rest of a tag opened on an earlier line
+                end = line.find('>')
+                if end == -1:
+                    yield line.encode('utf-8')
+                    continue
+                out.append(line[:end + 1])
+                line = line[end + 1:]
+                in_tag = False
+            for i, part in enumerate(pattern.split(line)):
+                out.append(part if i % 2 else convert(part))
+                if i % 2 and part.startswith('<') and not part.endswith('>'):
+                    in_tag = True
+            yield ''.join(out).encode('utf-8')
+
+
+def convert_and_deflate_member(path: Path, file_type, scheme, deflated_path: Path) -> DeflatedMember:
+    """
+    Converts a file and deflates the result for a zip archive in one pass.
+    Picklable, for process pools.
+    """
+    return deflate_member(iter_converted_lines(Path(path), file_type, scheme), deflated_path, Path(path).stat().st_mtime)
+
+
+def converted_filename(filename: str, scheme) -> str:
+    """
+    E.g. 'bANa_kAdambarI.txt' -> 'bANa_kAdambarI.devanagari.txt'
+    """
+    stem, dot, suffix = filename.rpartition('.')
+    return f"{stem}.{scheme}.{suffix}" if dot else f"{filename}.{scheme}"
+
+
+def convertible_type(path: Path, file_type_paths: Dict[str, Path]) -> Optional[str]:
+    """
+    :return: the file type of a convertible data file, or None
+    """
+    for file_type, suffix in CONVERTIBLE_TYPES.items():
+        if path.suffix == suffix and file_type_paths[file_type] in path.parents:
+            return file_type
+    return None
+
+
+def get_conversion_pool(workers=None) -> ProcessPoolExecutor:
+    """
+    Process pool shared by all requests of this process, created on first use.
+    Its processes come from a forkserver rather than a fork of this (threaded)
+    server process.
+    :param workers: processes in the pool (default: CPU count), fixed by the first call
+    """
+    global _pool, _pool_pid
+    # A forked worker can't use its parent's pool, so each worker makes its own
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload([__name__])
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _discard_conversion_pool(pool: ProcessPoolExecutor):
+    global _pool_pid
+    with _pool_lock:
+        if pool is _pool:
+            _pool_pid = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_converted_members(members: List[Tuple[str, Path]], scheme, file_type_paths: Dict[str, Path],
+                           workers=None) -> Iterator[Tuple[str, object]]:
+    """
+    Yields bundle members in order with every convertible text replaced by a
+    DeflatedMember of its conversion to ``scheme``. Files are converted and
+    deflated in the shared conversion pool, a few ahead of the member being
+    streamed; conversions not started yet are cancelled and the temporary
+    files removed when the generator closes.
+    :param workers: conversion processes (default: CPU count); 1 converts lazily in this process instead
+    """
+    conversions = [(path, convertible_type(path, file_type_paths)) for _, path in members]
+    with tempfile.TemporaryDirectory(prefix='hansel-translit-') as tmp_dir:
+        to_convert = iter([
+            (path, file_type, scheme, os.path.join(tmp_dir, f"{i}.deflate"))
+            for i, (path, file_type) in enumerate(conversion for conversion in conversions if conversion[1])
+        ])
+        if workers == 1:
+            for (arcname, path), (_, file_type) in zip(members, conversions):
+                yield arcname, convert_and_deflate_member(*next(to_convert)) if file_type else path
+            return
+
+        pool = get_conversion_pool(workers)
+        pending = collections.deque()
+        lookahead = 2 * (workers or os.cpu_count() or 1)  # bounds this request's share of the pool and disk use
+        try:
+            for (arcname, path), (_, file_type) in zip(members, conversions):
+                if not file_type:
+                    yield arcname, path
+                    continue
+                for args in itertools.islice(to_convert, lookahead - len(pending)):
+                    pending.append(pool.submit(convert_and_deflate_member, *args))
+                yield arcname, pending.popleft().result()
+        except BrokenProcessPool:
+            _discard_conversion_pool(pool)  # a conversion process died; the next request gets a new pool
+            raise
+        finally:
+            for future in pending:
+                future.cancel()  # don't finish converting for a client that went away
+            wait(pending)  # the ones already running, before their directory is removed
@@ -1,17 +1,13 @@
 import collections
 import json
 import logging
-import os
-import time
 from pathlib import Path
 from typing import Dict, List
 import unicodedata
 from urllib.parse import urlencode
 
-import requests
-from skrutable.transliteration import Transliterator
-
-T = Transliterator(from_scheme='IAST', to_scheme='HK')
+from collation import collation_key
+from config import DATA_PATH
 
 
 def find_app_version():
@@ -21,66 +17,20 @@ def find_app_version():
         return file.readline().strip().split('=')[1].strip().replace("'", "").replace('"', '')
 
 
-def find_data_version():
-    data_version_filepath = './static/data/VERSION'
+def find_data_version(data_version_filepath=DATA_PATH / 'VERSION'):
     with open(data_version_filepath, 'r', encoding='utf8') as file:
         for line in file:
             if line.startswith('__data_version__'):
                 return line.split('=')[1].strip().replace("'", "").replace('"', '')
 
 
-def find_bundle_version():
-    data_version_filepath = './static/data/VERSION'
+def find_bundle_version(data_version_filepath=DATA_PATH / 'VERSION'):
     with open(data_version_filepath, 'r', encoding='utf8') as file:
         for line in file:
             if line.startswith('__bundle_version__'):
                 return line.split('=')[1].strip().replace("'", "").replace('"', '')
 
 
-# JSON log file for downloads
-DOWNLOAD_LOG_FILE = "downloads.json"
-if not os.path.exists(DOWNLOAD_LOG_FILE):
-    with open(DOWNLOAD_LOG_FILE, 'w') as f:
-        json.dump([], f)
-
-
-def get_geolocation(ip_address):
-    try:
-        response = requests.get(f"https://ipinfo.io/{ip_address}/json")
-        if response.status_code == 200:
-            data = response.json()
-            country = data.get("country", "Unknown")
-            region = data.get("region", "Unknown")
-            city = data.get("city", "Unknown")
-        else:
-            country, region, city = "Unknown", "Unknown", "Unknown"
-    except Exception as e:
-        logging.error(f"Geolocation error for IP {ip_address}: {e}")
-        country, region, city = "Unknown", "Unknown", "Unknown"
-    return country, region, city
-
-
-def log_download(filename, ip, country, region, city, file_size, processing_time):
-    log_entry = {
-        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-        "filename": filename,
-        "ip_address": ip,
-        "country": country,
-        "region": region,
-        "city": city,
-        "file_size": file_size,
-        "processing_time": processing_time
-    }
-    try:
-        with open(DOWNLOAD_LOG_FILE, 'r+') as f:
-            data = json.load(f)
-            data.append(log_entry)
-            f.seek(0)
-            json.dump(data, f, indent=4)
-    except Exception as e:
-        logging.error(f"Error logging download: {e}")
-
-
 def load_metadata(metadata_path=Path("static/data/metadata")) -> Dict:
     metadata_file = metadata_path / 'metadata.json'
     with open(metadata_file, encoding="utf-8") as f:
@@ -166,43 +116,18 @@ def process_metadata(raw_metadata: Dict[str, Dict]) -> List[Dict]:
             'Size (kb)': record['File Size (KB)'],
             'Genre': ', '.join(record['Genres']),
         })
-    sorted_metadata_subset = sorted(metadata_subset, key=lambda x: custom_sort_key(x['Title']))
+    sorted_metadata_subset = sorted(metadata_subset, key=lambda x: collation_key(x['Title']))
     return sorted_metadata_subset
 
 
-sanskrit_alphabet = [
-    'a', 'ā', 'i', 'ī', 'u', 'ū', 'ṛ', 'ṝ', 'ḷ', 'ḹ', 'e', 'ai', 'o', 'au',
-    'k', 'kh', 'g', 'gh', 'ṅ',
-    'c', 'ch', 'j', 'jh', 'ñ',
-    'ṭ', 'ṭh', 'ḍ', 'ḍh', 'ṇ',
-    't', 'th', 'd', 'dh', 'n',
-    'p', 'ph', 'b', 'bh', 'm',
-    'y', 'r', 'l', 'v',
-    'ś', 'ṣ', 's',
-    'h',
-    'ṃ', 'ḥ'
-]
-
-
-# Create a mapping of each symbol to its position
-custom_order = {char: idx for idx, char in enumerate(sanskrit_alphabet)}
-
-
-# Custom sort function
-def custom_sort_key(word):
-    word = word.lower()  # Normalize case to lowercase
-    return [custom_order.get(word[i:i+2], custom_order.get(word[i], len(sanskrit_alphabet)))
-            for i in range(len(word))]
-
-
 def get_normalized_filename(filename, form='NFD'):
     return unicodedata.normalize(form, filename)
 
 
 
-def calculate_all_sizes(file_type_paths: Dict[str, Path], data_path: Path):
+def calculate_all_sizes(file_type_paths: Dict[str, Path], data_path: Path, manifest):
     """
-    Calculates all file group sizes and the total collection size.
+    Calculates all file group sizes and the total collection size from the corpus manifest.
     """
     logging.info("Calculating all file and group sizes...")
 
@@ -220,34 +145,23 @@ def calculate_all_sizes(file_type_paths: Dict[str, Path], data_path: Path):
     
     # Calculate individual group sizes
     for key, path in file_type_paths.items():
-        total_group_bytes = 0
-        if path.exists():
-            if path.is_file():
-                total_group_bytes = path.stat().st_size
-            elif path.is_dir():
-                total_group_bytes = sum(p.stat().st_size for p in path.rglob('*') if p.is_file() and p.suffix != '.zip')
-        file_group_sizes_mb[key] = get_rounded_mb_size(total_group_bytes)
+        file_group_sizes_mb[key] = get_rounded_mb_size(manifest.total_size(path, exclude_suffixes={'.zip'}))
     logging.info(f"File group sizes (MB): {file_group_sizes_mb}")
 
     # Calculate total size from 'texts' and 'metadata' folders
     texts_path = data_path / 'texts'
     metadata_path = data_path / 'metadata'
-    
-    total_corpus_bytes = 0
     rich_html_path = texts_path / 'transforms' / 'html' / 'rich'
-    if texts_path.is_dir():
-        total_corpus_bytes += sum(p.stat().st_size for p in texts_path.rglob('*') if p.is_file() and p.suffix != '.zip' and not str(p).startswith(str(rich_html_path)))
-    if metadata_path.is_dir():
-        total_corpus_bytes += sum(p.stat().st_size for p in metadata_path.rglob('*') if p.is_file() and p.suffix != '.zip')
+    total_corpus_bytes = (
+        manifest.total_size(texts_path, exclude_suffixes={'.zip'}, exclude=rich_html_path)
+        + manifest.total_size(metadata_path, exclude_suffixes={'.zip'})
+    )
 
     total_corpus_size_mb = get_rounded_mb_size(total_corpus_bytes)
     logging.info(f"Total size calculated: {total_corpus_size_mb} MB")
 
     # Calculate plain text size
-    plain_text_path = file_type_paths['txt']
-    plain_text_bytes = 0
-    if plain_text_path.is_dir():
-        plain_text_bytes = sum(p.stat().st_size for p in plain_text_path.rglob('*') if p.is_file() and p.suffix != '.zip')
+    plain_text_bytes = manifest.total_size(file_type_paths['txt'], exclude_suffixes={'.zip'})
     plain_text_size_mb = get_rounded_mb_size(plain_text_bytes)
     logging.info(f"Plain text size calculated: {plain_text_size_mb} MB")
 
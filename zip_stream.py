@@ -0,0 +1,191 @@
+import struct
+import time
+import zlib
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple, Tuple, Union
+
+CHUNK_SIZE = 64 * 1024
+
+ZIP32_LIMIT = 0xFFFFFFFF
+ZIP16_LIMIT = 0xFFFF
+
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+_END_RECORD = struct.Struct('<IHHHHIIH')
+_ZIP64_END_RECORD = struct.Struct('<IQHHIIQQQQ')
+_ZIP64_END_LOCATOR = struct.Struct('<IIQI')
+
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+_METHOD_DEFLATED = 8
+_VERSION_DEFAULT = 20
+_VERSION_ZIP64 = 45
+_VERSION_MADE_BY = (3 << 8) | _VERSION_ZIP64  # unix
+_EXTERNAL_ATTR = 0o100644 << 16
+
+
+class DeflatedMember(NamedTuple):
+    """A member deflated ahead of time (e.g. in a worker process) into a raw deflate file."""
+    deflated_path: Path
+    crc: int
+    size: int
+    compressed_size: int
+    mtime: float
+
+
+MemberSource = Union[Path, bytes, DeflatedMember, Iterable[bytes]]
+
+
+def deflate_member(source, deflated_path: Path, mtime=None) -> DeflatedMember:
+    """
+    Compress a whole member (a path, bytes, or iterable of byte chunks) into a raw
+    deflate file. Picklable, so it can run in a process pool.
+    """
+    if isinstance(source, (str, Path)):
+        path = Path(source)
+        mtime = path.stat().st_mtime if mtime is None else mtime
+        chunks = _read_chunks(path)
+    else:
+        chunks = [source] if isinstance(source, bytes) else source
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    crc, size, compressed_size = 0, 0, 0
+    with open(deflated_path, 'wb') as f:
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            compressed_size += f.write(compressor.compress(chunk))
+        compressed_size += f.write(compressor.flush())
+    return DeflatedMember(Path(deflated_path), crc, size, compressed_size, time.time() if mtime is None else mtime)
+
+
+def stream_zip(members: Iterable[Tuple[str, MemberSource]], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Yield a deflated zip archive piece by piece.
+
+    Each member is an (arcname, source) pair where source is a file Path, a bytes
+    object, a DeflatedMember, or an iterable of byte chunks. Local headers are
+    written before the data is known, so CRC and sizes follow each member in a
+    data descriptor; the central directory is emitted at the end. Only one
+    chunk of input plus the deflate window is held in memory at a time.
+    """
+    offset = 0
+    entries = []
+
+    for arcname, source in members:
+        name = arcname.replace('\\', '/').encode('utf-8')
+        header_offset = offset
+
+        if isinstance(source, DeflatedMember):
+            dos_time, dos_date = _dos_datetime(source.mtime)
+            zip64 = source.size > ZIP32_LIMIT or source.compressed_size > ZIP32_LIMIT
+            header = _local_header(name, 0, dos_time, dos_date, source.crc, source.compressed_size, source.size, zip64)
+            yield header
+            yield from _read_chunks(source.deflated_path, chunk_size)
+            offset += len(header) + source.compressed_size
+            entries.append((name, 0, dos_time, dos_date, source.crc, source.compressed_size, source.size, header_offset))
+            continue
+
+        if isinstance(source, Path):
+            stat = source.stat()
+            dos_time, dos_date = _dos_datetime(stat.st_mtime)
+            zip64 = stat.st_size > ZIP32_LIMIT - (ZIP32_LIMIT >> 8)  # leave room for deflate overhead
+            chunks = _read_chunks(source, chunk_size)
+        else:
+            dos_time, dos_date = _dos_datetime(time.time())
+            zip64 = False
+            chunks = [source] if isinstance(source, bytes) else source
+
+        flags = _FLAG_DATA_DESCRIPTOR
+        header = _local_header(name, flags, dos_time, dos_date, 0, 0, 0, zip64)
+        yield header
+        offset += len(header)
+
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        crc, size, compressed_size = 0, 0, 0
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            data = compressor.compress(chunk)
+            if data:
+                compressed_size += len(data)
+                yield data
+        data = compressor.flush()
+        compressed_size += len(data)
+        yield data
+
+        if not zip64 and (size > ZIP32_LIMIT or compressed_size > ZIP32_LIMIT):
+            raise RuntimeError(f"Member {arcname} exceeded 4 GiB without zip64 headers")
+        if zip64:
+            descriptor = struct.pack('<IIQQ', 0x08074b50, crc, compressed_size, size)
+        else:
+            descriptor = struct.pack('<IIII', 0x08074b50, crc, compressed_size, size)
+        yield descriptor
+        offset += compressed_size + len(descriptor)
+        entries.append((name, flags, dos_time, dos_date, crc, compressed_size, size, header_offset))
+
+    yield _central_directory(entries, offset)
+
+
+def _read_chunks(path: Path, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _dos_datetime(timestamp):
+    t = time.localtime(timestamp)
+    year = max(t.tm_year, 1980)
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def _local_header(name, flags, dos_time, dos_date, crc, compressed_size, size, zip64):
+    flags |= _FLAG_UTF8
+    if zip64:
+        extra = struct.pack('<HHQQ', 0x0001, 16, size, compressed_size)
+        return _LOCAL_HEADER.pack(
+            0x04034b50, _VERSION_ZIP64, flags, _METHOD_DEFLATED, dos_time, dos_date,
+            crc, ZIP32_LIMIT, ZIP32_LIMIT, len(name), len(extra)
+        ) + name + extra
+    return _LOCAL_HEADER.pack(
+        0x04034b50, _VERSION_DEFAULT, flags, _METHOD_DEFLATED, dos_time, dos_date,
+        crc, compressed_size, size, len(name), 0
+    ) + name
+
+
+def _central_directory(entries, cd_offset):
+    records = []
+    for name, flags, dos_time, dos_date, crc, compressed_size, size, header_offset in entries:
+        extra_fields = []
+        if size > ZIP32_LIMIT or compressed_size > ZIP32_LIMIT or header_offset > ZIP32_LIMIT:
+            # Zip64 readers expect all three values once any of them overflows.
+            extra_fields = [size, compressed_size, header_offset]
+            size = compressed_size = header_offset = ZIP32_LIMIT
+        extra = struct.pack(f'<HH{len(extra_fields)}Q', 0x0001, 8 * len(extra_fields), *extra_fields) if extra_fields else b''
+        version = _VERSION_ZIP64 if extra_fields else _VERSION_DEFAULT
+        records.append(_CENTRAL_HEADER.pack(
+            0x02014b50, _VERSION_MADE_BY, version, flags | _FLAG_UTF8, _METHOD_DEFLATED,
+            dos_time, dos_date, crc, compressed_size, size, len(name), len(extra), 0, 0, 0,
+            _EXTERNAL_ATTR, header_offset
+        ) + name + extra)
+
+    central_directory = b''.join(records)
+    cd_size = len(central_directory)
+    count = len(entries)
+    tail = b''
+    if count > ZIP16_LIMIT or cd_size > ZIP32_LIMIT or cd_offset > ZIP32_LIMIT:
+        zip64_end_offset = cd_offset + cd_size
+        tail += _ZIP64_END_RECORD.pack(
+            0x06064b50, _ZIP64_END_RECORD.size - 12, _VERSION_MADE_BY, _VERSION_ZIP64,
+            0, 0, count, count, cd_size, cd_offset
+        )
+        tail += _ZIP64_END_LOCATOR.pack(0x07064b50, 0, zip64_end_offset, 1)
+    tail += _END_RECORD.pack(
+        0x06054b50, 0, 0, min(count, ZIP16_LIMIT), min(count, ZIP16_LIMIT),
+        min(cd_size, ZIP32_LIMIT), min(cd_offset, ZIP32_LIMIT), 0
+    )
+    return central_directory + tail